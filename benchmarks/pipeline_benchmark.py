@@ -0,0 +1,332 @@
+#!/usr/bin/python
+"""
+This script benchmarks every stage of the pipeline, from reading a sensor register to drawing the plot, without a
+raspberry pi: the sensors are simulated (raspberry/python/sim_bus.py) and the frames go over loopback UDP.
+
+Stages, every iteration handles one frame of all sensors:
+ - vl6180x_get_register_smbus/rdwr: VL6180X.get_register of RESULT_RANGE_VAL for every sensor
+ - vl6180x_get_registers_rdwr: the burst read of the result registers that poll_range does, for every sensor
+ - vl53l0x_callbacks_smbus/rdwr: the i2c callbacks of one VL53L0X measurement (select the multiplexer channel, read the
+   interrupt status, read the result, clear the interrupt) for every sensor, called through the ctypes function pointers
+ - encode_binary/ascii: skin_frame.FrameEncoder.encode, like the stream scripts
+ - encode_delta / decode_delta: the delta encoding, with a few sensors that change every frame
+ - udp: send a frame over loopback UDP and receive it
+ - decode: skin_frame.decode
+ - filter / filter_scalar: FilterBank.filter_values, and a Filter per sensor for comparison
+ - render: the blit of read_multi_udp_blit.py with the Agg backend (no window)
+ - render_heatmap: the image of read_multi_udp_heatmap.py with the Agg backend, one image for all sensors
+ - end_to_end: all of the above after each other, with the rdwr bus
+
+The simulated bus has no latency here, so the I2C stages measure the python and ctypes overhead only.
+For every stage and number of sensors the mean and the 50th, 90th and 99th percentile of the time per frame are
+reported, with the frames per second and samples (sensor values) per second that follow from the mean.
+The results are saved as JSON. Compare two runs with --compare.
+
+Usage:
+    python pipeline_benchmark.py [--sensors 1,8,64] [--iterations 500] [--output results.json] [--compare old.json]
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import socket
+import sys
+import time
+from ctypes import POINTER, c_ubyte, cast
+
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+for folder in (("raspberry", "python"), ("raspberry", "python", "VL6180X"), ("raspberry", "python", "VL53L0X"),
+               ("pc",)):
+    sys.path.append(os.path.join(ROOT, *folder))
+import sim_bus
+import skin_frame
+import VL53L0X
+import VL6180X
+from ring_buffer import RingBuffer
+from skin_filter import Filter, FilterBank
+from skin_geometry import grid_geometry
+
+SENSOR_COUNTS = [1, 2, 4, 8, 16, 32, 64]
+ITERATIONS = 500
+RENDER_ITERATIONS = 50  # Drawing is a lot slower than the other stages
+HISTORY = 100  # The number of measurements in the plot, the same as read_multi_udp_blit.py
+RESULT_REGISTER = 0x004D  # RESULT_RANGE_STATUS, the start of the burst read of poll_range
+RESULT_LENGTH = 0x0062 - 0x004D + 1
+RANGE_VAL_REGISTER = 0x0062
+
+# time.perf_counter doesn't exist in python 2
+clock = getattr(time, "perf_counter", time.time)
+
+
+def measure(function, iterations):
+    """
+    Calls function iterations times (after one warm up call).
+    :return: The time of every call in seconds, as a numpy array
+    """
+    function()
+    times = np.empty(iterations)
+    for index in range(iterations):
+        start = clock()
+        function()
+        times[index] = clock() - start
+    return times
+
+
+def summarize(stage, sensors, times):
+    mean = float(np.mean(times))
+    p50, p90, p99 = np.percentile(times, [50, 90, 99])
+    return {
+        "stage": stage,
+        "sensors": sensors,
+        "iterations": len(times),
+        "mean_us": mean * 1e6,
+        "p50_us": float(p50) * 1e6,
+        "p90_us": float(p90) * 1e6,
+        "p99_us": float(p99) * 1e6,
+        "max_us": float(np.max(times)) * 1e6,
+        "frames_per_s": 1.0 / mean if mean > 0 else 0.0,
+        "samples_per_s": sensors / mean if mean > 0 else 0.0,
+    }
+
+
+def make_vl6180x_sensors(count, combined, first_bus):
+    """Simulated VL6180X sensors, 8 per multiplexer on one bus."""
+    muxes = (count + 7) // 8
+    buses = sim_bus.make_skin([first_bus], muxes, 8, combined=combined)
+    VL6180X.set_i2c_bus(first_bus, buses[first_bus])
+    sensors = []
+    for index in range(count):
+        sensors.append(VL6180X.VL6180X(0x29, tc_address=0x70 + index // 8, tc_dev=index % 8, tc_enabled=True,
+                                       bus=first_bus))
+    return sensors
+
+
+def make_vl53l0x_frame(count, combined):
+    """
+    Puts a simulated bus with VL53L0X sensors behind the callbacks.
+    :return: Function that does the callbacks of one measurement of every sensor
+    """
+    buses = sim_bus.make_skin([1], (count + 7) // 8, 8, sensor_type="VL53L0X", combined=combined)
+    VL53L0X.set_i2c_bus(1, buses[1])
+    VL53L0X.use_bus(1)
+    buf = (c_ubyte * 256)()
+    data_p = cast(buf, POINTER(c_ubyte))
+    read, write = VL53L0X.read_func, VL53L0X.write_func
+    channels = [(0x70 + index // 8, 1 << (index % 8)) for index in range(count)]
+
+    def frame():
+        for mux, control in channels:
+            write(mux, control, data_p, 0)
+            read(0x29, sim_bus.SimVL53L0X.RESULT_INTERRUPT_STATUS, data_p, 1)
+            read(0x29, sim_bus.SimVL53L0X.RESULT_RANGE_STATUS, data_p, 12)
+            buf[0] = 0x01
+            write(0x29, sim_bus.SimVL53L0X.SYSTEM_INTERRUPT_CLEAR, data_p, 1)
+    return frame
+
+
+class BlitPlot(object):
+    """The plot of read_multi_udp_blit.py: the raw and filtered value of every sensor, drawn with blitting."""
+
+    def __init__(self, count):
+        self.fig, self.ax = plt.subplots()
+        self.history = RingBuffer(HISTORY, count * 2)
+        self.lines = [self.ax.plot([], [], animated=True)[0] for _ in range(count * 2)]
+        self.ax.set_xlim(-HISTORY + 1, 0)
+        self.ax.set_ylim(20, 100)
+        self.fig.canvas.draw()
+        self.background = self.fig.canvas.copy_from_bbox(self.ax.bbox)
+
+    def draw(self, sample):
+        self.history.append(sample)
+        ydata = self.history.view()
+        xdata = self.history.x()
+        for index, line in enumerate(self.lines):
+            line.set_data(xdata, ydata[index])
+        self.fig.canvas.restore_region(self.background)
+        for line in self.lines:
+            self.ax.draw_artist(line)
+        self.fig.canvas.blit(self.ax.bbox)
+
+    def close(self):
+        plt.close(self.fig)
+
+
+class HeatmapPlot(object):
+    """The image of read_multi_udp_heatmap.py, drawn with blitting."""
+
+    def __init__(self, count):
+        self.fig, self.ax = plt.subplots()
+        self.geometry = grid_geometry(count, 8)
+        self.cells = np.full((self.geometry.rows, self.geometry.columns), np.nan)
+        # The image fills the axes for every sensor count, that is the largest area to draw
+        self.image = self.ax.imshow(self.cells, vmin=0, vmax=255, interpolation="nearest", aspect="auto",
+                                    animated=True)
+        self.fig.canvas.draw()
+        self.background = self.fig.canvas.copy_from_bbox(self.ax.bbox)
+
+    def draw(self, values):
+        self.image.set_data(self.geometry.to_image(values, out=self.cells))
+        self.fig.canvas.restore_region(self.background)
+        self.ax.draw_artist(self.image)
+        self.fig.canvas.blit(self.ax.bbox)
+
+    def close(self):
+        plt.close(self.fig)
+
+
+def udp_pair():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender.connect(receiver.getsockname())
+    return sender, receiver
+
+
+def run_stages(count, iterations, first_bus):
+    """Runs all stages for count sensors, returns a list of result dicts."""
+    results = []
+    distances = [int(value) for value in np.random.RandomState(count).randint(20, 100, count)]
+    valid = np.ones(count, dtype=bool)
+
+    def run(stage, function, stage_iterations=iterations):
+        results.append(summarize(stage, count, measure(function, stage_iterations)))
+
+    for combined, name in ((False, "smbus"), (True, "rdwr")):
+        sensors = make_vl6180x_sensors(count, combined, first_bus)
+        first_bus += 1
+        run("vl6180x_get_register_" + name, lambda: [sensor.get_register(RANGE_VAL_REGISTER) for sensor in sensors])
+        if combined:
+            run("vl6180x_get_registers_rdwr",
+                lambda: [sensor.get_registers(RESULT_REGISTER, RESULT_LENGTH) for sensor in sensors])
+        run("vl53l0x_callbacks_" + name, make_vl53l0x_frame(count, combined))
+
+    binary = skin_frame.FrameEncoder()
+    ascii_encoder = skin_frame.FrameEncoder(frame_format=skin_frame.FORMAT_ASCII)
+    run("encode_binary", lambda: binary.encode(distances))
+    run("encode_ascii", lambda: ascii_encoder.encode(distances))
+
+    sender, receiver = udp_pair()
+    packet = binary.encode(distances)
+
+    def udp():
+        sender.send(packet)
+        receiver.recv(skin_frame.MAX_DATAGRAM)
+    run("udp", udp)
+    run("decode", lambda: skin_frame.decode(packet))
+
+    # A quarter of the sensors (at least one) changes every frame, the rest reads the same
+    changing = list(range(0, count, 4))
+    delta_distances = list(distances)
+
+    def make_delta_encoder():
+        encoder = skin_frame.FrameEncoder(delta=True)
+
+        def encode():
+            for sensor in changing:
+                delta_distances[sensor] = 20 + (delta_distances[sensor] + 1) % 80
+            return encoder.encode(delta_distances)
+        return encode
+    run("encode_delta", make_delta_encoder())
+    # The decoder gets the frames in order, starting with a keyframe
+    encode_delta = make_delta_encoder()
+    delta_packets = iter([encode_delta() for _ in range(iterations + 1)])
+    delta_decoder = skin_frame.FrameDecoder()
+    run("decode_delta", lambda: delta_decoder.decode_all(next(delta_packets)))
+
+    bank = FilterBank(count)
+    filters = [Filter() for _ in range(count)]
+    run("filter", lambda: bank.filter_values(distances, valid))
+    run("filter_scalar", lambda: [fil.filter_value(distance) for fil, distance in zip(filters, distances)])
+
+    plot = BlitPlot(count)
+    sample = np.zeros(count * 2)
+    sample[:count] = distances
+    run("render", lambda: plot.draw(sample), RENDER_ITERATIONS)
+    heatmap = HeatmapPlot(count)
+    run("render_heatmap", lambda: heatmap.draw(sample[:count]), RENDER_ITERATIONS)
+    heatmap.close()
+
+    sensors = make_vl6180x_sensors(count, True, first_bus)
+    first_bus += 1
+
+    def end_to_end():
+        read = [sensor.get_registers(RESULT_REGISTER, RESULT_LENGTH)[-1] for sensor in sensors]
+        sender.send(binary.encode(read))
+        frame = skin_frame.decode(receiver.recv(skin_frame.MAX_DATAGRAM))
+        sample[:count] = frame.distances
+        sample[count:] = bank.filter_values(frame.distances, frame.valid)
+        plot.draw(sample)
+    run("end_to_end", end_to_end, RENDER_ITERATIONS)
+    plot.close()
+    sender.close()
+    receiver.close()
+    return results, first_bus
+
+
+def print_results(results):
+    print("%-28s %7s %10s %10s %10s %10s %12s %14s" % (
+        "stage", "sensors", "mean [us]", "p50 [us]", "p90 [us]", "p99 [us]", "frames/s", "samples/s"))
+    for result in sorted(results, key=lambda result: (result["stage"], result["sensors"])):
+        print("%-28s %7d %10.1f %10.1f %10.1f %10.1f %12.0f %14.0f" % (
+            result["stage"], result["sensors"], result["mean_us"], result["p50_us"], result["p90_us"],
+            result["p99_us"], result["frames_per_s"], result["samples_per_s"]))
+
+
+def compare(results, old_file):
+    """Prints the p50 of every stage of an older run next to this run."""
+    with open(old_file) as old:
+        old_results = dict(((result["stage"], result["sensors"]), result) for result in json.load(old)["results"])
+    print("\nCompared with %s (p50, lower is better):" % old_file)
+    print("%-28s %7s %12s %12s %8s" % ("stage", "sensors", "old [us]", "new [us]", "new/old"))
+    for result in sorted(results, key=lambda result: (result["stage"], result["sensors"])):
+        old_result = old_results.get((result["stage"], result["sensors"]))
+        if old_result is None:
+            continue
+        print("%-28s %7d %12.1f %12.1f %8.2f" % (result["stage"], result["sensors"], old_result["p50_us"],
+                                                  result["p50_us"], result["p50_us"] / old_result["p50_us"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every stage of the soft skin pipeline.")
+    parser.add_argument("--sensors", default=",".join(str(count) for count in SENSOR_COUNTS),
+                        help="Comma separated sensor counts (default %(default)s)")
+    parser.add_argument("--iterations", type=int, default=ITERATIONS, help="Frames per stage (default %(default)s)")
+    parser.add_argument("--output", default="pipeline_results.json", help="The JSON file to save the results in")
+    parser.add_argument("--compare", help="A JSON file of an earlier run to compare with")
+    args = parser.parse_args()
+
+    results = []
+    first_bus = 1
+    for count in [int(count) for count in args.sensors.split(",")]:
+        stage_results, first_bus = run_stages(count, args.iterations, first_bus)
+        results.extend(stage_results)
+    print_results(results)
+    with open(args.output, "w") as output:
+        json.dump({
+            "meta": {
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "machine": platform.machine(),
+                "numpy": np.__version__,
+                "matplotlib": matplotlib.__version__,
+                "iterations": args.iterations,
+                "render_iterations": RENDER_ITERATIONS,
+            },
+            "results": results,
+        }, output, indent=2, sort_keys=True)
+    print("\nResults saved in %s" % args.output)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/python
+"""
+This script checks that the FilterBank gives the same output as a Filter per sensor, and compares the time both need.
+The check runs on random walks with jumps, invalid values and both settings of snapEnable and sleepEnable,
+and stops with an AssertionError when one value differs. The FilterBank is timed with numpy arrays (vectorized) and
+with the Filter per sensor it uses below skin_filter.SCALAR_SENSORS sensors (scalar), to find the crossover.
+Usage: python filter_benchmark.py [samples]
+"""
+import sys
+import time
+
+import numpy as np
+
+from skin_filter import Filter, FilterBank
+
+SENSOR_COUNTS = [1, 8, 16, 32, 64]
+SAMPLES = 1000
+
+
+def make_samples(samples, sensors, seed=0):
+    """
+    Random walks between 0 and 120 with some jumps, and about 2% invalid values.
+    :return: (values, valid), both with shape (samples, sensors)
+    """
+    rng = np.random.RandomState(seed)
+    steps = rng.normal(0, 2, (samples, sensors))
+    jumps = rng.rand(samples, sensors) < 0.02
+    steps[jumps] += rng.normal(0, 40, np.count_nonzero(jumps))
+    values = np.clip(50 + np.cumsum(steps, axis=0), 0, 120).astype(int)
+    valid = rng.rand(samples, sensors) > 0.02
+    return values, valid
+
+
+def filter_scalar(values, valid, sleep_enable=True, snap_enable=False):
+    filters = [Filter() for x in range(values.shape[1])]
+    for fil in filters:
+        fil.sleepEnable = sleep_enable
+        fil.snapEnable = snap_enable
+    filtered = np.zeros(values.shape, dtype=int)
+    for row in range(len(values)):
+        for x in range(values.shape[1]):
+            if valid[row, x]:
+                filtered[row, x] = filters[x].filter_value(int(values[row, x]))
+    return filtered
+
+
+def filter_bank(values, valid, sleep_enable=True, snap_enable=False, scalar=False):
+    filters = FilterBank(values.shape[1], scalar)
+    filters.sleepEnable = sleep_enable
+    filters.snapEnable = snap_enable
+    return filters.filter_block(values, valid)
+
+
+def check():
+    for sleep_enable in (True, False):
+        for snap_enable in (False, True):
+            values, valid = make_samples(2000, 16, seed=1)
+            expected = filter_scalar(values, valid, sleep_enable, snap_enable)
+            for scalar in (False, True):
+                actual = filter_bank(values, valid, sleep_enable, snap_enable, scalar)
+                differences = np.count_nonzero(expected != actual)
+                assert differences == 0, "%d values differ (sleepEnable %s, snapEnable %s, scalar %s)" % (
+                    differences, sleep_enable, snap_enable, scalar)
+    print("FilterBank output is the same as Filter")
+
+
+def time_function(function, values, valid):
+    start = time.time()
+    function(values, valid)
+    return (time.time() - start) / len(values)
+
+
+def main(samples=SAMPLES):
+    check()
+    print("%8s %16s %18s %18s %8s" % ("sensors", "Filter [us]", "vectorized [us]", "bank scalar [us]", "speedup"))
+    for sensors in SENSOR_COUNTS:
+        values, valid = make_samples(samples, sensors)
+        scalar = time_function(filter_scalar, values, valid)
+        bank = time_function(filter_bank, values, valid)
+        bank_scalar = time_function(lambda values, valid: filter_bank(values, valid, scalar=True), values, valid)
+        print("%8d %16.1f %18.1f %18.1f %7.1fx" % (sensors, scalar * 1e6, bank * 1e6, bank_scalar * 1e6,
+                                                   scalar / bank))
+    print("Times are per sample of all sensors. At 1 kHz there is 1000 us per sample.")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else SAMPLES)
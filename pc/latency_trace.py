@@ -0,0 +1,178 @@
+"""
+This file contains the LatencyTracer, that follows frames from the measurement on the raspberry pi to the plot.
+The stream scripts stamp a frame when the measurements are finished, when the frame is assembled and when it is sent
+(set TRACE = True in the stream script, see skin_frame.FLAG_TRACE). The pc stamps it when it is received, decoded,
+filtered and drawn. The time between two stages is kept per frame, for histograms and percentiles.
+
+The clocks of the raspberry pi and the pc are not the same. The offset between them is estimated from the send and
+receive times: the smallest (received - sent) of the last frames is the offset plus the smallest network delay. That
+smallest delay can't be measured with a stream in one direction, on a direct ethernet cable it is well below a
+millisecond. The network stage therefore shows how much longer a frame took than the fastest frame.
+
+export_chrome_trace saves the frames in the Trace Event Format, open the file in chrome://tracing or
+https://ui.perfetto.dev to see every stage of every frame on a time line.
+"""
+import json
+import threading
+from collections import OrderedDict, deque
+
+import numpy as np
+
+PI_STAGES = ["measured", "assembled", "sent"]
+PC_STAGES = ["received", "decoded", "filtered", "drawn"]
+STAGES = PI_STAGES + PC_STAGES
+# The name of every interval: the time from the previous stage to this stage
+INTERVALS = OrderedDict([
+    ("assemble", ("measured", "assembled")),
+    ("send", ("assembled", "sent")),
+    ("network", ("sent", "received")),
+    ("decode", ("received", "decoded")),
+    ("filter", ("decoded", "filtered")),  # Includes the time the frame waited in the queue for the plot
+    ("draw", ("filtered", "drawn")),
+    ("total", ("measured", "drawn")),
+])
+
+
+class ClockOffset(object):
+    """Estimates the offset of the pc clock to the raspberry pi clock, with the minimum over a sliding window."""
+
+    def __init__(self, window=1000):
+        """
+        :param window: The number of frames the minimum is taken over. A small window follows clock drift faster.
+        """
+        self.window = window
+        self.count = 0
+        # (index, difference) with increasing differences, the first one is the minimum of the window
+        self.candidates = deque()
+        self.offset = None
+
+    def update(self, pi_time, pc_time):
+        """
+        :return: The current offset: pc time = pi time + offset
+        """
+        difference = pc_time - pi_time
+        while self.candidates and self.candidates[-1][1] >= difference:
+            self.candidates.pop()
+        self.candidates.append((self.count, difference))
+        while self.candidates[0][0] <= self.count - self.window:
+            self.candidates.popleft()
+        self.count += 1
+        self.offset = self.candidates[0][1]
+        return self.offset
+
+
+class LatencyTracer(object):
+    """Collects the stage times of traced frames. received is called by the receiver thread, the rest by the plot."""
+
+    def __init__(self, history=10000, offset_window=1000, max_pending=10000, trace_frames=20000):
+        """
+        :param history: The number of latencies per interval that are kept for the histograms
+        :param offset_window: See ClockOffset
+        :param max_pending: The number of frames that can wait for the plot. Older ones are forgotten.
+        :param trace_frames: The number of finished frames that are kept for export_chrome_trace
+        """
+        self.lock = threading.Lock()
+        self.clock = ClockOffset(offset_window)
+        self.max_pending = max_pending
+        self.pending = OrderedDict()  # (node, seq) -> {stage: time}, the raspberry pi stages on its own clock
+        self.latencies = dict((name, deque(maxlen=history)) for name in INTERVALS)
+        self.frames = deque(maxlen=trace_frames)  # (node, seq, {stage: time on the pc clock})
+
+    def received(self, frame, received_time, decoded_time):
+        """
+        Starts following a frame.
+        :param frame: The decoded skin_frame.Frame, frames without trace timestamps are ignored
+        """
+        if frame.trace is None:
+            return
+        assembled, sent = frame.trace
+        with self.lock:
+            self.clock.update(sent, received_time)
+            self.pending[(frame.node, frame.seq)] = {"measured": frame.timestamp, "assembled": assembled,
+                                                     "sent": sent, "received": received_time,
+                                                     "decoded": decoded_time}
+            while len(self.pending) > self.max_pending:
+                self.pending.popitem(last=False)
+
+    def stamp(self, frames, stage, now):
+        """
+        Stamps a stage of several frames, for example all frames that were filtered at once.
+        """
+        with self.lock:
+            for frame in frames:
+                stages = self.pending.get((frame.node, frame.seq))
+                if stages is not None:
+                    stages[stage] = now
+
+    def drawn(self, frames, now):
+        """Stamps the last stage of frames and adds their latencies."""
+        with self.lock:
+            offset = self.clock.offset
+            for frame in frames:
+                stages = self.pending.pop((frame.node, frame.seq), None)
+                if stages is None or offset is None:
+                    continue
+                stages["drawn"] = now
+                for stage in PI_STAGES:
+                    stages[stage] += offset
+                for name, (start, end) in INTERVALS.items():
+                    if start in stages and end in stages:
+                        self.latencies[name].append(stages[end] - stages[start])
+                self.frames.append((frame.node, frame.seq, stages))
+
+    def histogram(self, interval="total", bins=50):
+        """
+        :return: (counts, edges) of the latencies of an interval, edges in ms
+        """
+        with self.lock:
+            latencies = np.array(self.latencies[interval]) * 1000
+        if len(latencies) == 0:
+            return np.zeros(bins, dtype=int), np.linspace(0, 1, bins + 1)
+        return np.histogram(latencies, bins=bins)
+
+    def summary(self):
+        """
+        :return: A dict interval -> dict with the count, mean and 50th, 90th, 99th percentile and max in ms
+        """
+        result = OrderedDict()
+        with self.lock:
+            for name in INTERVALS:
+                latencies = np.array(self.latencies[name]) * 1000
+                if len(latencies) == 0:
+                    continue
+                p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+                result[name] = {"count": len(latencies), "mean": float(np.mean(latencies)), "p50": float(p50),
+                                "p90": float(p90), "p99": float(p99), "max": float(np.max(latencies))}
+        return result
+
+    def report(self):
+        lines = ["%-10s %8s %9s %9s %9s %9s %9s" % ("stage", "frames", "mean", "p50", "p90", "p99", "max")]
+        for name, stats in self.summary().items():
+            lines.append("%-10s %8d %7.2fms %7.2fms %7.2fms %7.2fms %7.2fms" % (
+                name, stats["count"], stats["mean"], stats["p50"], stats["p90"], stats["p99"], stats["max"]))
+        if self.clock.offset is not None:
+            lines.append("Clock offset (pc - raspberry pi): %.3f ms" % (self.clock.offset * 1000))
+        return "\n".join(lines)
+
+    def export_chrome_trace(self, path):
+        """
+        Saves the finished frames in the Trace Event Format (chrome://tracing, Perfetto).
+        Every interval of every frame is an event, on the raspberry pi, the network or the pc. Times are on the pc clock.
+        """
+        with self.lock:
+            frames = list(self.frames)
+        processes = {"assemble": 1, "send": 1, "network": 2, "decode": 3, "filter": 3, "draw": 3}
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": name}}
+                  for pid, name in ((1, "raspberry pi"), (2, "network"), (3, "pc"))]
+        start_time = min(stages["measured"] for _, _, stages in frames) if frames else 0.0
+        for node, seq, stages in frames:
+            for name, (start, end) in INTERVALS.items():
+                if name == "total" or start not in stages or end not in stages:
+                    continue
+                events.append({"name": name, "ph": "X", "pid": processes[name], "tid": node,
+                               "ts": (stages[start] - start_time) * 1e6,
+                               "dur": max(stages[end] - stages[start], 0.0) * 1e6,
+                               "args": {"seq": seq}})
+        with open(path, "w") as trace_file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
+        return len(frames)
@@ -0,0 +1,244 @@
+#!/usr/bin/python
+"""
+This script generates synthetic skin frames at a high rate, to find out how much the pc side can take.
+The frames are made from a signal model for every sensor (see MODELS):
+ - noise: every sensor measures a constant distance plus gaussian noise
+ - steps: contacts, every sensor is pressed for a part of every period, the sensors one after the other
+ - sweep: an object moves along the sensors and back, the sensors under it measure a short distance
+A part of the measurements can be marked as failed with --invalid.
+
+With --batch-delay the senders put several frames in one datagram (see batch_sender.py), which trades that much
+latency for a higher rate.
+
+Several senders run in their own process, each with its own node id, so together they can offer more frames than one
+python process can encode. The rate is divided over the senders.
+
+By default the frames are received by a UdpReceiver in this script, and a consumer takes them CONSUMER_FPS times per
+second and filters them with a FilterBank, like read_multi_udp_blit.py does without drawing (the drawing time is
+measured by benchmarks/pipeline_benchmark.py). For every rate of --rates the offered rate, the received rate and the
+loss are printed, so the rate where the receiver starts losing frames shows up. With --external nothing is received
+here: run read_multi_udp_blit.py (with UDP_IP set to --ip) and watch its counters instead.
+
+Usage:
+    python load_generator.py [--sensors 16] [--rates 1000,10000,30000] [--senders 2] [--model sweep] [--duration 5]
+"""
+from __future__ import print_function
+
+import argparse
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+import numpy as np
+
+from skin_filter import FilterBank
+from udp_receiver import UdpReceiver, frames_to_arrays
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "raspberry", "python"))
+import skin_frame
+from batch_sender import BatchSender
+
+UDP_IP = "127.0.0.1"
+UDP_PORT = 5005
+RCVBUF = 1 << 20  # The same as read_multi_udp_blit.py
+CONSUMER_FPS = 30  # How often the consumer takes the received frames, like the animation interval of the plot
+CHUNK = 256  # The number of frames that are generated at once
+SETTLE_TIME = 0.5  # s, the time the receiver gets after a step to take the last frames
+
+# time.monotonic doesn't exist in python 2
+monotonic = getattr(time, "monotonic", time.time)
+
+
+def noise(mean=60.0, std=3.0, seed=0):
+    """Every sensor measures mean plus gaussian noise."""
+    random = np.random.RandomState(seed)
+
+    def model(times, count):
+        return mean + random.normal(0.0, std, (len(times), count))
+    return model
+
+
+def steps(far=200.0, near=30.0, period=1.0, duty=0.3):
+    """
+    Contacts: every sensor measures near for duty * period seconds of every period and far otherwise.
+    The contacts of the sensors are spread over the period.
+    """
+    def model(times, count):
+        phase = (times[:, None] / period + np.arange(count)[None, :] / float(count)) % 1.0
+        return np.where(phase < duty, near, far)
+    return model
+
+
+def sweep(far=200.0, near=20.0, period=2.0, width=1.5):
+    """
+    An object that moves from the first to the last sensor and back in period seconds. The sensors under it measure
+    near, the width is the standard deviation of the shape of the object in sensors.
+    """
+    def model(times, count):
+        position = np.abs(((times / period) % 1.0) * 2.0 - 1.0) * (count - 1)
+        shape = np.exp(-0.5 * ((np.arange(count)[None, :] - position[:, None]) / width) ** 2)
+        return far - (far - near) * shape
+    return model
+
+
+MODELS = {"noise": noise, "steps": steps, "sweep": sweep}
+
+
+def send_load(address, node, count, rate, duration, model_name, invalid, batch_delay, results):
+    """
+    Sends frames at rate frames per second for duration seconds. Runs in a sender process.
+    :param results: A multiprocessing queue that gets (node, sent frames, elapsed time, sent datagrams)
+    """
+    model = MODELS[model_name]() if model_name != "noise" else noise(seed=node)
+    random = np.random.RandomState(node)
+    encoder = skin_frame.FrameEncoder(node=node)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender = BatchSender(sock, address, max_delay=batch_delay)
+    total = int(rate * duration)
+    rows = []
+    sent = 0
+    start = monotonic()
+    while sent < total:
+        # The frames that should have been sent by now
+        due = min(int((monotonic() - start) * rate) + 1, total)
+        if sent >= due:
+            time.sleep(max(0.0, min(0.001, (sent + 1) / float(rate) - (monotonic() - start))))
+            continue
+        while sent < due:
+            if not rows:
+                # Generate the next chunk at once, failed measurements become None
+                times = (sent + np.arange(CHUNK)) / float(rate)
+                values = np.clip(model(times, count), 1, 0xFFFF).astype(int)
+                valid = random.random_sample(values.shape) >= invalid
+                rows = [[value if ok else None for value, ok in zip(row, row_valid)]
+                        for row, row_valid in zip(values.tolist(), valid.tolist())]
+                rows.reverse()
+            try:
+                sender.send(encoder.encode(rows.pop()))
+            except socket.error:
+                pass  # The send buffer is full, the frame is lost like on the network
+            sent += 1
+    sender.close()
+    results.put((node, sent, monotonic() - start, sender.datagrams))
+    sock.close()
+
+
+class Consumer(object):
+    """Takes the received frames and filters them, like the animation function of read_multi_udp_blit.py."""
+
+    def __init__(self, receiver, count):
+        self.receiver = receiver
+        self.count = count
+        self.filters = FilterBank(count)
+        self.busy = 0.0  # The time spent filtering
+        self.frames = 0
+
+    def consume(self):
+        frames = self.receiver.drain()
+        if not frames:
+            return
+        start = monotonic()
+        block, valid = frames_to_arrays(frames, self.count)
+        self.filters.filter_block(block, valid)
+        self.busy += monotonic() - start
+        self.frames += len(frames)
+
+
+def run_step(args, rate, first_node, receiver, consumer):
+    """
+    Offers rate frames per second for args.duration seconds.
+    :param first_node: The node id of the first sender. Every step uses new node ids, because the sequence numbers of
+    the senders start at 0 again and the receiver would see them as late frames of the previous step.
+    :return: A dict with the offered and received rate and the loss
+    """
+    before = receiver.stats() if receiver is not None else None
+    busy_before = consumer.busy if consumer is not None else 0.0
+    results = multiprocessing.Queue()
+    senders = [multiprocessing.Process(target=send_load, args=(
+        (args.ip, args.port), node, args.sensors, rate / float(args.senders), args.duration, args.model,
+        args.invalid, args.batch_delay, results)) for node in range(first_node, first_node + args.senders)]
+    start = monotonic()
+    for sender in senders:
+        sender.start()
+    if consumer is not None:
+        interval = 1.0 / CONSUMER_FPS
+        while any(sender.is_alive() for sender in senders) or monotonic() - start < args.duration:
+            consumer.consume()
+            time.sleep(interval)
+        end = monotonic() + SETTLE_TIME
+        while monotonic() < end:
+            consumer.consume()
+            time.sleep(interval)
+    sent = 0
+    datagrams = 0
+    elapsed = 0.0
+    for _ in senders:
+        _, sender_sent, sender_elapsed, sender_datagrams = results.get()
+        sent += sender_sent
+        datagrams += sender_datagrams
+        elapsed = max(elapsed, sender_elapsed)
+    for sender in senders:
+        sender.join()
+    result = {"rate": rate, "sent": sent, "offered_rate": sent / elapsed if elapsed > 0 else 0.0,
+              "frames_per_datagram": sent / float(datagrams) if datagrams else 0.0}
+    if receiver is not None:
+        after = receiver.stats()
+        received = after["received"] - before["received"]
+        result.update({
+            "received": received,
+            "received_rate": received / elapsed if elapsed > 0 else 0.0,
+            "loss": 1.0 - received / float(sent) if sent else 0.0,
+            "late": after["late"] - before["late"],
+            "overflow": after["overflow"] - before["overflow"],
+            "errors": after["errors"] - before["errors"],
+            "consumer_load": (consumer.busy - busy_before) / elapsed if elapsed > 0 else 0.0,
+        })
+    return result
+
+
+def print_result(result):
+    if "received" not in result:
+        print("%9.0f %12.0f %10.1f" % (result["rate"], result["offered_rate"], result["frames_per_datagram"]))
+        return
+    print("%9.0f %12.0f %10.1f %12.0f %7.2f%% %7d %9d %8.0f%%" % (
+        result["rate"], result["offered_rate"], result["frames_per_datagram"], result["received_rate"],
+        result["loss"] * 100, result["late"], result["overflow"], result["consumer_load"] * 100))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send synthetic skin frames at a high rate.")
+    parser.add_argument("--sensors", type=int, default=16, help="Sensors per frame (default %(default)s)")
+    parser.add_argument("--rates", default="1000,5000,10000,20000",
+                        help="Comma separated total frame rates, one step each (default %(default)s)")
+    parser.add_argument("--senders", type=int, default=1, help="Sender processes (default %(default)s)")
+    parser.add_argument("--model", choices=sorted(MODELS), default="sweep", help="Signal model (default %(default)s)")
+    parser.add_argument("--invalid", type=float, default=0.0, help="Fraction of failed measurements")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per rate (default %(default)s)")
+    parser.add_argument("--batch-delay", type=float, default=0.0,
+                        help="Seconds a frame may wait to share a datagram, 0 sends every frame alone (default %(default)s)")
+    parser.add_argument("--ip", default=UDP_IP, help="The ip address to send to (default %(default)s)")
+    parser.add_argument("--port", type=int, default=UDP_PORT, help="The port to send to (default %(default)s)")
+    parser.add_argument("--external", action="store_true", help="Only send, the frames are received by another script")
+    args = parser.parse_args()
+
+    receiver = consumer = None
+    if not args.external:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((args.ip, args.port))
+        receiver = UdpReceiver(sock, rcvbuf=RCVBUF)
+        receiver.start()
+        consumer = Consumer(receiver, args.sensors)
+        print("%9s %12s %10s %12s %8s %7s %9s %9s" % ("rate", "offered/s", "frames/dg", "received/s", "loss", "late",
+                                                      "overflow", "consumer"))
+    else:
+        print("%9s %12s %10s" % ("rate", "offered/s", "frames/dg"))
+    for step, rate in enumerate([float(rate) for rate in args.rates.split(",")]):
+        print_result(run_step(args, rate, step * args.senders, receiver, consumer))
+    if receiver is not None:
+        receiver.stop()
+
+
+if __name__ == "__main__":
+    main()
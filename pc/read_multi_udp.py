@@ -5,14 +5,24 @@ Currently depreciated by read_multi_udp_blit.
 This script doesn't use blitting for performance increase and therefore can be quite slow.
 Because the recv function on line 35 is a blocking function, the graph can lag behind.
 
-When the end of the screen is reached, the window auto rescales.
+The last HISTORY measurements are kept in a ring buffer (see ring_buffer.py) and the lines are updated in place,
+so the cost of a frame doesn't grow with the time the script runs. The window scrolls and the y axis auto rescales.
 """
+import os
 import socket
+import sys
+
 import matplotlib.animation as animation
 import matplotlib.pyplot as plt
 
+from ring_buffer import RingBuffer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "raspberry", "python"))
+import skin_frame
+
 UDP_IP = "169.254.210.175"  # The ip-address of the receiving pc. May need to be changed.
 UDP_PORT1 = 5005  # The port that is used.
+HISTORY = 1000  # The number of measurements that are shown
 
 sock1 = socket.socket(socket.AF_INET,  # Internet
                       socket.SOCK_DGRAM)  # UDP
@@ -20,10 +30,10 @@ sock1.bind((UDP_IP, UDP_PORT1))
 
 fig = plt.figure()
 ax1 = fig.add_subplot(1, 1, 1)
-ax2 = fig.add_subplot(1, 1, 1)
-xarr1 = []
-yarr1 = []
-yarr2 = []
+ax1.set_xlim(-HISTORY + 1, 0)
+history = RingBuffer(HISTORY, 2)
+line1, = ax1.plot([], [])
+line2, = ax1.plot([], [])
 
 
 def animate(i):
@@ -33,16 +43,13 @@ def animate(i):
     :return: nothing
     """
 
-    data = sock1.recv(128)
-    distance = data.split(" ")
+    frame = skin_frame.decode(sock1.recv(skin_frame.MAX_DATAGRAM))
+    history.append(frame.distances[:2])
 
-    xarr1.append(i)
-    yarr1.append(distance[0])
-    yarr2.append(distance[1])
-    ax1.clear()
-    ax2.clear()
-    ax1.plot(xarr1, yarr1)
-    ax2.plot(xarr1, yarr2)
+    line1.set_data(history.x(), history.view()[0])
+    line2.set_data(history.x(), history.view()[1])
+    ax1.relim()
+    ax1.autoscale_view(scalex=False)
 
 
 print ("Press ctrl-c to exit")
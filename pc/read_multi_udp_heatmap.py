@@ -0,0 +1,129 @@
+#!/usr/bin/python
+"""
+This script reads the data from the raspberry (or several raspberry pis) and shows the skin as an image: every sensor is
+a cell, its color is the distance it measures. For many sensors this is a lot faster and easier to read than the lines of
+read_multi_udp_blit.py, because only one image is drawn, whatever the number of sensors.
+Where the sensors are is described by a geometry file (see skin_geometry.py). Without one, the sensors of one raspberry
+pi are put in a grid of COLUMNS columns, in the order of the frames. Cells without a sensor or with a failed measurement
+are gray. With a geometry of several raspberry pis their frames are merged first (see skin_aggregator.py).
+Optionally the values of some sensors (SHOW_SENSORS, global index) are also drawn as lines below the image.
+"""
+import copy
+import socket
+
+import matplotlib.animation as animation
+import matplotlib.pyplot as plt
+import numpy as np
+
+from ring_buffer import RingBuffer
+from skin_aggregator import SkinAggregator
+from skin_filter import FilterBank
+from skin_geometry import grid_geometry, load_geometry
+from udp_receiver import UdpReceiver, frames_to_arrays
+
+UDP_IP = "169.254.210.175"  # The ip address of the receiving pc. May need to be changed
+UDP_PORT = 5005  # The port that is used
+RCVBUF = 1 << 20  # The size of the receive buffer of the socket in bytes
+GEOMETRY_FILE = None  # A geometry file (e.g. "skin_geometry.json"), None for a grid of one raspberry pi
+COLUMNS = 8  # The number of columns of the grid when there is no geometry file
+FILTERED = True  # Show the filtered values (see skin_filter.py) instead of the raw values
+SHOW_SENSORS = []  # The sensors that are also drawn as lines, e.g. [0, 5]
+HISTORY = 100  # The number of measurements of the lines
+DISTANCE_RANGE = (0, 255)  # mm, the distances of the darkest and the lightest color
+SNAPSHOT_INTERVAL = 0.02  # s, the time between two merged snapshots of several raspberry pis
+
+
+def animate(i):
+    """
+    Takes all frames that were received since the last call, filters them and shows the newest values.
+    """
+    frames = receiver.drain()
+    if frames:
+        if aggregator is not None:
+            _, raw, valid = aggregator.add(frames)
+        else:
+            raw, valid = frames_to_arrays(frames, geometry.nb_sensors)
+        if len(raw):
+            filtered = filters.filter_block(raw, valid)
+            values = filtered if FILTERED else raw
+            image.set_data(geometry.to_image(values[-1], valid[-1], out=cells))
+            if lines:
+                history.extend(values[:, SHOW_SENSORS])
+                update_lines()
+    stats = receiver.stats()
+    counters.set_text("received %d  dropped %d  late %d" % (stats["received"], stats["dropped"], stats["late"]))
+    return [image, counters] + lines
+
+
+def update_lines():
+    ydata = history.view()
+    xdata = history.x()
+    for index, line in enumerate(lines):
+        line.set_data(xdata, ydata[index])
+
+
+def init():
+    image.set_data(cells)
+    if lines:
+        update_lines()
+    return [image, counters] + lines
+
+
+def get_nb_sensors():
+    """
+    Waits for the first frame of the receiver, and deduces the number of sensors streaming to this device.
+    :return: The number of sensors
+    """
+    frame = None
+    while frame is None:
+        # With a timeout, so Ctrl-C still works in python 2
+        frame = receiver.wait_first_frame(1.0)
+    return len(frame.distances)
+
+
+# The socket to listen on
+sock = socket.socket(socket.AF_INET,  # Internet
+                     socket.SOCK_DGRAM)  # UDP
+sock.bind((UDP_IP, UDP_PORT))
+receiver = UdpReceiver(sock, rcvbuf=RCVBUF)
+receiver.start()
+
+if GEOMETRY_FILE is not None:
+    geometry = load_geometry(GEOMETRY_FILE)
+else:
+    geometry = grid_geometry(get_nb_sensors(), COLUMNS)
+aggregator = None
+if len(geometry.layout()) > 1:
+    aggregator = SkinAggregator(geometry.layout(), interval=SNAPSHOT_INTERVAL)
+filters = FilterBank(geometry.nb_sensors)
+cells = np.full((geometry.rows, geometry.columns), np.nan)
+
+if SHOW_SENSORS:
+    fig, (ax, line_ax) = plt.subplots(2, 1, gridspec_kw={"height_ratios": [3, 1]})
+else:
+    fig, ax = plt.subplots()
+colormap = copy.copy(plt.get_cmap("viridis_r"))
+colormap.set_bad("0.5")
+image = ax.imshow(cells, cmap=colormap, vmin=DISTANCE_RANGE[0], vmax=DISTANCE_RANGE[1], interpolation="nearest",
+                  animated=True)
+fig.colorbar(image, ax=ax, label='Afstand [mm]')
+ax.set_xticks(range(geometry.columns))
+ax.set_yticks(range(geometry.rows))
+counters = ax.text(0.01, 0.99, "", transform=ax.transAxes, verticalalignment="top", backgroundcolor="white")
+
+lines = []
+if SHOW_SENSORS:
+    history = RingBuffer(HISTORY, len(SHOW_SENSORS))
+    for sensor in SHOW_SENSORS:
+        cur_line, = line_ax.plot([], [], label=str(sensor))
+        lines.append(cur_line)
+    line_ax.set_xlim(-HISTORY + 1, 0)
+    line_ax.set_ylim(*DISTANCE_RANGE)
+    line_ax.set_xlabel('Aantal metingen geleden')
+    line_ax.set_ylabel('Afstand [mm]')
+    line_ax.legend(loc="upper left")
+
+# The animation function
+ani = animation.FuncAnimation(fig, animate, init_func=init, interval=0, blit=True)
+# This is a blocking function. This keeps showing the plot until the plot is closed.
+plt.show()
@@ -2,13 +2,23 @@
 
 """
 This script only works when 1 sensor is connected. Currently obsolete by read_multi_udp_blit.
+The last HISTORY measurements are kept in a ring buffer (see ring_buffer.py) and the line is updated in place.
 """
+import os
 import socket
+import sys
+
 import matplotlib.animation as animation
 import matplotlib.pyplot as plt
 
+from ring_buffer import RingBuffer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "raspberry", "python"))
+import skin_frame
+
 UDP_IP = "169.254.210.175"
 UDP_PORT = 5005
+HISTORY = 1000  # The number of measurements that are shown
 
 sock = socket.socket(socket.AF_INET,  # Internet
                      socket.SOCK_DGRAM)  # UDP
@@ -16,21 +26,18 @@ sock.bind((UDP_IP, UDP_PORT))
 
 fig = plt.figure()
 ax1 = fig.add_subplot(1, 1, 1)
-
-xarr = []
-yarr = []
-count = 0
+ax1.set_xlim(-HISTORY + 1, 0)
+history = RingBuffer(HISTORY, 1)
+line, = ax1.plot([], [])
 
 
 def animate(i):
-    global count
-    data, addr = sock.recvfrom(64)
-    distance = data
-    count += 1
-    xarr.append(count)
-    yarr.append(distance)
-    ax1.clear()
-    ax1.plot(xarr, yarr)
+    data, addr = sock.recvfrom(skin_frame.MAX_DATAGRAM)
+    frame = skin_frame.decode(data)
+    history.append(frame.distances[:1])
+    line.set_data(history.x(), history.view()[0])
+    ax1.relim()
+    ax1.autoscale_view(scalex=False)
 
 
 print ("Press ctrl-c to exit")
@@ -0,0 +1,172 @@
+"""
+This file contains the ReorderBuffer, that puts the frames of every node back in the order of their sequence numbers.
+
+UDP can lose, duplicate and reorder datagrams. The buffer keeps frames that arrive before an older frame for a short
+while (a window of window frames, at most max_delay seconds), so the older frame can still take its place:
+ - a frame with the expected sequence number is released right away, with the frames that were waiting behind it
+ - a duplicate (a sequence number that is waiting or was released recently) is thrown away
+ - a frame that arrives after a newer frame was released is late, and is thrown away
+ - when the window is full or a frame waited too long, the missing frames are counted as lost and the buffer moves on
+
+With hold_last a lost frame is replaced by a copy of the frame before it, with the sequence number of the lost frame and
+the FLAG_HELD flag. Then every sequence number reaches the filters once, in order, and the time series has no gaps.
+At most window frames are held per gap: after an outage the rest is only counted as lost, instead of flooding the
+receiver with thousands of copies.
+ASCII frames have no sequence number, they are released right away.
+A frame that is older than expected but was measured after the last released frame (a newer timestamp) means the stream
+script was started again (its sequence numbers start at 0), the buffer then starts again at that frame. Without
+timestamps such a frame is a restart when the node was quiet for longer than max_delay before it, late frames and
+duplicates arrive among the frames around them. A frame that is more than RESTART_GAP frames older than expected is
+always a restart.
+"""
+from collections import deque
+
+RESTART_GAP = 1000
+FLAG_HELD = 0x80  # Set on a frame that repeats the previous frame in place of a lost one, never sent by a raspberry pi
+
+
+def seq_diff(a, b):
+    """
+    :return: a - b for 32 bit sequence numbers that wrap, between -2^31 and 2^31
+    """
+    diff = (a - b) & 0xFFFFFFFF
+    return diff - 0x100000000 if diff >= 0x80000000 else diff
+
+
+class _Stream(object):
+    """The state of one node."""
+
+    def __init__(self, history):
+        self.expected = None  # The next sequence number to release
+        self.waiting = {}  # seq -> (frame, arrival time)
+        self.recent = deque(maxlen=history)  # The last released sequence numbers, to find duplicates
+        self.recent_set = set()
+        self.last = None  # The last released frame
+        self.arrival = None  # The time the last frame arrived
+
+
+class ReorderBuffer(object):
+    """Releases the frames of every node in order, without duplicates."""
+
+    def __init__(self, window=8, max_delay=0.05, hold_last=False):
+        """
+        :param window: The maximum number of frames that wait for an older frame
+        :param max_delay: The maximum time in seconds a frame waits for an older frame
+        :param hold_last: Release a copy of the previous frame for every lost frame
+        """
+        self.window = window
+        self.max_delay = max_delay
+        self.hold_last = hold_last
+        self.streams = {}
+        # Counters
+        self.released = 0
+        self.reordered = 0  # Frames that arrived after a newer frame, in time to take their place
+        self.duplicates = 0
+        self.late = 0
+        self.lost = 0
+        self.held = 0
+        self.restarts = 0
+
+    def push(self, frame, now):
+        """
+        Adds a received frame.
+        :param now: The time the frame was received
+        :return: The list of frames that are released, in order
+        """
+        if frame.seq is None:
+            self.released += 1
+            return [frame]
+        stream = self.streams.get(frame.node)
+        if stream is None:
+            stream = self.streams[frame.node] = _Stream(2 * self.window + 1)
+        released = []
+        if stream.expected is None:
+            stream.expected = frame.seq
+        diff = seq_diff(frame.seq, stream.expected)
+        if diff < 0 and frame.seq not in stream.waiting and self._restarted(stream, frame, diff, now):
+            while stream.waiting:
+                self._skip(stream, released)
+            stream.expected = frame.seq
+            stream.recent.clear()
+            stream.recent_set.clear()
+            self.restarts += 1
+            diff = 0
+        stream.arrival = now
+        if frame.seq in stream.waiting:
+            self.duplicates += 1
+        elif diff < 0:
+            if frame.seq in stream.recent_set:
+                self.duplicates += 1
+            else:
+                self.late += 1
+        elif diff == 0:
+            if stream.waiting:
+                self.reordered += 1
+            self._release(stream, frame, released)
+            self._release_waiting(stream, released)
+        else:
+            stream.waiting[frame.seq] = (frame, now)
+            while len(stream.waiting) >= self.window:
+                self._skip(stream, released)
+        self._expire(stream, now, released)
+        return released
+
+    def _restarted(self, stream, frame, diff, now):
+        """
+        Whether a frame that is older than expected comes from a stream script that was started again.
+        """
+        if diff < -RESTART_GAP:
+            return True
+        last = stream.last
+        if frame.timestamp is not None and last is not None and last.timestamp is not None:
+            # A late frame or a duplicate was measured before the last released frame
+            return frame.timestamp > last.timestamp
+        return stream.arrival is not None and now - stream.arrival > self.max_delay
+
+    def poll(self, now):
+        """
+        Releases the frames that waited longer than max_delay, call this when nothing was received for a while.
+        :return: The list of frames that are released
+        """
+        released = []
+        for stream in self.streams.values():
+            self._expire(stream, now, released)
+        return released
+
+    def _expire(self, stream, now, released):
+        while stream.waiting and min(arrival for _, arrival in stream.waiting.values()) < now - self.max_delay:
+            self._skip(stream, released)
+
+    def _skip(self, stream, released):
+        """Gives up on the missing frames before the oldest waiting frame."""
+        oldest = min(stream.waiting, key=lambda seq: seq_diff(seq, stream.expected))
+        missing = seq_diff(oldest, stream.expected)
+        self.lost += missing
+        if self.hold_last and stream.last is not None:
+            for _ in range(min(missing, self.window)):
+                held = stream.last._replace(seq=stream.expected, flags=stream.last.flags | FLAG_HELD, trace=None)
+                self._release(stream, held, released)
+                self.held += 1
+        stream.expected = oldest
+        self._release_waiting(stream, released)
+
+    def _release_waiting(self, stream, released):
+        while stream.expected in stream.waiting:
+            frame, _ = stream.waiting.pop(stream.expected)
+            self._release(stream, frame, released)
+
+    def _release(self, stream, frame, released):
+        stream.expected = (frame.seq + 1) & 0xFFFFFFFF
+        if not frame.flags & FLAG_HELD:
+            # A held frame isn't remembered, so the lost frame counts as late when it arrives after all
+            if len(stream.recent) == stream.recent.maxlen:
+                stream.recent_set.discard(stream.recent[0])
+            stream.recent.append(frame.seq)
+            stream.recent_set.add(frame.seq)
+            stream.last = frame
+            self.released += 1
+        released.append(frame)
+
+    def stats(self):
+        return {"released": self.released, "reordered": self.reordered, "duplicates": self.duplicates,
+                "late": self.late, "lost": self.lost, "held": self.held, "restarts": self.restarts}
@@ -0,0 +1,226 @@
+#!/usr/bin/python
+"""
+This script replays recorded measurements over UDP, so the pc side can be tested and tuned without the sensors.
+The frames are sent in the format of the stream scripts (see raspberry/python/skin_frame.py), so read_multi_udp_blit.py
+and the other reading scripts can't tell the difference.
+
+Two kinds of recordings are understood:
+ - the binary files of raspberry/python/skin_recorder.py (.skrec). The measurements are replayed with their timing.
+ - the old text logs (Output.txt, Output_TCA9548A.txt): a line per measurement, the distances separated by a space,
+   X for a failed measurement. They have no timestamps, so they are replayed at --rate measurements per second.
+Several files are replayed after each other, for example all parts of a rotated recording.
+
+--speed 1 replays in real time, --speed 10 ten times faster and --speed 0 as fast as possible. With --loop the
+recording starts again at the end, until Ctrl-C. Every REPORT_INTERVAL seconds and at the end the achieved send rate
+is printed, next to the rate that was asked for. When the sender can't keep up, the frames are sent late but none are
+skipped, so a replay always sends the same frames.
+
+Usage:
+    python replay.py Output_20180101-120000_*.skrec [--speed 1] [--loop] [--ip 127.0.0.1] [--port 5005]
+    python replay.py Output_TCA9548A.txt --rate 50 --speed 0
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import socket
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "raspberry", "python"))
+import skin_frame
+import skin_recorder
+
+UDP_IP = "127.0.0.1"  # The ip address of the receiving pc
+UDP_PORT = 5005  # The port that is used
+TEXT_RATE = 50.0  # The measurements per second of a text log, they have no timestamps
+REPORT_INTERVAL = 5.0  # s
+
+# time.monotonic doesn't exist in python 2
+monotonic = getattr(time, "monotonic", time.time)
+
+
+def read_text_log(path, rate=TEXT_RATE):
+    """
+    Reads a text log of the old log scripts.
+    :param rate: The measurements per second, used for the timestamps
+    :return: (timestamps, distances, valid) numpy arrays, distances and valid with a row per measurement
+    """
+    rows = []
+    with open(path) as text_file:
+        for line in text_file:
+            values = line.split()
+            if values:
+                rows.append(values)
+    count = max(len(row) for row in rows) if rows else 0
+    distances = np.zeros((len(rows), count), dtype=np.uint16)
+    valid = np.zeros((len(rows), count), dtype=bool)
+    for index, row in enumerate(rows):
+        for sensor, value in enumerate(row):
+            if value.isdigit():
+                distances[index, sensor] = min(int(value), 0xFFFF)
+                valid[index, sensor] = True
+    return np.arange(len(rows)) / float(rate), distances, valid
+
+
+def read_recording(path):
+    """
+    Reads a binary recording of skin_recorder.py.
+    :return: (timestamps, distances, valid) numpy arrays, distances and valid with a row per measurement
+    """
+    records = skin_recorder.load_recording(path)
+    return np.array(records["timestamp"]), np.array(records["distance"]), records["status"] != 0
+
+
+def read_files(paths, rate=TEXT_RATE):
+    """
+    Reads several recordings and puts them after each other. Rows with fewer sensors are padded with failed
+    measurements, and the timestamps of every file continue after the previous file.
+    :return: (timestamps, distances, valid) numpy arrays
+    """
+    parts = []
+    for path in paths:
+        if path.endswith(skin_recorder.EXTENSION):
+            parts.append(read_recording(path))
+        else:
+            parts.append(read_text_log(path, rate))
+    count = max(distances.shape[1] for _, distances, _ in parts)
+    all_timestamps, all_distances, all_valid = [], [], []
+    start = 0.0
+    for timestamps, distances, valid in parts:
+        if len(timestamps) == 0:
+            continue
+        # Continue one measurement interval after the previous file
+        all_timestamps.append(timestamps - timestamps[0] + start)
+        start = all_timestamps[-1][-1] + (np.median(np.diff(timestamps)) if len(timestamps) > 1 else 1.0 / rate)
+        padded = np.zeros((len(timestamps), count), dtype=np.uint16)
+        padded[:, :distances.shape[1]] = distances
+        all_distances.append(padded)
+        padded_valid = np.zeros((len(timestamps), count), dtype=bool)
+        padded_valid[:, :valid.shape[1]] = valid
+        all_valid.append(padded_valid)
+    if not all_timestamps:
+        raise ValueError("The recordings are empty")
+    return np.concatenate(all_timestamps), np.concatenate(all_distances), np.concatenate(all_valid)
+
+
+class Replayer(object):
+    """Sends recorded measurements as skin frames, with the timing of the recording."""
+
+    def __init__(self, sock, address, timestamps, distances, valid, speed=1.0, loop=False,
+                 frame_format=skin_frame.FORMAT_BINARY, node=0):
+        """
+        :param sock: A UDP socket
+        :param address: (ip, port) to send to
+        :param timestamps: The time of every measurement in seconds, only the differences are used
+        :param distances: The distances, a row per measurement
+        :param valid: Whether a distance is a valid measurement, the same shape as distances
+        :param speed: 1 for real time, 2 for twice as fast, 0 or None as fast as possible
+        :param loop: Start again at the end
+        """
+        self.sock = sock
+        self.address = address
+        self.offsets = timestamps - timestamps[0]
+        # Failed measurements are sent as None, the lists are made once so sending only has to encode
+        self.rows = [[distance if ok else None for distance, ok in zip(row, row_valid)]
+                     for row, row_valid in zip(distances.tolist(), valid.tolist())]
+        self.speed = speed
+        self.loop = loop
+        self.encoder = skin_frame.FrameEncoder(node, frame_format)
+        # The time of one pass, the last measurement is followed by one interval before the loop starts again
+        interval = float(np.median(np.diff(self.offsets))) if len(self.offsets) > 1 else 0.0
+        self.duration = self.offsets[-1] + interval
+        self.sent = 0
+        self.late = 0  # Frames that were sent more than a millisecond after their time
+        self.max_lag = 0.0
+        self.start_time = None
+
+    def run(self, report_interval=REPORT_INTERVAL):
+        """Sends the recording, until the end or until Ctrl-C when looping."""
+        self.start_time = monotonic()
+        next_report = self.start_time + report_interval
+        passes = 0
+        window_start, window_sent = self.start_time, 0
+        try:
+            while True:
+                for offset, row in zip(self.offsets, self.rows):
+                    if self.speed:
+                        due = self.start_time + (passes * self.duration + offset) / self.speed
+                        now = monotonic()
+                        if due > now:
+                            time.sleep(due - now)
+                        else:
+                            lag = now - due
+                            self.max_lag = max(self.max_lag, lag)
+                            if lag > 0.001:
+                                self.late += 1
+                    self.sock.sendto(self.encoder.encode(row), self.address)
+                    self.sent += 1
+                    if report_interval and self.sent & 0xFF == 0 and monotonic() >= next_report:
+                        now = monotonic()
+                        print("%.0f frames/s" % ((self.sent - window_sent) / (now - window_start)))
+                        window_start, window_sent = now, self.sent
+                        next_report = now + report_interval
+                passes += 1
+                if not self.loop:
+                    break
+        except KeyboardInterrupt:
+            pass
+        return self.stats()
+
+    def stats(self):
+        """
+        :return: A dict with the frames sent, the achieved and the asked rate in frames/s, and the late frames
+        """
+        elapsed = monotonic() - self.start_time if self.start_time is not None else 0.0
+        target = None
+        if self.speed and self.duration > 0:
+            target = len(self.rows) / self.duration * self.speed
+        return {
+            "sent": self.sent,
+            "elapsed": elapsed,
+            "rate": self.sent / elapsed if elapsed > 0 else 0.0,
+            "target_rate": target,
+            "samples_per_s": self.sent * len(self.rows[0]) / elapsed if elapsed > 0 and self.rows else 0.0,
+            "late": self.late,
+            "max_lag": self.max_lag,
+        }
+
+    def report(self):
+        stats = self.stats()
+        lines = ["Sent %d frames in %.2f s: %.0f frames/s, %.0f samples/s" % (
+            stats["sent"], stats["elapsed"], stats["rate"], stats["samples_per_s"])]
+        if stats["target_rate"] is not None:
+            lines.append("Asked for %.0f frames/s, %d frames late (max %.1f ms)" % (
+                stats["target_rate"], stats["late"], stats["max_lag"] * 1000))
+        return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded measurements over UDP.")
+    parser.add_argument("files", nargs="+", help="Binary recordings (.skrec) or text logs, replayed in this order")
+    parser.add_argument("--ip", default=UDP_IP, help="The ip address to send to (default %(default)s)")
+    parser.add_argument("--port", type=int, default=UDP_PORT, help="The port to send to (default %(default)s)")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="1 is real time, 10 ten times faster, 0 as fast as possible (default %(default)s)")
+    parser.add_argument("--loop", action="store_true", help="Start again at the end, until Ctrl-C")
+    parser.add_argument("--rate", type=float, default=TEXT_RATE,
+                        help="Measurements per second of text logs (default %(default)s)")
+    parser.add_argument("--ascii", action="store_true", help="Send the old ASCII strings instead of binary frames")
+    args = parser.parse_args()
+
+    timestamps, distances, valid = read_files(args.files, args.rate)
+    print("Replaying %d measurements of %d sensors to %s:%d" % (len(timestamps), distances.shape[1], args.ip,
+                                                                args.port))
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    replayer = Replayer(sock, (args.ip, args.port), timestamps, distances, valid, args.speed, args.loop,
+                        skin_frame.FORMAT_ASCII if args.ascii else skin_frame.FORMAT_BINARY)
+    replayer.run()
+    print(replayer.report())
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
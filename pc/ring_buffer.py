@@ -0,0 +1,78 @@
+"""
+This file contains the RingBuffer that keeps the plot history of the pc scripts.
+It has a fixed capacity, so the memory use stays the same and the cost of a frame doesn't depend on how long the
+script runs. Every sample is written twice, at index i and at i + capacity. Because of that the last capacity samples
+are always one contiguous slice of the array: view() returns it without copying, ready for Line2D.set_data.
+"""
+import numpy as np
+
+
+class RingBuffer(object):
+    """Fixed capacity history of a number of channels (for example the raw and filtered value of every sensor)."""
+
+    def __init__(self, capacity, channels, dtype=float):
+        """
+        :param capacity: The number of samples that are kept
+        :param channels: The number of values per sample
+        """
+        self.capacity = capacity
+        self.channels = channels
+        self.data = np.zeros((channels, 2 * capacity), dtype=dtype)
+        self.index = 0  # Where the next sample is written
+        self.count = 0  # The number of samples in the buffer
+        self.total = 0  # The number of samples that were ever appended
+        # x values for plotting: the age of every sample, the newest sample is at 0
+        self.ages = np.arange(-capacity + 1, 1)
+
+    def append(self, values):
+        """
+        Appends one sample.
+        :param values: One value per channel
+        """
+        self.data[:, self.index] = values
+        self.data[:, self.index + self.capacity] = values
+        self.index = (self.index + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.total += 1
+
+    def extend(self, block):
+        """
+        Appends several samples at once.
+        :param block: Array with shape (samples, channels), oldest sample first
+        """
+        block = np.asarray(block)
+        samples = len(block)
+        if samples == 0:
+            return
+        self.total += samples
+        if samples > self.capacity:
+            block = block[-self.capacity:]
+            samples = self.capacity
+        positions = (self.index + np.arange(samples)) % self.capacity
+        self.data[:, positions] = block.T
+        self.data[:, positions + self.capacity] = block.T
+        self.index = (self.index + samples) % self.capacity
+        self.count = min(self.count + samples, self.capacity)
+
+    def view(self):
+        """
+        :return: Array with shape (channels, count), oldest sample first. This is a view, don't keep it.
+        """
+        end = self.index + self.capacity
+        return self.data[:, end - self.count:end]
+
+    def x(self):
+        """
+        :return: The x values that belong to view(): the age of every sample in samples, the newest is 0
+        """
+        return self.ages[self.capacity - self.count:]
+
+    def latest(self):
+        """
+        :return: The newest sample, one value per channel
+        """
+        return self.data[:, self.index + self.capacity - 1]
+
+    def clear(self):
+        self.index = 0
+        self.count = 0
@@ -0,0 +1,188 @@
+"""
+This file contains the SkinAggregator, that merges the frames of several raspberry pis into snapshots of the whole skin.
+
+Every raspberry pi (node) has its own sensors. The aggregator gives them one global index: the sensors of the first
+node come first, then those of the second node, and so on. The order is fixed by a layout, or follows the order in
+which the nodes are first seen.
+
+Time is divided in intervals of interval seconds. A snapshot holds the newest measurement of every sensor at the end
+of an interval: a sensor without a new measurement in an interval keeps its previous value. An interval is finished
+when a frame arrives that is delay seconds newer than its end, so a node that is a bit slower still makes it in time.
+A frame that arrives after its interval is finished counts as late and goes in the next snapshot.
+
+The frame timestamps are used, so the clocks of the raspberry pis have to be synchronized (ntp or ptp). ASCII frames
+have no timestamp, they get the time they are added.
+
+All frames that are added at once are merged with numpy, there is no python loop per node or per snapshot.
+
+Usage:
+    aggregator = SkinAggregator([(0, 16), (1, 16)])
+    snapshots = aggregator.add(receiver.drain())
+    snapshots.distances  # Array with shape (snapshots, 32)
+"""
+import time
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+# timestamps: the end of the interval of every snapshot, distances and valid: a row per snapshot, a column per sensor
+Snapshots = namedtuple("Snapshots", ["timestamps", "distances", "valid"])
+
+
+class SkinAggregator(object):
+    """Merges the frames of several nodes into time aligned snapshots."""
+
+    def __init__(self, layout=None, interval=0.02, delay=None, max_snapshots=1000):
+        """
+        :param layout: A list of (node, number of sensors) in the order of the global index. Frames of other nodes are
+        ignored. None adds every new node at the end, with the number of sensors of its first frame.
+        :param interval: The time between two snapshots in seconds
+        :param delay: How long to wait for the frames of an interval in seconds, defaults to interval
+        :param max_snapshots: The maximum number of snapshots that add returns, older intervals are skipped. This
+        happens after a pause of the streams, or when a clock jumps.
+        """
+        self.interval = interval
+        self.delay = interval if delay is None else delay
+        self.max_snapshots = max_snapshots
+        self.nodes = OrderedDict()  # node -> (offset in the global index, number of sensors)
+        self.nb_sensors = 0
+        self.fixed = layout is not None
+        # The last snapshot
+        self.distances = np.zeros(0)
+        self.valid = np.zeros(0, dtype=bool)
+        for node, count in layout or []:
+            self._add_node(node, count)
+        self.start = None  # The start of interval 0
+        self.next_interval = 0  # The first interval that isn't finished
+        self.newest = None  # The newest timestamp
+        # The measurements that wait for their interval to finish, in the order they were added
+        self.pending_intervals = np.zeros(0, dtype=np.int64)
+        self.pending_index = np.zeros(0, dtype=np.int64)
+        self.pending_distances = np.zeros(0)
+        self.pending_valid = np.zeros(0, dtype=bool)
+        # Counters
+        self.frames = 0
+        self.late = 0
+        self.unknown = 0  # Frames of nodes that are not in the layout
+        self.snapshots = 0
+
+    def _add_node(self, node, count):
+        self.nodes[node] = (self.nb_sensors, count)
+        self.nb_sensors += count
+        self.distances = np.concatenate([self.distances, np.zeros(count)])
+        self.valid = np.concatenate([self.valid, np.zeros(count, dtype=bool)])
+
+    def sensor_index(self, node, sensor):
+        """
+        :return: The global index of a sensor of a node
+        """
+        offset, count = self.nodes[node]
+        if not 0 <= sensor < count:
+            raise IndexError("Node %d has %d sensors" % (node, count))
+        return offset + sensor
+
+    def add(self, frames):
+        """
+        Adds frames and returns the snapshots that are finished.
+        :param frames: skin_frame.Frame objects of any nodes, for example everything UdpReceiver.drain returned
+        :return: Snapshots, with zero rows when no interval was finished
+        """
+        now = time.time()
+        timestamps, offsets, lengths, parts, valid_parts = [], [], [], [], []
+        for frame in frames:
+            place = self.nodes.get(frame.node)
+            if place is None:
+                if self.fixed:
+                    self.unknown += 1
+                    continue
+                self._add_node(frame.node, len(frame.distances))
+                place = self.nodes[frame.node]
+            length = min(len(frame.distances), place[1])
+            timestamps.append(frame.timestamp if frame.timestamp is not None else now)
+            offsets.append(place[0])
+            lengths.append(length)
+            parts.append(frame.distances[:length])
+            valid_parts.append(frame.valid[:length])
+        if timestamps:
+            self._add_measurements(np.array(timestamps), np.array(offsets, dtype=np.int64),
+                                   np.array(lengths, dtype=np.int64), np.concatenate(parts),
+                                   np.concatenate(valid_parts))
+        return self._finish(False)
+
+    def flush(self):
+        """
+        Finishes all intervals, for example when the streams stopped.
+        :return: Snapshots
+        """
+        return self._finish(True)
+
+    def _add_measurements(self, timestamps, offsets, lengths, distances, valid):
+        self.frames += len(timestamps)
+        if self.start is None:
+            self.start = np.floor(timestamps.min() / self.interval) * self.interval
+        intervals = np.floor((timestamps - self.start) / self.interval).astype(np.int64)
+        late = intervals < self.next_interval
+        self.late += int(np.count_nonzero(late))
+        intervals[late] = self.next_interval
+        # The global index of every measurement: the offset of its node plus its place in the frame
+        ends = np.cumsum(lengths)
+        index = np.arange(ends[-1]) - np.repeat(ends - lengths, lengths) + np.repeat(offsets, lengths)
+        self.pending_intervals = np.concatenate([self.pending_intervals, np.repeat(intervals, lengths)])
+        self.pending_index = np.concatenate([self.pending_index, index])
+        self.pending_distances = np.concatenate([self.pending_distances, distances])
+        self.pending_valid = np.concatenate([self.pending_valid, valid])
+        newest = timestamps.max()
+        self.newest = newest if self.newest is None else max(self.newest, newest)
+
+    def _finish(self, everything):
+        if self.newest is None:
+            return self._empty()
+        if everything:
+            last = int(self.pending_intervals.max()) if len(self.pending_intervals) else self.next_interval - 1
+        else:
+            last = int(np.floor((self.newest - self.delay - self.start) / self.interval)) - 1
+        if last < self.next_interval:
+            return self._empty()
+        first = max(self.next_interval, last - self.max_snapshots + 1)
+        count = last - first + 1
+        finished = self.pending_intervals <= last
+        rows = np.maximum(self.pending_intervals[finished] - first, -1) + 1  # Skipped intervals go in row 0
+        columns = self.pending_index[finished]
+        # Row 0 is the last snapshot. When a sensor has several measurements in an interval the newest one counts.
+        keys = rows * self.nb_sensors + columns
+        _, newest = np.unique(keys[::-1], return_index=True)
+        newest = len(keys) - 1 - newest
+        distances = np.zeros((count + 1, self.nb_sensors))
+        valid = np.zeros((count + 1, self.nb_sensors), dtype=bool)
+        updated = np.zeros((count + 1, self.nb_sensors), dtype=bool)
+        distances[0] = self.distances
+        valid[0] = self.valid
+        updated[0] = True
+        distances[rows[newest], columns[newest]] = self.pending_distances[finished][newest]
+        valid[rows[newest], columns[newest]] = self.pending_valid[finished][newest]
+        updated[rows[newest], columns[newest]] = True
+        # Hold the last value: every cell takes the row of the last update at or above it
+        source = np.where(updated, np.arange(count + 1)[:, None], 0)
+        np.maximum.accumulate(source, axis=0, out=source)
+        sensors = np.arange(self.nb_sensors)
+        distances = distances[source, sensors]
+        valid = valid[source, sensors]
+        keep = ~finished
+        self.pending_intervals = self.pending_intervals[keep]
+        self.pending_index = self.pending_index[keep]
+        self.pending_distances = self.pending_distances[keep]
+        self.pending_valid = self.pending_valid[keep]
+        self.distances = distances[-1].copy()
+        self.valid = valid[-1].copy()
+        self.next_interval = last + 1
+        self.snapshots += count
+        timestamps = self.start + (np.arange(first, last + 1) + 1) * self.interval
+        return Snapshots(timestamps, distances[1:], valid[1:])
+
+    def _empty(self):
+        return Snapshots(np.zeros(0), np.zeros((0, self.nb_sensors)), np.zeros((0, self.nb_sensors), dtype=bool))
+
+    def stats(self):
+        return {"nodes": len(self.nodes), "sensors": self.nb_sensors, "frames": self.frames, "late": self.late,
+                "unknown": self.unknown, "snapshots": self.snapshots,
+                "pending": len(self.pending_intervals)}
@@ -0,0 +1,240 @@
+"""
+This file contains the filter of the pc scripts. This is an exponential moving average with a responsive snap and a sleep
+mode against noise. (see https://github.com/dxinteractive/ResponsiveAnalogRead)
+
+Filter filters one sensor, one sample at a time. FilterBank does exactly the same for all sensors at once with numpy
+arrays, so the cost per sample hardly grows with the number of sensors. Every numpy call has a fixed cost though, so
+with few sensors a Filter per sensor is faster: below SCALAR_SENSORS sensors the FilterBank uses a Filter per sensor
+itself, and copies their state to its arrays after every call. Its output and state are the same either way,
+test_skin_filter.py checks this and filter_benchmark.py compares the speed.
+"""
+import numpy as np
+
+SCALAR_SENSORS = 32  # Below this number of sensors a FilterBank uses a Filter per sensor, see filter_benchmark.py
+
+
+class Filter:
+    """
+    This class is for calculating the filter value of the sensor value
+    For each sensor, a filter instance is created and and filter values are updated.
+    """
+
+    def __init__(self):
+        # Setting: Whether or not to enable sleep mode. In this mode, the filter is a bit less responsive to the changes. This is to block out noise
+        self.sleepEnable = True
+        # Setting: The threshold for waking up - exiting sleep mode.
+        self.activityThreshold = 2.5
+        # The max value of the sensor
+        self.analogResolution = 100.0
+        # No setting, the error
+        self.errorEMA = 0.0
+        # No setting: whether or not the filter is currently in sleep mode
+        self.sleeping = False
+        # Setting: The amount of 'snap' of the filter. If too loose, the filter is not following well. If to high, overly compensating.
+        self.snapMultiplier = 0.5
+        # No setting: the current filter value
+        self.smoothValue = 0.0
+        # Setting: Whether to enable edge snapping. This makes it easier to get to the edges( min/max) of the measurement values.
+        self.snapEnable = False
+
+    def filter_value(self, new_value):
+        """
+        Function responsible for updating the filter. Returns the new filtered value.
+        :param new_value: The current measurement data
+        :return: The new filtered value
+        """
+        # if sleep and edge snap are enabled and the new value is very close to an edge, drag it a little closer to the edges
+        #  This'll make it easier to pull the output values right to the extremes without sleeping,
+        #  and it'll make movements right near the edge appear larger, making it easier to wake up
+        if self.sleepEnable and self.snapEnable:
+            if new_value < self.activityThreshold:
+                new_value = (new_value * 2) - self.activityThreshold
+            elif new_value > self.analogResolution - self.activityThreshold:
+                new_value = (new_value * 2) - self.analogResolution + self.activityThreshold
+
+        # get difference between new input value and current smooth value
+        diff = abs(new_value - self.smoothValue)
+
+        # measure the difference between the new value and current value
+        # and use another exponential moving average to work out what
+        # the current margin of error is
+        self.errorEMA += ((new_value - self.smoothValue) - self.errorEMA) * 0.4
+
+        # if sleep has been enabled, sleep when the amount of error is below the activity threshold
+        if self.sleepEnable:
+            # recalculate sleeping status
+            self.sleeping = abs(self.errorEMA) < self.activityThreshold
+
+        # if we're allowed to sleep, and we're sleeping
+        # then don't update responsiveValue this loop
+        # just output the existing responsiveValue
+        if self.sleepEnable and self.sleeping:
+            return int(self.smoothValue)
+
+            #  use a 'snap curve' function, where we pass in the diff (x) and get back a number from 0-1.
+            #  We want small values of x to result in an output close to zero, so when the smooth value is close to the input value
+            #  it'll smooth out noise aggressively by responding slowly to sudden changes.
+            #  We want a small increase in x to result in a much higher output value, so medium and large movements are snappy and responsive,
+            #  and aren't made sluggish by unnecessarily filtering out noise. A hyperbola (f(x) = 1/x) curve is used.
+            #  First x has an offset of 1 applied, so x = 0 now results in a value of 1 from the hyperbola function.
+            #  High values of x tend toward 0, but we want an output that begins at 0 and tends toward 1, so 1-y flips this up the right way.
+            #  Finally the result is multiplied by 2 and capped at a maximum of one, which means that at a certain point all larger movements are maximally snappy
+            #
+            #  then multiply the input by SNAP_MULTIPLIER so input values fit the snap curve better.
+        snap = snap_curve(diff * self.snapMultiplier)
+
+        #  when sleep is enabled, the emphasis is stopping on a responsiveValue quickly, and it's less about easing into position.
+        #  If sleep is enabled, add a small amount to snap so it'll tend to snap into a more accurate position before sleeping starts.
+        if self.sleepEnable:
+            snap *= 0.5 + 0.5
+
+            # // calculate the exponential moving average based on the snap
+        self.smoothValue += (new_value - self.smoothValue) * snap
+
+        # // ensure output is in bounds
+        if self.smoothValue < 0.0:
+            self.smoothValue = 0.0
+        elif self.smoothValue > self.analogResolution - 1:
+            self.smoothValue = self.analogResolution - 1
+
+            # expected output is an integer
+        return int(self.smoothValue)
+
+
+def snap_curve(x):
+    """
+    The snap curve function. This fuction is used in the filter_value function. More info there.
+    :param x: The difference between the measured value and the previous filter value
+    :return: A coefficient for the amount of snap.
+    """
+    y = 1.0 / (x + 1.0)
+    y = (1.0 - y) * 2.0
+    if y > 1.0:
+        return 1.0
+
+    return y
+
+
+def snap_curves(x):
+    """
+    snap_curve for an array of differences.
+    :param x: The differences between the measured values and the previous filter values
+    :return: The coefficients for the amount of snap
+    """
+    y = 1.0 / (x + 1.0)
+    y = (1.0 - y) * 2.0
+    return np.minimum(y, 1.0, out=y)
+
+
+class FilterBank(object):
+    """
+    The Filter for a number of sensors at once. The state of every sensor is kept in numpy arrays, and all sensors are
+    updated in one vectorized step. The settings are the same as those of Filter, and are shared by all sensors.
+    """
+
+    def __init__(self, nb_sensors, scalar=None):
+        """
+        :param nb_sensors: The number of sensors
+        :param scalar: Use a Filter per sensor instead of numpy arrays, None to do so below SCALAR_SENSORS sensors
+        """
+        # Settings, see Filter
+        self.sleepEnable = True
+        self.activityThreshold = 2.5
+        self.analogResolution = 100.0
+        self.snapMultiplier = 0.5
+        self.snapEnable = False
+        # The state of every sensor
+        self.errorEMA = np.zeros(nb_sensors)
+        self.sleeping = np.zeros(nb_sensors, dtype=bool)
+        self.smoothValue = np.zeros(nb_sensors)
+        self.all_valid = np.ones(nb_sensors, dtype=bool)
+        if scalar is None:
+            scalar = nb_sensors < SCALAR_SENSORS
+        # The scalar path filters with these, the arrays above stay the state of the bank
+        self.filters = [Filter() for _ in range(nb_sensors)] if scalar else None
+
+    def _filter_rows(self, rows, valid_rows):
+        """
+        The scalar path: filters rows of python values with a Filter per sensor. The filters get the settings and the
+        state of the arrays before, and the arrays get the new state after.
+        :param valid_rows: Which values are valid, a list of rows of booleans. None if all are.
+        """
+        filters = self.filters
+        for fil, error, sleeping, smooth in zip(filters, self.errorEMA.tolist(), self.sleeping.tolist(),
+                                                self.smoothValue.tolist()):
+            fil.sleepEnable = self.sleepEnable
+            fil.activityThreshold = self.activityThreshold
+            fil.analogResolution = self.analogResolution
+            fil.snapMultiplier = self.snapMultiplier
+            fil.snapEnable = self.snapEnable
+            fil.errorEMA = error
+            fil.sleeping = sleeping
+            fil.smoothValue = smooth
+        if valid_rows is None:
+            filtered = [[fil.filter_value(value) for fil, value in zip(filters, values)] for values in rows]
+        else:
+            filtered = [[fil.filter_value(value) if ok else 0 for fil, value, ok in zip(filters, values, valid)]
+                        for values, valid in zip(rows, valid_rows)]
+        self.errorEMA[:] = [fil.errorEMA for fil in filters]
+        self.sleeping[:] = [fil.sleeping for fil in filters]
+        self.smoothValue[:] = [fil.smoothValue for fil in filters]
+        return filtered
+
+    def filter_values(self, new_values, valid=None):
+        """
+        Updates the filters of all sensors with one sample. The same as calling Filter.filter_value for every sensor.
+        :param new_values: The current measurement data, one value per sensor
+        :param valid: Which values are valid, None if all are. The filter of an invalid value isn't updated.
+        :return: The new filtered values (integers), 0 for invalid values
+        """
+        new_values = np.asarray(new_values, dtype=float)
+        if self.filters is not None:
+            valid_rows = None if valid is None else [np.asarray(valid, dtype=bool).tolist()]
+            return np.array(self._filter_rows([new_values.tolist()], valid_rows)[0], dtype=int)
+        if valid is None:
+            valid = self.all_valid
+        else:
+            valid = np.asarray(valid, dtype=bool)
+        # Edge snapping, see Filter.filter_value
+        if self.sleepEnable and self.snapEnable:
+            low = new_values < self.activityThreshold
+            high = new_values > self.analogResolution - self.activityThreshold
+            new_values = np.where(low, (new_values * 2) - self.activityThreshold,
+                                  np.where(high, (new_values * 2) - self.analogResolution + self.activityThreshold,
+                                           new_values))
+        delta = new_values - self.smoothValue
+        diff = np.abs(delta)
+        # Small arrays: in place operations with where= are a lot faster than np.where and np.clip
+        np.copyto(self.errorEMA, self.errorEMA + (delta - self.errorEMA) * 0.4, where=valid)
+        # Only the filters that are awake (and have a valid value) are updated
+        update = valid
+        if self.sleepEnable:
+            np.copyto(self.sleeping, np.abs(self.errorEMA) < self.activityThreshold, where=valid)
+            update = valid & ~self.sleeping
+        snap = snap_curves(diff * self.snapMultiplier)
+        if self.sleepEnable:
+            snap *= 0.5 + 0.5
+        smooth = self.smoothValue + delta * snap
+        np.maximum(smooth, 0.0, out=smooth)
+        np.minimum(smooth, self.analogResolution - 1, out=smooth)
+        np.copyto(self.smoothValue, smooth, where=update)
+        filtered = self.smoothValue.astype(int)
+        filtered[~valid] = 0
+        return filtered
+
+    def filter_block(self, block, valid=None):
+        """
+        Filters several samples, for example all samples that were received since the last drawn frame.
+        :param block: Array with shape (samples, sensors), oldest sample first
+        :param valid: Array with the same shape, which values are valid. None if all are.
+        :return: The filtered values, with the same shape as block
+        """
+        block = np.asarray(block, dtype=float)
+        if self.filters is not None:
+            # Python lists, reading numpy arrays one element at a time is slow
+            valid_rows = None if valid is None else np.asarray(valid, dtype=bool).tolist()
+            return np.array(self._filter_rows(block.tolist(), valid_rows), dtype=int).reshape(block.shape)
+        filtered = np.zeros(block.shape, dtype=int)
+        for row in range(len(block)):
+            filtered[row] = self.filter_values(block[row], None if valid is None else valid[row])
+        return filtered
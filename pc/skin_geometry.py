@@ -0,0 +1,112 @@
+"""
+This file describes where the sensors are on the skin, so they can be drawn as an image (see read_multi_udp_heatmap.py).
+
+The skin is a grid of rows x columns cells (taxels). Every sensor is in one cell. A sensor is identified by its node
+(the raspberry pi, see skin_aggregator.py) and its place in the frames of that node. The stream scripts send the
+sensors sorted by bus, multiplexer and channel (see discovery.py), so a sensor can also be described by its bus,
+multiplexer address and channel: the place is then the position in that order among the sensors of the node.
+
+A geometry file is JSON:
+    {
+        "rows": 2,
+        "columns": 8,
+        "sensors": [
+            {"node": 0, "sensor": 0, "row": 0, "column": 0},
+            {"node": 0, "bus": 1, "mux": 112, "channel": 1, "row": 0, "column": 1},
+            ...
+        ]
+    }
+node defaults to 0 and bus to 1. Use one way of describing the sensors per node.
+"""
+import json
+from collections import OrderedDict
+
+import numpy as np
+
+
+class SkinGeometry(object):
+    """The cell of every sensor, and the global sensor index of every cell."""
+
+    def __init__(self, rows, columns, positions):
+        """
+        :param rows: The number of rows of the grid
+        :param columns: The number of columns of the grid
+        :param positions: A list of (node, sensor, row, column)
+        """
+        self.rows = rows
+        self.columns = columns
+        self.positions = list(positions)
+        # The sensors of a node are numbered 0 .. highest sensor, also when some have no cell
+        counts = OrderedDict()
+        for node, sensor, row, column in sorted(self.positions):
+            if not (0 <= row < rows and 0 <= column < columns):
+                raise ValueError("Sensor %d of node %d is outside the grid" % (sensor, node))
+            counts[node] = max(counts.get(node, 0), sensor + 1)
+        # The same global index as SkinAggregator with this layout: the nodes after each other
+        self.offsets = {}
+        offset = 0
+        for node, count in counts.items():
+            self.offsets[node] = offset
+            offset += count
+        self.nodes = list(counts.items())
+        self.nb_sensors = offset
+        self.sensors = np.array([self.offsets[node] + sensor for node, sensor, _, _ in self.positions], dtype=int)
+        self.cells = np.array([row * columns + column for _, _, row, column in self.positions], dtype=int)
+
+    def layout(self):
+        """
+        :return: The list of (node, number of sensors) for SkinAggregator
+        """
+        return list(self.nodes)
+
+    def global_index(self, node, sensor):
+        return self.offsets[node] + sensor
+
+    def to_image(self, values, valid=None, out=None):
+        """
+        Puts the values of the sensors in their cells. Cells without a sensor or with an invalid value become NaN.
+        :param values: The value of every sensor, in the global index
+        :param valid: Whether the values are valid, None if all are
+        :param out: The array of shape (rows, columns) to fill, a new one is made when None
+        :return: The image
+        """
+        if out is None:
+            out = np.empty((self.rows, self.columns))
+        out.fill(np.nan)
+        flat = out.reshape(-1)
+        if valid is None:
+            flat[self.cells] = values[self.sensors]
+        else:
+            flat[self.cells] = np.where(valid[self.sensors], values[self.sensors], np.nan)
+        return out
+
+
+def grid_geometry(count, columns, node=0):
+    """
+    The sensors of one node in a grid, row after row.
+    :param count: The number of sensors
+    :param columns: The number of columns of the grid
+    """
+    rows = max((count + columns - 1) // columns, 1)
+    return SkinGeometry(rows, columns, [(node, sensor, sensor // columns, sensor % columns) for sensor in range(count)])
+
+
+def load_geometry(path):
+    """Reads a geometry file, see the top of this file."""
+    with open(path) as geometry_file:
+        description = json.load(geometry_file)
+    positions = []
+    by_channel = {}  # node -> [((bus, mux, channel), row, column)]
+    for sensor in description["sensors"]:
+        node = sensor.get("node", 0)
+        if "sensor" in sensor:
+            positions.append((node, sensor["sensor"], sensor["row"], sensor["column"]))
+        else:
+            # Sorted like discovery.sort_key, a sensor that is connected directly has no mux and channel
+            key = (sensor.get("bus", 1), -1 if sensor.get("mux") is None else sensor["mux"],
+                   -1 if sensor.get("channel") is None else sensor["channel"])
+            by_channel.setdefault(node, []).append((key, sensor["row"], sensor["column"]))
+    for node, sensors in by_channel.items():
+        for index, (_, row, column) in enumerate(sorted(sensors)):
+            positions.append((node, index, row, column))
+    return SkinGeometry(description["rows"], description["columns"], positions)
@@ -0,0 +1,70 @@
+"""
+Checks that a FilterBank gives the same output as a Filter per sensor, with numpy arrays and with its scalar path.
+Run with: python -m pytest pc (or python -m unittest test_skin_filter from this directory)
+"""
+import unittest
+
+import numpy as np
+
+from filter_benchmark import filter_scalar, make_samples
+from skin_filter import SCALAR_SENSORS, FilterBank
+
+
+class FilterBankTest(unittest.TestCase):
+    def check_block(self, sensors, scalar, sleep_enable, snap_enable):
+        values, valid = make_samples(500, sensors, seed=sensors)
+        # Values near both edges, so edge snapping is used
+        values[::7] = 1
+        values[3::11] = 99
+        expected = filter_scalar(values, valid, sleep_enable, snap_enable)
+        bank = FilterBank(sensors, scalar)
+        bank.sleepEnable = sleep_enable
+        bank.snapEnable = snap_enable
+        filtered = bank.filter_block(values, valid)
+        self.assertEqual(filtered.shape, values.shape)
+        np.testing.assert_array_equal(filtered, expected)
+        # Invalid values give 0
+        self.assertFalse(filtered[~valid].any())
+
+    def test_filter_block(self):
+        for sensors in (1, 8, 40):
+            for scalar in (False, True):
+                for sleep_enable in (True, False):
+                    for snap_enable in (False, True):
+                        self.check_block(sensors, scalar, sleep_enable, snap_enable)
+
+    def test_all_valid(self):
+        values, _ = make_samples(200, 4)
+        expected = filter_scalar(values, np.ones(values.shape, dtype=bool))
+        for scalar in (False, True):
+            np.testing.assert_array_equal(FilterBank(4, scalar).filter_block(values), expected)
+
+    def test_filter_values(self):
+        values, valid = make_samples(200, 4)
+        expected = filter_scalar(values, valid)
+        for scalar in (False, True):
+            bank = FilterBank(4, scalar)
+            filtered = np.array([bank.filter_values(values[row], valid[row]) for row in range(len(values))])
+            np.testing.assert_array_equal(filtered, expected)
+
+    def test_state(self):
+        """The scalar path keeps the state arrays the same as the vectorized path."""
+        values, valid = make_samples(300, 4)
+        banks = [FilterBank(4, scalar) for scalar in (False, True)]
+        for bank in banks:
+            bank.filter_block(values[:150], valid[:150])
+            for row in range(150, len(values)):
+                bank.filter_values(values[row], valid[row])
+        vectorized, scalar = banks
+        self.assertTrue(vectorized.smoothValue.any())
+        np.testing.assert_allclose(scalar.smoothValue, vectorized.smoothValue)
+        np.testing.assert_allclose(scalar.errorEMA, vectorized.errorEMA)
+        np.testing.assert_array_equal(scalar.sleeping, vectorized.sleeping)
+
+    def test_crossover(self):
+        self.assertIsNotNone(FilterBank(SCALAR_SENSORS - 1).filters)
+        self.assertIsNone(FilterBank(SCALAR_SENSORS).filters)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,179 @@
+"""
+This file contains the UdpReceiver, a thread that receives the frames of the raspberry pi.
+It reads every datagram as soon as it arrives, decodes it and puts it in a queue. The plot takes all frames that are
+waiting whenever it draws, at its own pace. So the plot never falls behind when the raspberry sends faster than
+matplotlib draws, and the kernel buffer doesn't fill up.
+
+Counters:
+ - received: frames that were decoded, a datagram can hold several frames (see batch_sender.py)
+ - dropped: frames that never reach the plot: missing sequence numbers plus frames thrown away because the queue was full
+   The sequence numbers are followed per node, so several raspberry pis (or load generator senders) can send to one port.
+ - late: frames that arrived after a newer frame (out of order), these are thrown away
+ - errors: datagrams that could not be decoded
+The counters of the skin_frame.FrameDecoder (delta frames, frames without keyframe, compression) are added to stats.
+
+The frames of several raspberry pis are told apart by their node id (NODE in the stream scripts). Raspberry pis that
+all send node 0, or the old ASCII strings that have no node id, can be told apart by their address instead: with
+node_by_address the node of a frame becomes the number of its sender address, in the order they were first seen.
+
+With a reorder.ReorderBuffer the frames of every node are put back in order and duplicates are thrown away before they
+are queued. The counters of the buffer are added to stats, dropped then counts the lost frames.
+"""
+import os
+import socket
+import sys
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "raspberry", "python"))
+import skin_frame
+
+
+class UdpReceiver(threading.Thread):
+    """Receives and decodes frames in the background."""
+
+    def __init__(self, sock, rcvbuf=None, queue_size=10000, tracer=None, node_by_address=False, reorder=None):
+        """
+        :param sock: A bound UDP socket
+        :param rcvbuf: The size of the kernel receive buffer in bytes (SO_RCVBUF), None keeps the default
+        :param queue_size: The maximum number of frames that wait for the plot. Older frames are dropped.
+        :param tracer: A latency_trace.LatencyTracer that gets the receive and decode time of every frame, or None
+        :param node_by_address: Replace the node id of every frame by the number of its sender address
+        :param reorder: A reorder.ReorderBuffer that the frames go through, or None
+        """
+        threading.Thread.__init__(self, name="udp-receiver")
+        self.daemon = True
+        self.sock = sock
+        if rcvbuf is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        self.rcvbuf = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        sock.settimeout(0.2)  # So the thread can be stopped
+        self.frames = deque()
+        self.queue_size = queue_size
+        self.running = False
+        self.first_frame = threading.Event()
+        self.tracer = tracer
+        self.reorder = reorder
+        self.decoder = skin_frame.FrameDecoder()  # Keeps the keyframes of the delta encoded streams
+        self.next_seq = {}  # node -> the sequence number that is expected next
+        self.node_by_address = node_by_address
+        self.sources = {}  # (ip, port) -> node, of every address that sent a frame
+        # Counters
+        self.received = 0
+        self.dropped = 0
+        self.overflow = 0
+        self.late = 0
+        self.errors = 0
+
+    def run(self):
+        self.running = True
+        while self.running:
+            try:
+                data, address = self.sock.recvfrom(skin_frame.MAX_DATAGRAM)
+                received_time = time.time()
+            except socket.timeout:
+                if self.reorder is not None:
+                    # Frames that wait for a lost frame should not wait until the next frame arrives
+                    for released in self.reorder.poll(time.time()):
+                        self.put(released)
+                continue
+            except socket.error:
+                if not self.running:
+                    return
+                raise
+            try:
+                frames = self.decoder.decode_all(data, address)
+            except ValueError:
+                self.errors += 1
+                continue
+            decoded_time = time.time()
+            for frame in frames:
+                self.handle(frame, address, received_time, decoded_time)
+
+    def handle(self, frame, address, received_time, decoded_time):
+        """Checks the sequence number of a received frame and queues it."""
+        self.received += 1
+        node = self.sources.get(address)
+        if node is None:
+            node = len(self.sources) if self.node_by_address else frame.node
+            self.sources[address] = node
+        if self.node_by_address:
+            frame = frame._replace(node=node)
+        if self.tracer is not None:
+            self.tracer.received(frame, received_time, decoded_time)
+        if self.reorder is not None:
+            for released in self.reorder.push(frame, received_time):
+                self.put(released)
+            return
+        if frame.seq is not None:
+            next_seq = self.next_seq.get(frame.node)
+            if next_seq is not None:
+                gap = (frame.seq - next_seq) & 0xFFFFFFFF
+                if gap >= 0x80000000:  # The sequence number is older than the newest frame
+                    self.late += 1
+                    return
+                self.dropped += gap
+            self.next_seq[frame.node] = (frame.seq + 1) & 0xFFFFFFFF
+        self.put(frame)
+
+    def put(self, frame):
+        if len(self.frames) >= self.queue_size:
+            self.frames.popleft()
+            self.dropped += 1
+            self.overflow += 1
+        self.frames.append(frame)
+        self.first_frame.set()
+
+    def stop(self):
+        self.running = False
+        self.join()
+
+    def wait_first_frame(self, timeout=None):
+        """
+        Waits until a frame is received, without taking it from the queue.
+        :return: The first frame, None after a timeout
+        """
+        if not self.first_frame.wait(timeout):
+            return None
+        return self.frames[0]
+
+    def drain(self):
+        """
+        Takes all frames that are waiting.
+        :return: A list of frames, oldest first
+        """
+        frames = []
+        try:
+            while True:
+                frames.append(self.frames.popleft())
+        except IndexError:
+            return frames
+
+    def stats(self):
+        stats = {"received": self.received, "dropped": self.dropped, "overflow": self.overflow,
+                 "late": self.late, "errors": self.errors, "queued": len(self.frames), "rcvbuf": self.rcvbuf,
+                 "sources": len(self.sources)}
+        stats.update(self.decoder.stats())
+        if self.reorder is not None:
+            stats.update(self.reorder.stats())
+            stats["dropped"] = stats["lost"] + self.overflow
+        return stats
+
+
+def frames_to_arrays(frames, count):
+    """
+    Puts the distances of frames in one array.
+    :param frames: skin_frame.Frame objects, for example everything UdpReceiver.drain returned
+    :param count: The number of sensors. Missing sensors stay 0 and invalid, extra sensors are ignored.
+    :return: (distances, valid), arrays with a row per frame
+    """
+    distances = np.zeros((len(frames), count))
+    valid = np.zeros((len(frames), count), dtype=bool)
+    for row, frame in enumerate(frames):
+        received = min(len(frame.distances), count)
+        distances[row, :received] = frame.distances[:received]
+        valid[row, :received] = frame.valid[:received]
+    return distances, valid
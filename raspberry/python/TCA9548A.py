@@ -0,0 +1,83 @@
+"""
+This file contains the TCA9548A object, that keeps track of the selected channels of all TCA9548A multiplexers on one I2C bus.
+Selecting a channel costs an I2C transaction, so it is only written when a different channel is needed.
+Use get_multiplexer to get the shared object of a bus, so all sensors on that bus use the same state.
+"""
+
+_multiplexers = {}
+
+
+def get_multiplexer(i2c):
+    """
+    Returns the TCA9548A object for an I2C bus. Every sensor on the same bus gets the same object.
+    :param i2c: The bus object (smbus.SMBus or compatible)
+    :return: The TCA9548A object
+    """
+    multiplexer = _multiplexers.get(i2c)
+    if multiplexer is None:
+        multiplexer = TCA9548A(i2c)
+        _multiplexers[i2c] = multiplexer
+    return multiplexer
+
+
+class TCA9548A(object):
+    """The selected channels of all TCA9548A multiplexers on one I2C bus."""
+
+    def __init__(self, i2c):
+        self.i2c = i2c
+        # Multiplexer address -> control byte that is currently written. Unknown addresses are not in here.
+        self.selected = {}
+        # Transaction counters
+        self.writes = 0
+        self.skipped = 0
+
+    def select(self, address, channel):
+        """
+        Selects a channel of a multiplexer, if it isn't already selected.
+        Other multiplexers on the bus that have a channel open are closed first, so only one device answers.
+        :param address: The I2C address of the multiplexer (0x70 - 0x77)
+        :param channel: The channel (0 - 7)
+        """
+        control = 1 << channel
+        if self.selected.get(address) == control:
+            self.skipped += 1
+            return
+        for other, other_control in list(self.selected.items()):
+            if other != address and other_control != 0:
+                self._write(other, 0)
+        self._write(address, control)
+
+    def deselect(self, address):
+        """
+        Closes all channels of a multiplexer.
+        :param address: The I2C address of the multiplexer
+        """
+        if self.selected.get(address) == 0:
+            self.skipped += 1
+            return
+        self._write(address, 0)
+
+    def invalidate(self, address=None):
+        """
+        Forgets the selected channel, so the next select writes it again. Call this after an IOError.
+        :param address: The multiplexer to forget, None for all multiplexers on the bus
+        """
+        if address is None:
+            self.selected.clear()
+        else:
+            self.selected.pop(address, None)
+
+    def stats(self):
+        """
+        :return: The number of channel writes that were done and that were skipped
+        """
+        return {"writes": self.writes, "skipped": self.skipped}
+
+    def _write(self, address, control):
+        try:
+            self.i2c.write_i2c_block_data(address, control, [])
+        except IOError:
+            self.invalidate(address)
+            raise
+        self.writes += 1
+        self.selected[address] = control
@@ -28,8 +28,16 @@ http://www.st.com/en/embedded-software/stsw-img005.html
 """
 import os
 import sys
+import threading
 from ctypes import *
-import smbus
+
+try:
+    import smbus
+except ImportError:  # Not on a raspberry pi, only a simulated bus can be used (see sim_bus.py and set_i2c_bus)
+    smbus = None
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import i2c_rdwr
 
 VL53L0X_GOOD_ACCURACY_MODE = 0  # Good Accuracy mode
 VL53L0X_BETTER_ACCURACY_MODE = 1  # Better Accuracy mode
@@ -37,14 +45,73 @@ VL53L0X_BEST_ACCURACY_MODE = 2  # Best Accuracy mode
 VL53L0X_LONG_RANGE_MODE = 3  # Long Range mode
 VL53L0X_HIGH_SPEED_MODE = 4  # High Speed mode
 
-i2cbus = smbus.SMBus(1)
+# "smbus" or "rdwr". rdwr does every register access of the ST library in one combined I2C_RDWR transaction
+# and has no 32 byte limit on block reads, see i2c_rdwr.py. Set this before the first sensor is created.
+I2C_BACKEND = "smbus"
+# The ST library with the python interface, relative to the directory the scripts are run from
+LIBRARY_PATH = "../bin/vl53l0x_python.so"
+
+
+def open_i2c_bus(bus):
+    if I2C_BACKEND == "rdwr":
+        return i2c_rdwr.I2CRdwrBus(bus)
+    return smbus.SMBus(bus)
+
+
+# The buses are opened when they are first used, so I2C_BACKEND can still be set after the import.
+# The callbacks of the ST library only get the device address, not the bus. Every VL53L0X object therefore puts
+# its bus in a thread local variable before it calls the library, so sensors on different buses can be used from
+# different threads (see acquisition.py). Threads that never set it use bus 1.
+_i2c_buses = {}
+_thread_bus = threading.local()
+# The ST library isn't reentrant: it keeps static state, like the one measurement buffer getDistance fills, and ctypes
+# releases the GIL during a call. Every call into tof_lib holds this lock, so the threads of different buses take turns.
+tof_lock = threading.Lock()
+
+
+def get_i2c_bus(bus=1):
+    """
+    Returns the bus object of a bus, all sensors on the same bus share it.
+    """
+    i2c = _i2c_buses.get(bus)
+    if i2c is None:
+        i2c = open_i2c_bus(bus)
+        _i2c_buses[bus] = i2c
+    return i2c
+
+
+def use_bus(bus=1):
+    """
+    Makes the i2c callbacks of the current thread use a bus.
+    :return: The (bus object, direct_io) tuple the callbacks use. direct_io tells whether the bus can read into and
+    write from the buffers of the ST library directly (i2c_rdwr.I2CRdwrBus).
+    """
+    i2c = get_i2c_bus(bus)
+    _thread_bus.current = (i2c, hasattr(i2c, "read_register_into"))
+    return _thread_bus.current
+
+
+def set_i2c_bus(bus, i2c):
+    """
+    Uses an existing bus object for a bus number, for example a simulated bus of sim_bus.py.
+    Call this before the sensors on that bus are created.
+    """
+    _i2c_buses[bus] = i2c
+    # The current thread picks the bus again at its next callback
+    _thread_bus.current = None
+
+
+# Array types per length, used to view data_p as an array so it can be filled with one slice assignment
+_data_views = [POINTER(c_ubyte * length) for length in range(256)]
 
 
 # i2c bus read callback
 def i2c_read(address, reg, data_p, length):
     """
     This i2c read function for the entire ST library. Each function of the ST library uses this function to communicate with the VL53L0x chip.
-    Currently uses the smbus library for i2c communication.
+    Uses the smbus library or the combined transactions of i2c_rdwr for i2c communication (see I2C_BACKEND).
+    The ST library calls this many times per measurement, so the data is copied in bulk: with rdwr the kernel
+    reads straight into data_p, with smbus the result list is copied into data_p with one slice assignment.
 
     :param address: The address of the device
     :param reg: The registry address in the device
@@ -52,26 +119,25 @@ def i2c_read(address, reg, data_p, length):
     :param length: The length of the data
     :return: The return value. See implementation
     """
-    ret_val = 0
-    result = []
-
+    i2c, direct = getattr(_thread_bus, "current", None) or use_bus()
     try:
-        result = i2cbus.read_i2c_block_data(address, reg, length)
+        if direct:
+            i2c.read_register_into(address, reg, data_p, length)
+        else:
+            result = i2c.read_i2c_block_data(address, reg, length)
+            cast(data_p, _data_views[length]).contents[:] = result
     except IOError:
-        ret_val = -1
-
-    if ret_val == 0:
-        for index in range(length):
-            data_p[index] = result[index]
-
-    return ret_val
+        return -1
+    return 0
 
 
 # i2c bus write callback
 def i2c_write(address, reg, data_p, length):
     """
     This i2c write function for the entire ST library. Each function of the ST library uses this function to communicate with the VL53L0x chip.
-    Currently uses the smbus library for i2c communication.
+    Uses the smbus library or the combined transactions of i2c_rdwr for i2c communication (see I2C_BACKEND).
+    With rdwr the data is copied from data_p into a preallocated message with memmove,
+    with smbus it is taken from data_p with one slice.
 
     :param address: The address of the device
     :param reg: The registry address in the device
@@ -79,22 +145,17 @@ def i2c_write(address, reg, data_p, length):
     :param length: The length of the data
     :return: The return value. See implementation
     """
-    ret_val = 0
-    data = []
-
-    for index in range(length):
-        data.append(data_p[index])
+    i2c, direct = getattr(_thread_bus, "current", None) or use_bus()
     try:
-        i2cbus.write_i2c_block_data(address, reg, data)
+        if direct:
+            i2c.write_register_from(address, reg, data_p, length)
+        else:
+            i2c.write_i2c_block_data(address, reg, data_p[:length])
     except IOError:
-        ret_val = -1
-
-    return ret_val
+        return -1
+    return 0
 
 
-# Load VL53L0X shared lib
-tof_lib = CDLL("../bin/vl53l0x_python.so")
-
 # Create read function pointer
 READFUNC = CFUNCTYPE(c_int, c_ubyte, c_ubyte, POINTER(c_ubyte), c_ubyte)
 read_func = READFUNC(i2c_read)
@@ -103,8 +164,27 @@ read_func = READFUNC(i2c_read)
 WRITEFUNC = CFUNCTYPE(c_int, c_ubyte, c_ubyte, POINTER(c_ubyte), c_ubyte)
 write_func = WRITEFUNC(i2c_write)
 
-# pass i2c read and write function pointers to VL53L0X library
-tof_lib.VL53L0X_set_i2c(read_func, write_func)
+
+def load_library(library=LIBRARY_PATH):
+    """
+    Loads the VL53L0X library and passes it the i2c read and write function pointers.
+    :param library: The path of the shared library, or an object with the same functions
+                    (for example sim_bus.SimVL53L0XLibrary, to run without a raspberry pi)
+    :return: The library
+    """
+    global tof_lib
+    if isinstance(library, str):
+        library = CDLL(library)
+    library.VL53L0X_set_i2c(read_func, write_func)
+    tof_lib = library
+    return tof_lib
+
+
+# Load VL53L0X shared lib
+try:
+    tof_lib = load_library()
+except OSError:  # The library isn't built. Call load_library with a stand-in before the sensors are used.
+    tof_lib = None
 
 
 class VL53L0X(object):
@@ -112,33 +192,77 @@ class VL53L0X(object):
 
     object_number = 0
 
-    def __init__(self, address=0x29, TCA9548A_Num=255, TCA9548A_Addr=0, **kwargs):
+    def __init__(self, address=0x29, TCA9548A_Num=255, TCA9548A_Addr=0, bus=1, **kwargs):
         """Initialize the VL53L0X ToF Sensor from ST"""
+        self.bus = bus
+        self.bus_state = None
         self.device_address = address
         self.TCA9548A_Device = TCA9548A_Num
         self.TCA9548A_Address = TCA9548A_Addr
         self.my_object_number = VL53L0X.object_number
         VL53L0X.object_number += 1
 
+    def use_bus(self):
+        """Makes the i2c callbacks of the current thread use the bus of this sensor."""
+        if self.bus_state is None:
+            self.bus_state = use_bus(self.bus)
+        else:
+            _thread_bus.current = self.bus_state
+
     def start_ranging(self, mode=VL53L0X_GOOD_ACCURACY_MODE):
         """Start VL53L0X ToF Sensor Ranging"""
-        tof_lib.startRanging(self.my_object_number, mode, self.device_address, self.TCA9548A_Device, self.TCA9548A_Address)
+        self.use_bus()
+        with tof_lock:
+            tof_lib.startRanging(self.my_object_number, mode, self.device_address, self.TCA9548A_Device,
+                                 self.TCA9548A_Address)
 
     def stop_ranging(self):
         """Stop VL53L0X ToF Sensor Ranging"""
-        tof_lib.stopRanging(self.my_object_number)
+        self.use_bus()
+        with tof_lock:
+            tof_lib.stopRanging(self.my_object_number)
 
     def get_distance(self):
         """Get distance from VL53L0X ToF Sensor"""
-        return tof_lib.getDistance(self.my_object_number)
+        self.use_bus()
+        with tof_lock:
+            return tof_lib.getDistance(self.my_object_number)
+
+    def select_channel(self):
+        """
+        Selects the TCA9548A channel of this sensor. The simplified interface of the library does this itself,
+        the functions of the ST API that are called through getDev don't.
+        """
+        if self.TCA9548A_Device <= 7:
+            get_i2c_bus(self.bus).write_byte(self.TCA9548A_Address, 1 << self.TCA9548A_Device)
+
+    def data_ready(self):
+        """
+        Asks the sensor whether a new measurement is ready, with VL53L0X_GetMeasurementDataReady of the ST API.
+        When it is, get_distance returns it without waiting.
+        :return: True if a new measurement is ready
+        :raise IOError: When the sensor doesn't answer
+        """
+        self.use_bus()
+        self.select_channel()
+        with tof_lock:
+            dev = tof_lib.getDev(self.my_object_number)
+            ready = c_ubyte(0)
+            ready_p = pointer(ready)
+            status = tof_lib.VL53L0X_GetMeasurementDataReady(dev, ready_p)
+        if status != 0:
+            raise IOError("VL53L0X_GetMeasurementDataReady failed with status %d" % status)
+        return ready.value != 0
 
     # This function included to show how to access the ST library directly
     # from python instead of through the simplified interface
     def get_timing(self):
-        dev = tof_lib.getDev(self.my_object_number)
-        budget = c_uint(0)
-        budget_p = pointer(budget)
-        status = tof_lib.VL53L0X_GetMeasurementTimingBudgetMicroSeconds(dev, budget_p)
+        self.use_bus()
+        with tof_lock:
+            dev = tof_lib.getDev(self.my_object_number)
+            budget = c_uint(0)
+            budget_p = pointer(budget)
+            status = tof_lib.VL53L0X_GetMeasurementTimingBudgetMicroSeconds(dev, budget_p)
         if status == 0:
             return budget.value + 1000
         else:
@@ -151,12 +275,14 @@ class VL53L0X(object):
         :return: The status
         """
         print ("Performing SPAD calibration")
-        dev = tof_lib.getDev(self.my_object_number)
-        spad_count = c_uint(0)
-        p_spad_count = pointer(spad_count)
-        is_aperture_spads = c_uint(0)
-        p_is_aperture_spads = pointer(is_aperture_spads)
-        status = tof_lib.VL53L0X_PerformRefSpadManagement(dev, p_spad_count, p_is_aperture_spads)
+        self.use_bus()
+        with tof_lock:
+            dev = tof_lib.getDev(self.my_object_number)
+            spad_count = c_uint(0)
+            p_spad_count = pointer(spad_count)
+            is_aperture_spads = c_uint(0)
+            p_is_aperture_spads = pointer(is_aperture_spads)
+            status = tof_lib.VL53L0X_PerformRefSpadManagement(dev, p_spad_count, p_is_aperture_spads)
         if status == 0:
             return "SpadCount: " + str(spad_count.value) + " IsApertureSpads: " + str(is_aperture_spads.value)
         return str(status)
@@ -168,12 +294,14 @@ class VL53L0X(object):
         :return: The status
         """
         print ("Getting SPAD settings")
-        Dev = tof_lib.getDev(self.my_object_number)
-        SpadCount = c_uint(0)
-        pSpadCount = pointer(SpadCount)
-        IsApertureSpads = c_uint(0)
-        pIsApertureSpads = pointer(IsApertureSpads)
-        status = tof_lib.VL53L0X_GetReferenceSpads(Dev, pSpadCount, pIsApertureSpads)
+        self.use_bus()
+        with tof_lock:
+            Dev = tof_lib.getDev(self.my_object_number)
+            SpadCount = c_uint(0)
+            pSpadCount = pointer(SpadCount)
+            IsApertureSpads = c_uint(0)
+            pIsApertureSpads = pointer(IsApertureSpads)
+            status = tof_lib.VL53L0X_GetReferenceSpads(Dev, pSpadCount, pIsApertureSpads)
         if status == 0:
             return "SpadCount: " + str(SpadCount.value) + " IsApertureSpads: " + str(IsApertureSpads.value)
         return str(status)
@@ -185,43 +313,51 @@ class VL53L0X(object):
         :return: The status
         """
         print ("Performing REF calibration")
-        Dev = tof_lib.getDev(self.my_object_number)
-        VhvSettings = c_uint(0)
-        pVhvSettings = pointer(VhvSettings)
-        PhaseCal = c_uint(0)
-        pPhaseCal = pointer(PhaseCal)
-        status = tof_lib.VL53L0X_PerformRefCalibration(Dev, pVhvSettings, pPhaseCal)
+        self.use_bus()
+        with tof_lock:
+            Dev = tof_lib.getDev(self.my_object_number)
+            VhvSettings = c_uint(0)
+            pVhvSettings = pointer(VhvSettings)
+            PhaseCal = c_uint(0)
+            pPhaseCal = pointer(PhaseCal)
+            status = tof_lib.VL53L0X_PerformRefCalibration(Dev, pVhvSettings, pPhaseCal)
         if status == 0:
             return "VhvSettings: " + str(VhvSettings.value) + " PhaseCal: " + str(PhaseCal.value)
         return str(status)
 
     def do_Offset_calibration(self, distanceInMm=100):
         print ("Performing Offset Calibration")
-        Dev = tof_lib.getDev(self.my_object_number)
-        distance = c_uint(distanceInMm << 16)
-        Offset = c_uint(0)
-        pOffset = pointer(Offset)
-        Status = tof_lib.VL53L0X_PerformOffsetCalibration(Dev, distance, pOffset)
+        self.use_bus()
+        with tof_lock:
+            Dev = tof_lib.getDev(self.my_object_number)
+            distance = c_uint(distanceInMm << 16)
+            Offset = c_uint(0)
+            pOffset = pointer(Offset)
+            Status = tof_lib.VL53L0X_PerformOffsetCalibration(Dev, distance, pOffset)
         if Status == 0:
             return "Offset: " + str(Offset.value)
         return "Error"
 
     def do_XTalk_calibration(self, distanceInMm=500):
         print ("Performing XTalk Calibration")
-        Dev = tof_lib.getDev(self.my_object_number)
-        distance = c_uint(distanceInMm << 16)
-        CompRate = c_uint(0)
-        pCompRate = pointer(CompRate)
-        Status = tof_lib.VL53L0X_PerformXTalkCalibration(Dev, distance, pCompRate)
+        self.use_bus()
+        with tof_lock:
+            Dev = tof_lib.getDev(self.my_object_number)
+            distance = c_uint(distanceInMm << 16)
+            CompRate = c_uint(0)
+            pCompRate = pointer(CompRate)
+            Status = tof_lib.VL53L0X_PerformXTalkCalibration(Dev, distance, pCompRate)
         if Status == 0:
             return "XTalk Compensation Rate: " + str(CompRate.value)
         return "Error"
 
     def change_Address(self, address=0x29):
         print ("Changing device address to " + str(address))
-        Dev = tof_lib.getDev(self.my_object_number)
-        cAddress = c_uint(address)
-        Status = tof_lib.VL53L0X_SetDeviceAddress(Dev, cAddress)
+        self.use_bus()
+        with tof_lock:
+            Dev = tof_lib.getDev(self.my_object_number)
+            cAddress = c_uint(address)
+            Status = tof_lib.VL53L0X_SetDeviceAddress(Dev, cAddress)
         if (Status == 0):
             return "Changed device address to " + str(address)
         return "Error"
@@ -22,18 +22,48 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 """
-This file automatically detects VL53L0X sensors that are connected to the TCA9545A on the I2C address 0x70 and streams their data to the pc.
+This file automatically detects VL53L0X sensors that are connected to TCA9548A multiplexers (0x70 - 0x77) and streams their data to the pc.
+The sensors that are found are kept in a cache file, so the next start is fast. Run with "rescan" to ignore the cache.
 """
+import os
 import socket
+import sys
 import time
 
 import VL53L0X
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import discovery
+import ring_consumer
+import skin_frame
+from batch_sender import BatchSender
+from acquisition import AcquisitionEngine
+from frame_ring import RING_PATH, FrameRing
+from rate_scheduler import RateScheduler
+from ready_scheduler import ReadyScheduler
+
 UDP_IP = "169.254.210.175"
 UDP_PORT = 5005
 MODE = VL53L0X.VL53L0X_BETTER_ACCURACY_MODE
+# Another mode for some sensors, by their index in the order they are found, e.g. {0: VL53L0X.VL53L0X_HIGH_SPEED_MODE}
+MODES = {}
+# Read every sensor as soon as its measurement is ready, with its own timing budget (see ready_scheduler.py).
+# False sleeps the timing budget of the first sensor before every frame.
+DATA_READY = True
+BUSES = [1]  # The I2C buses with sensors, e.g. [1, 3, 4]. Every bus is read by its own thread.
+TOPOLOGY_CACHE = "skin_topology.json"  # The file the found sensors are kept in
+RESCAN = len(sys.argv) > 1 and sys.argv[1] == "rescan"
+FRAME_FORMAT = skin_frame.FORMAT_BINARY  # Use skin_frame.FORMAT_ASCII for the old space separated strings
+TRACE = False  # Send the trace timestamps of every frame, for the latency tracing on the pc (see pc/latency_trace.py)
+NODE = 0  # The node id of this raspberry pi, give every raspberry pi of one skin its own id (see pc/skin_aggregator.py)
+BATCH_DELAY = 0  # s, the longest a frame waits to be sent with the next frames, 0 sends right away (see batch_sender.py)
+DELTA = False  # Only send the sensors that changed since the last keyframe, for many sensors on wifi (see skin_frame.py)
+RING = False  # Only write the frames in shared memory, separate processes send and record them (see frame_ring.py)
+RECORD_PREFIX = None  # With RING, also record the frames in files with this prefix (see skin_recorder.py)
+encoder = skin_frame.FrameEncoder(node=NODE, frame_format=FRAME_FORMAT, trace=TRACE, delta=DELTA)
 sock = socket.socket(socket.AF_INET,  # Internet
                      socket.SOCK_DGRAM)  # UDP
+sender = BatchSender(sock, (UDP_IP, UDP_PORT), encoder, max_delay=BATCH_DELAY)
 
 
 def get_connected_devices():
@@ -41,10 +71,13 @@ def get_connected_devices():
     print("Getting connected devices")
     print("=========================")
     connected = []
-    for x in xrange(0, 7):
-        tof = VL53L0X.VL53L0X(TCA9548A_Num=x, TCA9548A_Addr=0x70)
-        if tof.is_connected():
-            connected.append(VL53L0X.VL53L0X(TCA9548A_Num=x, TCA9548A_Addr=0x70))
+    for sensor in discovery.discover(BUSES, (discovery.VL53L0X,), TOPOLOGY_CACHE, VL53L0X.get_i2c_bus, RESCAN):
+        if sensor["mux"] is None:
+            connected.append(VL53L0X.VL53L0X(address=sensor["address"], bus=sensor["bus"]))
+        else:
+            connected.append(VL53L0X.VL53L0X(address=sensor["address"], TCA9548A_Num=sensor["channel"],
+                                             TCA9548A_Addr=sensor["mux"], bus=sensor["bus"]))
+    print("Found %d devices" % len(connected))
     return connected
 
 
@@ -53,8 +86,8 @@ def start_ranging(devices_to_start, mode=MODE):
     print("Starting Devices")
     print("================")
     time.sleep(1)
-    for device in devices_to_start:
-        device.start_ranging(mode)
+    for index, device in enumerate(devices_to_start):
+        device.start_ranging(MODES.get(index, mode))
 
 
 def stop_ranging(devices_to_stop):
@@ -65,32 +98,65 @@ def stop_ranging(devices_to_stop):
         device.stop_ranging()
 
 
-def stream(devices_to_stream):
-    string = ""
-    for device in devices_to_stream:
-        distance = device.get_distance()
-        if distance > 0:
-            string += str(distance) + " "
-        else:
-            string += "X"
-    sock.sendto(string, (UDP_IP, UDP_PORT))
+def stream(engine):
+    timestamp, distances = engine.read_frame()
+    if ring is not None:
+        ring.write(distances, timestamp)
+    else:
+        sender.send(encoder.encode(distances, timestamp))
+
+
+def start_consumers():
+    """Starts the processes that read the ring, before the threads of the engine start."""
+    consumers = [ring_consumer.start(ring_consumer.stream, RING_PATH, ring_consumer.STREAMER, (UDP_IP, UDP_PORT),
+                                     {"node": NODE, "frame_format": FRAME_FORMAT, "trace": TRACE, "delta": DELTA},
+                                     BATCH_DELAY)]
+    if RECORD_PREFIX is not None:
+        consumers.append(ring_consumer.start(ring_consumer.record, RING_PATH, ring_consumer.RECORDER, RECORD_PREFIX))
+    return consumers
 
 
 devices = get_connected_devices()
 start_ranging(devices)
 timing = devices[0].get_timing()
+scheduler = RateScheduler(timing / 1000000.00)
+ready_scheduler = ReadyScheduler(devices) if DATA_READY else None
+ring = None
+consumers = []
+if RING:
+    ring = FrameRing.create(RING_PATH, len(devices))
+    consumers = start_consumers()
+if ready_scheduler is not None:
+    engine = AcquisitionEngine(devices, ready_scheduler.read_bus)
+else:
+    engine = AcquisitionEngine(devices)
 print
 print("Streaming...")
 print
 
 try:
     while True:
-        stream(devices)
-        time.sleep(timing / 1000000.00)
+        if ready_scheduler is None:
+            scheduler.wait()
+        stream(engine)
 except KeyboardInterrupt:
     pass
+sender.close()
 
 print
 print("Logging done")
+if ring is not None:
+    print(ring.report())
+    ring.close()
+    for consumer in consumers:
+        consumer.join()
+else:
+    print(encoder.report())
+if ready_scheduler is not None:
+    print(ready_scheduler.report())
+else:
+    print(scheduler.report(timing))
+
+engine.stop()
 
 stop_ranging(devices)
@@ -21,17 +21,29 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
-
-import time
+"""
+This file records the distances of two VL53L0X sensors behind a TCA9548A in binary files.
+Failed measurements are recorded too, with status 0. See skin_recorder.py for the file format and how to load them.
+It runs until Ctrl-C, or for COUNT measurements.
+"""
+import os
+import sys
 
 import VL53L0X
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rate_scheduler import RateScheduler
+from skin_recorder import Recorder
+
+RECORD_PREFIX = "Output_TCA9548A"  # The files are called Output_TCA9548A_<start time>_<part>.skrec
+COUNT = None  # The number of measurements, None to run until Ctrl-C
+
 # Create a VL53L0X object for device on TCA9548A bus 1
 tof1 = VL53L0X.VL53L0X(TCA9548A_Num=1, TCA9548A_Addr=0x70)
 # Create a VL53L0X object for device on TCA9548A bus 2
 tof2 = VL53L0X.VL53L0X(TCA9548A_Num=2, TCA9548A_Addr=0x70)
 
-text_file = open("Output_TCA9548A.txt", "w")
+recorder = Recorder(RECORD_PREFIX, 2)
 # Start ranging on TCA9548A bus 1
 tof1.start_ranging(VL53L0X.VL53L0X_HIGH_SPEED_MODE)
 # Start ranging on TCA9548A bus 2
@@ -41,26 +53,22 @@ timing = tof1.get_timing()
 if (timing < 20000):
     timing = 20000
 print ("Timing %d ms" % (timing / 1000))
-print ("Logging data...")
-
-for count in range(1, 101):
-    # Get distance from VL53L0X  on TCA9548A bus 1
-    distance = tof1.get_distance()
-    if (distance > 0):
-        string = str(distance) + " "
-    else:
-        string = "X "
-    # Get distance from VL53L0X  on TCA9548A bus 2
-    distance = tof2.get_distance()
-    if (distance > 0):
-        string += str(distance)
-    else:
-        string += "X"
+print ("Logging data, press Ctrl-C to stop...")
+scheduler = RateScheduler(timing / 1000000.00)
 
-    text_file.write(string + '\n')
-    time.sleep(timing / 1000000.00)
+count = 0
+try:
+    while COUNT is None or count < COUNT:
+        scheduler.wait()
+        # Get distance from VL53L0X on TCA9548A bus 1 and 2
+        recorder.record([tof1.get_distance(), tof2.get_distance()])
+        count += 1
+except KeyboardInterrupt:
+    pass
 
-print
-print("Logging done")
+print("")
+print("Logging done, %d measurements in %s" % (count, ", ".join(recorder.files)))
+print(scheduler.report(timing))
 tof1.stop_ranging()
 tof2.stop_ranging()
+recorder.close()
@@ -22,11 +22,17 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import os
 import socket
-import time
+import sys
 
 import VL53L0X
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import skin_frame
+from batch_sender import BatchSender
+from rate_scheduler import RateScheduler
+
 # Create a VL53L0X object for device on TCA9548A bus 1
 tof1 = VL53L0X.VL53L0X(TCA9548A_Num=1, TCA9548A_Addr=0x70)
 # Create a VL53L0X object for device on TCA9548A bus 2
@@ -35,6 +41,13 @@ UDP_IP = "169.254.210.175"
 UDP_PORT = 5005
 sock = socket.socket(socket.AF_INET,  # Internet
                      socket.SOCK_DGRAM)  # UDP
+FRAME_FORMAT = skin_frame.FORMAT_BINARY  # Use skin_frame.FORMAT_ASCII for the old space separated strings
+TRACE = False  # Send the trace timestamps of every frame, for the latency tracing on the pc (see pc/latency_trace.py)
+NODE = 0  # The node id of this raspberry pi, give every raspberry pi of one skin its own id (see pc/skin_aggregator.py)
+BATCH_DELAY = 0  # s, the longest a frame waits to be sent with the next frames, 0 sends right away (see batch_sender.py)
+DELTA = False  # Only send the sensors that changed since the last keyframe, for many sensors on wifi (see skin_frame.py)
+encoder = skin_frame.FrameEncoder(node=NODE, frame_format=FRAME_FORMAT, trace=TRACE, delta=DELTA)
+sender = BatchSender(sock, (UDP_IP, UDP_PORT), encoder, max_delay=BATCH_DELAY)
 # Start ranging on TCA9548A bus 1
 tof1.start_ranging(VL53L0X.VL53L0X_BETTER_ACCURACY_MODE)
 # Start ranging on TCA9548A bus 2
@@ -45,28 +58,21 @@ if timing < 20000:
     timing = 20000
 print ("Timing %d ms" % (timing / 1000))
 print ("Streaming data...")
+scheduler = RateScheduler(timing / 1000000.00)
 
 try:
     while True:
-        # Get distance from VL53L0X  on TCA9548A bus 1
-        distance = tof1.get_distance()
-        if (distance > 0):
-            string = str(distance) + " "
-        else:
-            string = "X "
-        # Get distance from VL53L0X  on TCA9548A bus 2
-        distance = tof2.get_distance()
-        if (distance > 0):
-            string += str(distance)
-        else:
-            string += "X"
-
-        sock.sendto(string, (UDP_IP, UDP_PORT))
-        time.sleep(timing / 1000000.00)
+        scheduler.wait()
+        # Get distance from VL53L0X  on TCA9548A bus 1 and 2
+        distances = [tof1.get_distance(), tof2.get_distance()]
+        sender.send(encoder.encode(distances))
 
 except KeyboardInterrupt:
     pass
+sender.close()
 print
 print("Logging done")
+print(encoder.report())
+print(scheduler.report(timing))
 tof1.stop_ranging()
 tof2.stop_ranging()
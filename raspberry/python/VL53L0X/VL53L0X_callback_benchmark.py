@@ -0,0 +1,137 @@
+#!/usr/bin/python
+"""
+This file measures the i2c callbacks that the ST library uses for every register access.
+It reports:
+ - The cost per call of i2c_read and i2c_write, without the bus (python overhead only) and with the real bus.
+   The old implementation, that copied the data with a python loop, is measured too for comparison.
+ - How many times the ST library calls the callbacks for one measurement (get_distance).
+Connect one VL53L0X directly to the bus (address 0x29). Run "python VL53L0X_callback_benchmark.py nobus" to skip
+everything that needs a sensor.
+"""
+import sys
+import time
+from ctypes import *
+
+import VL53L0X
+
+ITERATIONS = 10000
+LENGTHS = [1, 2, 4, 6, 12]
+SENSOR_ADDRESS = 0x29
+MODEL_ID_REGISTER = 0xC0
+MEASUREMENTS = 50
+
+
+class NullBus(object):
+    """A bus that does nothing, so only the python overhead of the callbacks is measured."""
+
+    def read_i2c_block_data(self, address, reg, length):
+        return [0] * length
+
+    def write_i2c_block_data(self, address, reg, data):
+        pass
+
+
+def legacy_i2c_read(address, reg, data_p, length):
+    """The old i2c_read, copies the data with a python loop."""
+    ret_val = 0
+    result = []
+    try:
+        result = VL53L0X.get_i2c_bus().read_i2c_block_data(address, reg, length)
+    except IOError:
+        ret_val = -1
+    if ret_val == 0:
+        for index in range(length):
+            data_p[index] = result[index]
+    return ret_val
+
+
+def legacy_i2c_write(address, reg, data_p, length):
+    """The old i2c_write, builds the data list with a python loop."""
+    ret_val = 0
+    data = []
+    for index in range(length):
+        data.append(data_p[index])
+    try:
+        VL53L0X.get_i2c_bus().write_i2c_block_data(address, reg, data)
+    except IOError:
+        ret_val = -1
+    return ret_val
+
+
+def time_per_call(function, address, reg, length, iterations=ITERATIONS):
+    """
+    :return: The time per call in microseconds
+    """
+    buf = (c_ubyte * 256)()
+    data_p = cast(buf, POINTER(c_ubyte))
+    start = time.time()
+    for _ in range(iterations):
+        function(address, reg, data_p, length)
+    return (time.time() - start) * 1000000.0 / iterations
+
+
+def report_callbacks(title, functions, address, reg, iterations=ITERATIONS):
+    print(title)
+    for length in LENGTHS:
+        print("\tlength %2d: " % length + ", ".join(
+            "%s %.2f us" % (name, time_per_call(function, address, reg, length, iterations))
+            for name, function in functions))
+
+
+def callbacks_per_measurement(tof, measurements=MEASUREMENTS):
+    """
+    Counts the callback calls of the ST library by passing counting callbacks to it for a while.
+    :return: The number of reads and writes per measurement and the time per get_distance in seconds
+    """
+    counts = {"read": 0, "write": 0}
+
+    def counting_read(address, reg, data_p, length):
+        counts["read"] += 1
+        return VL53L0X.i2c_read(address, reg, data_p, length)
+
+    def counting_write(address, reg, data_p, length):
+        counts["write"] += 1
+        return VL53L0X.i2c_write(address, reg, data_p, length)
+
+    read_func = VL53L0X.READFUNC(counting_read)
+    write_func = VL53L0X.WRITEFUNC(counting_write)
+    VL53L0X.tof_lib.VL53L0X_set_i2c(read_func, write_func)
+    try:
+        timing = tof.get_timing()
+        counts["read"] = counts["write"] = 0
+        elapsed = 0.0
+        for _ in range(measurements):
+            time.sleep(timing / 1000000.00)
+            start = time.time()
+            tof.get_distance()
+            elapsed += time.time() - start
+    finally:
+        VL53L0X.tof_lib.VL53L0X_set_i2c(VL53L0X.read_func, VL53L0X.write_func)
+    return (float(counts["read"]) / measurements, float(counts["write"]) / measurements,
+            elapsed / measurements)
+
+
+current = [("current read", VL53L0X.i2c_read), ("current write", VL53L0X.i2c_write)]
+legacy = [("old read", legacy_i2c_read), ("old write", legacy_i2c_write)]
+
+VL53L0X.set_i2c_bus(1, NullBus())
+report_callbacks("Callback cost without bus (python overhead):", current + legacy, SENSOR_ADDRESS, MODEL_ID_REGISTER)
+
+if len(sys.argv) > 1 and sys.argv[1] == "nobus":
+    sys.exit(0)
+
+# The real bus, opened with the backend of I2C_BACKEND like the sensors do
+real_bus = VL53L0X.open_i2c_bus(1)
+VL53L0X.set_i2c_bus(1, real_bus)
+print("Bus backend: %s (%s)" % (VL53L0X.I2C_BACKEND, type(real_bus).__name__))
+
+# Only reads on the real bus, writing registers would change the sensor settings
+report_callbacks("Callback cost with bus (reading the model id register):",
+                 [current[0], legacy[0]], SENSOR_ADDRESS, MODEL_ID_REGISTER, ITERATIONS // 10)
+
+tof = VL53L0X.VL53L0X(address=SENSOR_ADDRESS)
+tof.start_ranging(VL53L0X.VL53L0X_HIGH_SPEED_MODE)
+reads, writes, read_time = callbacks_per_measurement(tof)
+tof.stop_ranging()
+print("ST library calls per measurement: %.1f reads, %.1f writes" % (reads, writes))
+print("Time per get_distance: %.2f ms" % (read_time * 1000))
@@ -22,30 +22,44 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 """
-This file does the same as VL53L0X_example, but prints the results to a file instead of to the command line.
+This file does the same as VL53L0X_example, but records the results in binary files instead of printing them.
+Failed measurements are recorded too, with status 0. See skin_recorder.py for the file format and how to load them.
+It runs until Ctrl-C, or for COUNT measurements.
 """
-import time
+import os
+import sys
 
 import VL53L0X
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rate_scheduler import RateScheduler
+from skin_recorder import Recorder
+
+RECORD_PREFIX = "Output"  # The files are called Output_<start time>_<part>.skrec
+COUNT = None  # The number of measurements, None to run until Ctrl-C
+
 # Create a VL53L0X object
 tof = VL53L0X.VL53L0X()
-text_file = open("Output.txt", "w")
+recorder = Recorder(RECORD_PREFIX, 1)
 # Start ranging
 tof.start_ranging(VL53L0X.VL53L0X_BEST_ACCURACY_MODE)
 timing = tof.get_timing()
 if (timing < 20000):
     timing = 20000
 print ("Timing %d ms" % (timing / 1000))
+scheduler = RateScheduler(timing / 1000000.00)
 
-for count in range(1, 101):
-    distance = tof.get_distance()
-    if (distance > 0):
-        text_file.write(str(distance) + '\n')
-
-    time.sleep(timing / 1000000.00)
+count = 0
+try:
+    while COUNT is None or count < COUNT:
+        scheduler.wait()
+        recorder.record([tof.get_distance()])
+        count += 1
+except KeyboardInterrupt:
+    pass
 
-print("Logging done")
+print("Logging done, %d measurements in %s" % (count, ", ".join(recorder.files)))
+print(scheduler.report(timing))
 
 tof.stop_ranging()
-text_file.close()
+recorder.close()
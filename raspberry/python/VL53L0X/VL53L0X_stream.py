@@ -2,11 +2,15 @@
 This file streams the value of a single, directly connected sensor to the computer on the UDP_IP address on the given socket.
 It does so until a keyboardInterrupt is given (Ctrl-C)
 """
+import os
 import socket
-import time
+import sys
 
 import VL53L0X
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rate_scheduler import RateScheduler
+
 # Create a VL53L0X object
 tof = VL53L0X.VL53L0X()
 
@@ -21,15 +25,17 @@ if timing < 20000:
     timing = 20000
 print ("Timing %d ms" % (timing / 1000))
 print ("Streaming data...")
+scheduler = RateScheduler(timing / 1000000.00)
 try:
     while True:
+        scheduler.wait()
         distance = tof.get_distance()
         if distance > 0:
             sock.sendto(str(distance), (UDP_IP, UDP_PORT))
-        time.sleep(timing / 1000000.00)
 except KeyboardInterrupt:
     pass
 print
 print("Logging done")
+print(scheduler.report(timing))
 
 tof.stop_ranging()
@@ -1,13 +1,58 @@
 #!/usr/bin/python
+from __future__ import print_function
 
+import os
+import sys
 import time
-import smbus
+
+try:
+    import smbus
+except ImportError:  # Not on a raspberry pi, only a simulated bus can be used (see sim_bus.py and set_i2c_bus)
+    smbus = None
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import TCA9548A
+import i2c_rdwr
 
 
 # ===========================================================================
 # Copied from: https://bitbucket.org/310weber/st_vl6180x/src
 # ===========================================================================
 
+# "smbus" or "rdwr". rdwr reads a register in one combined I2C_RDWR transaction and supports burst reads, see i2c_rdwr.py
+# Set this before the first sensor is created.
+I2C_BACKEND = "smbus"
+_i2c_buses = {}
+
+# The range interrupt modes of SYSTEM_INTERRUPT_CONFIG_GPIO, the same codes are in RESULT_INTERRUPT_STATUS_GPIO
+RANGE_INTERRUPT_DISABLED = 0
+RANGE_INTERRUPT_LEVEL_LOW = 1  # The range is below SYSRANGE_THRESH_LOW
+RANGE_INTERRUPT_LEVEL_HIGH = 2  # The range is above SYSRANGE_THRESH_HIGH, or there is no target
+RANGE_INTERRUPT_OUT_OF_WINDOW = 3  # One of the two above
+RANGE_INTERRUPT_NEW_SAMPLE = 4
+
+
+def get_i2c_bus(bus=1):
+    """
+    Returns the bus object of a bus. All sensors on the same bus share it, so they share the multiplexer state too.
+    """
+    i2c = _i2c_buses.get(bus)
+    if i2c is None:
+        if I2C_BACKEND == "rdwr":
+            i2c = i2c_rdwr.I2CRdwrBus(bus)
+        else:
+            i2c = smbus.SMBus(bus)
+        _i2c_buses[bus] = i2c
+    return i2c
+
+
+def set_i2c_bus(bus, i2c):
+    """
+    Uses an existing bus object for a bus number, for example a simulated bus of sim_bus.py.
+    Call this before the sensors on that bus are created.
+    """
+    _i2c_buses[bus] = i2c
+
 
 class VL6180X:
     i2c = None
@@ -82,6 +127,41 @@ class VL6180X:
     __ALS_GAIN_20 = 0x00
     __ALS_GAIN_40 = 0x07
 
+    # Required by datasheet
+    # http://www.st.com/st-web-ui/static/active/en/resource/technical/document/application_note/DM00122600.pdf
+    __VL6180X_REQUIRED_SETTINGS = [
+        (0x0207, 0x01),
+        (0x0208, 0x01),
+        (0x0096, 0x00),
+        (0x0097, 0xfd),
+        (0x00e3, 0x00),
+        (0x00e4, 0x04),
+        (0x00e5, 0x02),
+        (0x00e6, 0x01),
+        (0x00e7, 0x03),
+        (0x00f5, 0x02),
+        (0x00d9, 0x05),
+        (0x00db, 0xce),
+        (0x00dc, 0x03),
+        (0x00dd, 0xf8),
+        (0x009f, 0x00),
+        (0x00a3, 0x3c),
+        (0x00b7, 0x00),
+        (0x00bb, 0x3c),
+        (0x00b2, 0x09),
+        (0x00ca, 0x09),
+        (0x0198, 0x01),
+        (0x01b0, 0x17),
+        (0x01ad, 0x00),
+        (0x00ff, 0x05),
+        (0x0100, 0x05),
+        (0x0199, 0x05),
+        (0x01a6, 0x1b),
+        (0x01ac, 0x3e),
+        (0x01a7, 0x1f),
+        (0x0030, 0x00)
+    ]
+
     # Dictionaries with the valid ALS gain values
     # These simplify and clean the code (avoid abuse of if/elif/else clauses)
     ALS_GAIN_REG = {
@@ -106,20 +186,25 @@ class VL6180X:
         40: 40.00,  # Nominal gain 40;   actual gain 40
     }
 
-    def __init__(self, address=0x29, debug=False, tc_address=0x70, tc_dev=0, tc_enabled=False):
+    def __init__(self, address=0x29, debug=False, tc_address=0x70, tc_dev=0, tc_enabled=False, bus=1):
         # Depending on if you have an old or a new Raspberry Pi, you
         # may need to change the I2C bus.  Older Pis use SMBus 0,
         # whereas new Pis use SMBus 1.  If you see an error like:
         # 'Error accessing 0x29: Check your I2C address '
-        # change the SMBus number in the initializer below!
+        # change the bus argument of the initializer!
 
         # setup i2c bus and SFR address
-        self.i2c = smbus.SMBus(1)
+        self.bus = bus
+        self.i2c = get_i2c_bus(bus)
         self.address = address
         self.debug = debug
         self.tc_address = tc_address
         self.tc_enabled = tc_enabled
         self.tc_dev = tc_dev
+        # Shared by all sensors on the bus, skips the channel write when the channel is already selected
+        self.tc = TCA9548A.get_multiplexer(self.i2c)
+        # Whether the bus can do combined write-read transactions and burst reads (i2c_rdwr.I2CRdwrBus)
+        self.combined = hasattr(self.i2c, "read_registers16")
 
         # Module identification
         self.idModel = 0x00
@@ -130,78 +215,23 @@ class VL6180X:
         self.idDate = 0x00
         self.idTime = 0x00
 
+        # Whether the sensor is ranging continuously (see start_continuous)
+        self.continuous = False
+
         if self.get_register(self.__VL6180X_SYSTEM_FRESH_OUT_OF_RESET) == 1:
             if self.debug:
-                print "ToF sensor is ready."
+                print("ToF sensor is ready.")
             self.ready = True
         else:
-            print "ToF sensor reset failure."
+            print("ToF sensor reset failure.")
             self.ready = False
 
-        # Required by datasheet
-        # http://www.st.com/st-web-ui/static/active/en/resource/technical/document/application_note/DM00122600.pdf
-        self.set_register(0x0207, 0x01)
-        self.set_register(0x0208, 0x01)
-        self.set_register(0x0096, 0x00)
-        self.set_register(0x0097, 0xfd)
-        self.set_register(0x00e3, 0x00)
-        self.set_register(0x00e4, 0x04)
-        self.set_register(0x00e5, 0x02)
-        self.set_register(0x00e6, 0x01)
-        self.set_register(0x00e7, 0x03)
-        self.set_register(0x00f5, 0x02)
-        self.set_register(0x00d9, 0x05)
-        self.set_register(0x00db, 0xce)
-        self.set_register(0x00dc, 0x03)
-        self.set_register(0x00dd, 0xf8)
-        self.set_register(0x009f, 0x00)
-        self.set_register(0x00a3, 0x3c)
-        self.set_register(0x00b7, 0x00)
-        self.set_register(0x00bb, 0x3c)
-        self.set_register(0x00b2, 0x09)
-        self.set_register(0x00ca, 0x09)
-        self.set_register(0x0198, 0x01)
-        self.set_register(0x01b0, 0x17)
-        self.set_register(0x01ad, 0x00)
-        self.set_register(0x00ff, 0x05)
-        self.set_register(0x0100, 0x05)
-        self.set_register(0x0199, 0x05)
-        self.set_register(0x01a6, 0x1b)
-        self.set_register(0x01ac, 0x3e)
-        self.set_register(0x01a7, 0x1f)
-        self.set_register(0x0030, 0x00)
+        # Required by datasheet, written with as few transactions as the bus allows
+        self.set_registers(self.__VL6180X_REQUIRED_SETTINGS)
         if self.debug:
-            print"Register settings:"
-            print"0x0207 - %x" % self.get_register(0x0207)
-            print"0x0208 - %x" % self.get_register(0x0208)
-            print"0x0096 - %x" % self.get_register(0x0096)
-            print"0x0097 - %x" % self.get_register(0x0097)
-            print"0x00e3 - %x" % self.get_register(0x00e3)
-            print"0x00e4 - %x" % self.get_register(0x00e4)
-            print"0x00e5 - %x" % self.get_register(0x00e5)
-            print"0x00e6 - %x" % self.get_register(0x00e6)
-            print"0x00e7 - %x" % self.get_register(0x00e7)
-            print"0x00f5 - %x" % self.get_register(0x00f5)
-            print"0x00d9 - %x" % self.get_register(0x00d9)
-            print"0x00db - %x" % self.get_register(0x00db)
-            print"0x00dc - %x" % self.get_register(0x00dc)
-            print"0x00dd - %x" % self.get_register(0x00dd)
-            print"0x009f - %x" % self.get_register(0x009f)
-            print"0x00a3 - %x" % self.get_register(0x00a3)
-            print"0x00b7 - %x" % self.get_register(0x00b7)
-            print"0x00bb - %x" % self.get_register(0x00bb)
-            print"0x00b2 - %x" % self.get_register(0x00b2)
-            print"0x00ca - %x" % self.get_register(0x00ca)
-            print"0x0198 - %x" % self.get_register(0x0198)
-            print"0x01b0 - %x" % self.get_register(0x01b0)
-            print"0x01ad - %x" % self.get_register(0x01ad)
-            print"0x00ff - %x" % self.get_register(0x00ff)
-            print"0x0100 - %x" % self.get_register(0x0100)
-            print"0x0199 - %x" % self.get_register(0x0199)
-            print"0x01a6 - %x" % self.get_register(0x01a6)
-            print"0x01ac - %x" % self.get_register(0x01ac)
-            print"0x01a7 - %x" % self.get_register(0x01a7)
-            print"0x0030 - %x" % self.get_register(0x0030)
+            print("Register settings:")
+            for register, _ in self.__VL6180X_REQUIRED_SETTINGS:
+                print("0x%04x - %x" % (register, self.get_register(register)))
 
     def default_settings(self):
         # Recommended settings from datasheet
@@ -239,44 +269,44 @@ class VL6180X:
         self.set_register(self.__VL6180X_FIRMWARE_RESULT_SCALER, 0x01)
 
         if self.debug:
-            print "Default settings:"
-            print "SYSTEM_MODE_GPIO1 - %x" % \
-                  self.get_register(self.__VL6180X_SYSTEM_MODE_GPIO1)
-            print "READOUT_AVERAGING_SAMPLE_PERIOD - %x" % \
+            print("Default settings:")
+            print("SYSTEM_MODE_GPIO1 - %x" %
+                  self.get_register(self.__VL6180X_SYSTEM_MODE_GPIO1))
+            print("READOUT_AVERAGING_SAMPLE_PERIOD - %x" %
                   self.get_register(
-                      self.__VL6180X_READOUT_AVERAGING_SAMPLE_PERIOD)
-            print "SYSALS_ANALOGUE_GAIN - %x" % \
-                  self.get_register(self.__VL6180X_SYSALS_ANALOGUE_GAIN)
-            print "SYSRANGE_VHV_REPEAT_RATE - %x" % \
-                  self.get_register(self.__VL6180X_SYSRANGE_VHV_REPEAT_RATE)
-            print "SYSALS_INTEGRATION_PERIOD - %x" % \
-                  self.get_register(self.__VL6180X_SYSALS_INTEGRATION_PERIOD)
-            print "SYSRANGE_VHV_RECALIBRATE - %x" % \
-                  self.get_register(self.__VL6180X_SYSRANGE_VHV_RECALIBRATE)
-            print "SYSRANGE_INTERMEASUREMENT_PERIOD - %x" % \
+                      self.__VL6180X_READOUT_AVERAGING_SAMPLE_PERIOD))
+            print("SYSALS_ANALOGUE_GAIN - %x" %
+                  self.get_register(self.__VL6180X_SYSALS_ANALOGUE_GAIN))
+            print("SYSRANGE_VHV_REPEAT_RATE - %x" %
+                  self.get_register(self.__VL6180X_SYSRANGE_VHV_REPEAT_RATE))
+            print("SYSALS_INTEGRATION_PERIOD - %x" %
+                  self.get_register(self.__VL6180X_SYSALS_INTEGRATION_PERIOD))
+            print("SYSRANGE_VHV_RECALIBRATE - %x" %
+                  self.get_register(self.__VL6180X_SYSRANGE_VHV_RECALIBRATE))
+            print("SYSRANGE_INTERMEASUREMENT_PERIOD - %x" %
                   self.get_register(
-                      self.__VL6180X_SYSRANGE_INTERMEASUREMENT_PERIOD)
-            print "SYSALS_INTERMEASUREMENT_PERIOD - %x" % \
+                      self.__VL6180X_SYSRANGE_INTERMEASUREMENT_PERIOD))
+            print("SYSALS_INTERMEASUREMENT_PERIOD - %x" %
                   self.get_register(
-                      self.__VL6180X_SYSALS_INTERMEASUREMENT_PERIOD)
-            print "SYSTEM_INTERRUPT_CONFIG_GPIO - %x" % \
+                      self.__VL6180X_SYSALS_INTERMEASUREMENT_PERIOD))
+            print("SYSTEM_INTERRUPT_CONFIG_GPIO - %x" %
                   self.get_register(
-                      self.__VL6180X_SYSTEM_INTERRUPT_CONFIG_GPIO)
-            print "SYSRANGE_MAX_CONVERGENCE_TIME - %x" % \
+                      self.__VL6180X_SYSTEM_INTERRUPT_CONFIG_GPIO))
+            print("SYSRANGE_MAX_CONVERGENCE_TIME - %x" %
                   self.get_register(
-                      self.__VL6180X_SYSRANGE_MAX_CONVERGENCE_TIME)
-            print "SYSRANGE_RANGE_CHECK_ENABLES - %x" % \
-                  self.get_register(self.__VL6180X_SYSRANGE_RANGE_CHECK_ENABLES)
-            print "SYSRANGE_EARLY_CONVERGENCE_ESTIMATE - %x" % \
+                      self.__VL6180X_SYSRANGE_MAX_CONVERGENCE_TIME))
+            print("SYSRANGE_RANGE_CHECK_ENABLES - %x" %
+                  self.get_register(self.__VL6180X_SYSRANGE_RANGE_CHECK_ENABLES))
+            print("SYSRANGE_EARLY_CONVERGENCE_ESTIMATE - %x" %
                   self.get_register_16bit(
-                      self.__VL6180X_SYSRANGE_EARLY_CONVERGENCE_ESTIMATE)
-            print "SYSALS_INTEGRATION_PERIOD - %x" % \
+                      self.__VL6180X_SYSRANGE_EARLY_CONVERGENCE_ESTIMATE))
+            print("SYSALS_INTEGRATION_PERIOD - %x" %
                   self.get_register_16bit(
-                      self.__VL6180X_SYSALS_INTEGRATION_PERIOD)
-            print "SYSALS_ANALOGUE_GAIN - %x" % \
-                  self.get_register(self.__VL6180X_SYSALS_ANALOGUE_GAIN)
-            print "FIRMWARE_RESULT_SCALER - %x" % \
-                  self.get_register(self.__VL6180X_FIRMWARE_RESULT_SCALER)
+                      self.__VL6180X_SYSALS_INTEGRATION_PERIOD))
+            print("SYSALS_ANALOGUE_GAIN - %x" %
+                  self.get_register(self.__VL6180X_SYSALS_ANALOGUE_GAIN))
+            print("FIRMWARE_RESULT_SCALER - %x" %
+                  self.get_register(self.__VL6180X_FIRMWARE_RESULT_SCALER))
 
     def get_identification(self):
 
@@ -313,13 +343,121 @@ class VL6180X:
         self.set_register(self.__VL6180X_SYSRANGE_START, 0x01)
         time.sleep(0.010)
         if self.debug:
-            print "Range status: %x" % (self.get_register(self.__VL6180X_RESULT_RANGE_STATUS) & 0xF1)
+            print("Range status: %x" % (self.get_register(self.__VL6180X_RESULT_RANGE_STATUS) & 0xF1))
         distance = self.get_register(self.__VL6180X_RESULT_RANGE_VAL)
-        print distance
+        print(distance)
         self.set_register(self.__VL6180X_SYSTEM_INTERRUPT_CLEAR, 0x07)
 
         return distance
 
+    def set_intermeasurement_period(self, period_ms):
+        """
+        Sets the time between two measurements in continuous mode. The sensor uses steps of 10 ms (10 - 2550 ms).
+        :param period_ms: The period in ms
+        """
+        steps = int(round(period_ms / 10.0)) - 1
+        self.set_register(self.__VL6180X_SYSRANGE_INTERMEASUREMENT_PERIOD, max(0, min(steps, 254)))
+
+    def start_single_shot(self):
+        """Starts a single measurement without waiting for the result. Use range_ready and read_range to get it."""
+        self.set_register(self.__VL6180X_SYSRANGE_START, 0x01)
+
+    def start_continuous(self, period_ms=None):
+        """
+        Starts continuous ranging. The sensor measures every intermeasurement period on its own.
+        :param period_ms: The intermeasurement period in ms, None keeps the current setting
+        """
+        if period_ms is not None:
+            self.set_intermeasurement_period(period_ms)
+        self.set_register(self.__VL6180X_SYSRANGE_START, 0x03)
+        self.continuous = True
+
+    def stop_continuous(self):
+        """Stops continuous ranging. Writing the start bit again in continuous mode stops it."""
+        if self.continuous:
+            self.set_register(self.__VL6180X_SYSRANGE_START, 0x01)
+            self.continuous = False
+
+    def range_ready(self):
+        """
+        Checks the interrupt status for a new range sample. Needs the interrupt config of default_settings.
+        :return: True if a new range can be read with read_range
+        """
+        status = self.get_register(self.__VL6180X_RESULT_INTERRUPT_STATUS_GPIO)
+        return (status & 0x07) == 0x04
+
+    def poll_range(self):
+        """
+        Reads the range if a new one is ready and clears the interrupt.
+        With a combined bus the range status, interrupt status and range value are read in one burst read.
+        :return: The distance in mm, None if no new range is ready
+        """
+        if not self.combined:
+            if self.range_ready():
+                return self.read_range()
+            return None
+        results = self.get_registers(self.__VL6180X_RESULT_RANGE_STATUS,
+                                     self.__VL6180X_RESULT_RANGE_VAL - self.__VL6180X_RESULT_RANGE_STATUS + 1)
+        interrupt_status = results[self.__VL6180X_RESULT_INTERRUPT_STATUS_GPIO - self.__VL6180X_RESULT_RANGE_STATUS]
+        if (interrupt_status & 0x07) != 0x04:
+            return None
+        if self.debug:
+            print("Range status: %x" % (results[0] & 0xF1))
+        self.set_register(self.__VL6180X_SYSTEM_INTERRUPT_CLEAR, 0x07)
+        return results[-1]
+
+    def read_range(self):
+        """
+        Reads the last range and clears the interrupt, so the next sample can be detected.
+        :return: The distance in mm
+        """
+        distance = self.get_register(self.__VL6180X_RESULT_RANGE_VAL)
+        self.set_register(self.__VL6180X_SYSTEM_INTERRUPT_CLEAR, 0x07)
+        return distance
+
+    def set_range_thresholds(self, low, high):
+        """
+        Sets the thresholds of the range interrupts (see set_range_interrupt).
+        :param low: The low threshold in mm (0 - 255)
+        :param high: The high threshold in mm (0 - 255)
+        """
+        # Hold the parameters, so a measurement in continuous mode never sees half of the change
+        self.set_register(self.__VL6180X_SYSTEM_GROUPED_PARAMETER_HOLD, 0x01)
+        self.set_register(self.__VL6180X_SYSRANGE_THRESH_LOW, max(0, min(int(low), 255)))
+        self.set_register(self.__VL6180X_SYSRANGE_THRESH_HIGH, max(0, min(int(high), 255)))
+        self.set_register(self.__VL6180X_SYSTEM_GROUPED_PARAMETER_HOLD, 0x00)
+
+    def set_range_interrupt(self, mode):
+        """
+        Sets when the sensor raises its interrupt (GPIO1, active low after default_settings) for a range measurement.
+        The ALS interrupt is switched off.
+        :param mode: One of the RANGE_INTERRUPT_ modes
+        """
+        self.set_register(self.__VL6180X_SYSTEM_INTERRUPT_CONFIG_GPIO, mode & 0x07)
+
+    def read_interrupt(self):
+        """
+        Reads which range interrupt is active and the range that raised it, and clears the interrupt.
+        :return: (code, distance). code is one of the RANGE_INTERRUPT_ modes, 0 when no interrupt is active.
+        distance is the range in mm, None when there is no interrupt or the measurement failed.
+        """
+        if self.combined:
+            results = self.get_registers(self.__VL6180X_RESULT_RANGE_STATUS,
+                                         self.__VL6180X_RESULT_RANGE_VAL - self.__VL6180X_RESULT_RANGE_STATUS + 1)
+            code = results[self.__VL6180X_RESULT_INTERRUPT_STATUS_GPIO - self.__VL6180X_RESULT_RANGE_STATUS] & 0x07
+            range_status, distance = results[0], results[-1]
+        else:
+            code = self.get_register(self.__VL6180X_RESULT_INTERRUPT_STATUS_GPIO) & 0x07
+            if code == RANGE_INTERRUPT_DISABLED:
+                return code, None
+            range_status = self.get_register(self.__VL6180X_RESULT_RANGE_STATUS)
+            distance = self.get_register(self.__VL6180X_RESULT_RANGE_VAL)
+        if code == RANGE_INTERRUPT_DISABLED:
+            return code, None
+        self.set_register(self.__VL6180X_SYSTEM_INTERRUPT_CLEAR, 0x07)
+        # The upper 4 bits of the range status are the error code
+        return code, None if range_status >> 4 else distance
+
     def get_ambient_light(self, als_gain):
         # First load in Gain we are using, do it every time in case someone
         # changes it on us.
@@ -331,7 +469,7 @@ class VL6180X:
         # of the constant otherwise it returns the value for gain 20.
         # This saves a lot of if/elif/else code!
         if als_gain not in self.ALS_GAIN_ACTUAL:
-            print "Invalid gain setting: %d.  Setting to 20." % als_gain
+            print("Invalid gain setting: %d.  Setting to 20." % als_gain)
         als_gain_actual = self.ALS_GAIN_ACTUAL.setdefault(als_gain, 20)
         self.set_register(
             self.__VL6180X_SYSALS_ANALOGUE_GAIN,
@@ -344,7 +482,7 @@ class VL6180X:
 
         # Retrieve the Raw ALS value from the sensor
         if self.debug:
-            print "ALS status: %x" % (self.get_register(self.__VL6180X_RESULT_ALS_STATUS) & 0xF1)
+            print("ALS status: %x" % (self.get_register(self.__VL6180X_RESULT_ALS_STATUS) & 0xF1))
         als_raw = self.get_register_16bit(self.__VL6180X_RESULT_ALS_VAL)
         self.set_register(self.__VL6180X_SYSTEM_INTERRUPT_CLEAR, 0x07)
 
@@ -361,21 +499,32 @@ class VL6180X:
 
         return als_calculated
 
-    def get_register(self, register_address):
+    def select_channel(self):
         if self.tc_enabled:
-            self.i2c.write_i2c_block_data(self.tc_address, 1 << self.tc_dev, [])
+            self.tc.select(self.tc_address, self.tc_dev)
 
+    def get_register(self, register_address):
         a1 = (register_address >> 8) & 0xFF
         a0 = register_address & 0xFF
-        self.i2c.write_i2c_block_data(self.address, a1, [a0])
-        data = self.i2c.read_byte(self.address)
+        try:
+            self.select_channel()
+            if self.combined:
+                data = self.i2c.read_registers16(self.address, register_address, 1)[0]
+            else:
+                self.i2c.write_i2c_block_data(self.address, a1, [a0])
+                data = self.i2c.read_byte(self.address)
+        except IOError:
+            self.tc.invalidate()
+            raise
         return data
 
     def get_register_16bit(self, register_address):
         try:
-            if self.tc_enabled:
-                self.i2c.write_i2c_block_data(self.tc_address, 1 << self.tc_dev, [])
+            self.select_channel()
 
+            if self.combined:
+                data0, data1 = self.i2c.read_registers16(self.address, register_address, 2)
+                return (data0 << 8) | data1
             a1 = (register_address >> 8) & 0xFF
             a0 = register_address & 0xFF
             self.i2c.write_i2c_block_data(self.address, a1, [a0])
@@ -383,17 +532,33 @@ class VL6180X:
             data1 = self.i2c.read_byte(self.address)
             return (data0 << 8) | (data1 & 0xFF)
         except IOError:
-            pass
+            self.tc.invalidate()
+
+    def get_registers(self, register_address, length):
+        """
+        Reads consecutive registers. With a combined bus this is one burst read.
+        :return: A list with length values
+        """
+        try:
+            self.select_channel()
+            if self.combined:
+                return list(self.i2c.read_registers16(self.address, register_address, length))
+            a1 = (register_address >> 8) & 0xFF
+            a0 = register_address & 0xFF
+            self.i2c.write_i2c_block_data(self.address, a1, [a0])
+            return [self.i2c.read_byte(self.address) for _ in range(length)]
+        except IOError:
+            self.tc.invalidate()
+            raise
 
     def set_register(self, register_address, data):
         a1 = (register_address >> 8) & 0xFF
         a0 = register_address & 0xFF
         try:
-            if self.tc_enabled:
-                self.i2c.write_i2c_block_data(self.tc_address, 1 << self.tc_dev, [])
+            self.select_channel()
             self.i2c.write_i2c_block_data(self.address, a1, [a0, (data & 0xFF)])
         except IOError:
-            pass
+            self.tc.invalidate()
 
     def set_register_16bit(self, register_address, data):
         a1 = (register_address >> 8) & 0xFF
@@ -401,16 +566,89 @@ class VL6180X:
         d1 = (data >> 8) & 0xFF
         d0 = data & 0xFF
         try:
-            if self.tc_enabled:
-                self.i2c.write_i2c_block_data(self.tc_address, 1 << self.tc_dev, [])
+            self.select_channel()
             self.i2c.write_i2c_block_data(self.address, a1, [a0, d1, d0])
         except IOError:
-            pass
+            self.tc.invalidate()
+
+    def set_registers(self, table):
+        """
+        Writes a table of registers. With a combined bus they are sent in as few transactions as possible.
+        :param table: A list of (register, value) tuples with 8 bit values
+        """
+        if not self.combined:
+            for register_address, data in table:
+                self.set_register(register_address, data)
+            return
+        try:
+            self.select_channel()
+            self.i2c.write_registers16(self.address, table)
+        except IOError:
+            self.tc.invalidate()
 
 
-def return_sensor_if_connected(tc_address, tc_dev, dev_address, tc_enabled=False, debug=False):
+def return_sensor_if_connected(tc_address, tc_dev, dev_address, tc_enabled=False, debug=False, bus=1):
     try:
-        tof_sensor = VL6180X(dev_address, debug, tc_address, tc_dev, tc_enabled)
+        tof_sensor = VL6180X(dev_address, debug, tc_address, tc_dev, tc_enabled, bus)
         return tof_sensor
     except IOError:
         return None
+
+
+def start_single_shot(sensors):
+    """
+    Starts a single measurement on all sensors, so they measure at the same time.
+    """
+    for sensor in sensors:
+        try:
+            sensor.start_single_shot()
+        except IOError:
+            pass
+
+
+def start_continuous(sensors, period_ms=None):
+    """
+    Starts continuous ranging on all sensors.
+    :param period_ms: The intermeasurement period in ms, None keeps the current setting
+    """
+    for sensor in sensors:
+        try:
+            sensor.start_continuous(period_ms)
+        except IOError:
+            pass
+
+
+def stop_continuous(sensors):
+    for sensor in sensors:
+        try:
+            sensor.stop_continuous()
+        except IOError:
+            pass
+
+
+def read_ready(sensors, timeout=0.1, poll_interval=0.001):
+    """
+    Polls the interrupt status of all sensors and reads every sensor as soon as its range is ready.
+    Start the measurements first with start_single_shot or start_continuous. The time this takes is bounded by
+    one measurement period, instead of one period per sensor.
+    :param sensors: The sensors to read
+    :param timeout: The time in seconds after which sensors that are not ready are given up
+    :param poll_interval: The time in seconds between two polling rounds
+    :return: The distance per sensor, None if it wasn't ready in time or reading it failed
+    """
+    distances = [None] * len(sensors)
+    pending = list(range(len(sensors)))
+    deadline = time.time() + timeout
+    while True:
+        still_pending = []
+        for index in pending:
+            try:
+                distances[index] = sensors[index].poll_range()
+                if distances[index] is None:
+                    still_pending.append(index)
+            except IOError:
+                pass
+        pending = still_pending
+        if not pending or time.time() > deadline:
+            return distances
+        time.sleep(poll_interval)
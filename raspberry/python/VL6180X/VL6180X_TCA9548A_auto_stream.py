@@ -1,14 +1,24 @@
 #!/usr/bin/python
 
 """
- This file detect all the sensors that are connected to the TCA9548A on the i2c address 0x70 and streams their data to the pc.
+ This file detect all the sensors that are connected to TCA9548A multiplexers (0x70 - 0x77) and streams their data to the pc.
+ The sensors that are found are kept in a cache file, so the next start is fast. Run with "rescan" to ignore the cache.
  """
 
+import os
 import socket
 import sys
-from time import sleep
 import VL6180X
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import discovery
+import ring_consumer
+import skin_frame
+from batch_sender import BatchSender
+import acquisition
+from frame_ring import RING_PATH, FrameRing
+from rate_scheduler import RateScheduler
+
 """-- Setup --"""
 debug = False  # Enable this if you want all the debug information of the sensor printed on your command window
 
@@ -17,8 +27,24 @@ UDP_IP = "169.254.210.175"
 UDP_PORT = 5005
 sock = socket.socket(socket.AF_INET,  # Internet
                      socket.SOCK_DGRAM)
-tc_i2c_address = 0x70
-sensor_i2c_address = 0x29
+FRAME_FORMAT = skin_frame.FORMAT_BINARY  # Use skin_frame.FORMAT_ASCII for the old space separated strings
+TRACE = False  # Send the trace timestamps of every frame, for the latency tracing on the pc (see pc/latency_trace.py)
+NODE = 0  # The node id of this raspberry pi, give every raspberry pi of one skin its own id (see pc/skin_aggregator.py)
+BATCH_DELAY = 0  # s, the longest a frame waits to be sent with the next frames, 0 sends right away (see batch_sender.py)
+DELTA = False  # Only send the sensors that changed since the last keyframe, for many sensors on wifi (see skin_frame.py)
+RING = False  # Only write the frames in shared memory, separate processes send and record them (see frame_ring.py)
+RECORD_PREFIX = None  # With RING, also record the frames in files with this prefix (see skin_recorder.py)
+encoder = skin_frame.FrameEncoder(node=NODE, frame_format=FRAME_FORMAT, trace=TRACE, delta=DELTA)
+sender = BatchSender(sock, (UDP_IP, UDP_PORT), encoder, max_delay=BATCH_DELAY)
+# "continuous": all sensors range on their own and are read as soon as they are ready.
+# "pipelined": a single shot is started on all sensors at once, then they are read as soon as they are ready.
+# "sequential": the old way, every sensor does a single shot after the other.
+MODE = "continuous"
+INTERMEASUREMENT_PERIOD = 50  # ms, the time between two measurements in continuous mode (10 - 2550)
+SEQUENTIAL_PERIOD = 1  # s, the time between two frames in sequential mode
+VL6180X.I2C_BACKEND = "rdwr"  # Combined I2C_RDWR transactions and burst reads. Use "smbus" if the I2C adapter can't do this.
+BUSES = [1]  # The I2C buses with sensors, e.g. [1, 3, 4]. Every bus is read by its own thread.
+TOPOLOGY_CACHE = "skin_topology.json"  # The file the found sensors are kept in
 if len(sys.argv) > 1:
     if sys.argv[1] == "debug":  # sys.argv[0] is the filename
         debug = True
@@ -26,16 +52,20 @@ if len(sys.argv) > 1:
 if len(sys.argv) > 1:
     if sys.argv[1] == "info":  # sys.argv[0] is the filename
         info = True
+rescan = "rescan" in sys.argv
 sensors = []
 # setup ToF ranging/ALS sensor
-for i in range(8):
-    sensor = VL6180X.return_sensor_if_connected(tc_i2c_address, i, sensor_i2c_address, True, debug=debug)
+for found in discovery.discover(BUSES, (discovery.VL6180X,), TOPOLOGY_CACHE, VL6180X.get_i2c_bus, rescan):
+    tc_enabled = found["mux"] is not None
+    sensor = VL6180X.return_sensor_if_connected(found["mux"], found["channel"], found["address"], tc_enabled,
+                                                debug=debug, bus=found["bus"])
     if sensor is not None:
         if info:
             print("Found sensor on:")
-            print("\tMultiplexer address: {}".format(tc_i2c_address))
-            print("\tSensor address: {}".format(sensor_i2c_address))
-            print("\tMultiplexer device: {}".format(i))
+            print("\tI2C bus: {}".format(found["bus"]))
+            print("\tMultiplexer address: {}".format(found["mux"]))
+            print("\tSensor address: {}".format(found["address"]))
+            print("\tMultiplexer device: {}".format(found["channel"]))
         sensor.get_identification()
         if info:
             if sensor.idModel != 0xB4:
@@ -47,25 +77,68 @@ for i in range(8):
                 print("\tSensor date/time: %X/%X" % (sensor.idDate, sensor.idTime))
         sensor.default_settings()
         sensors.append(sensor)
+if info:
+    for bus in BUSES:
+        print("Bus {} multiplexer channel writes: {writes}, skipped: {skipped}".format(
+            bus, **VL6180X.TCA9548A.get_multiplexer(VL6180X.get_i2c_bus(bus)).stats()))
 
 print()
 print("Streaming...")
 print()
 """-- MAIN LOOP --"""
+if MODE == "continuous":
+    VL6180X.start_continuous(sensors, INTERMEASUREMENT_PERIOD)
+    timeout = 2 * INTERMEASUREMENT_PERIOD / 1000.0
+else:
+    timeout = 0.1
+
+
+def read_bus(bus_sensors):
+    """Reads the sensors of one bus, called by the worker thread of that bus."""
+    if MODE == "sequential":
+        return acquisition.read_each(bus_sensors)
+    if MODE == "pipelined":
+        VL6180X.start_single_shot(bus_sensors)
+    return VL6180X.read_ready(bus_sensors, timeout)
+
+
+ring = None
+consumers = []
+if RING:
+    # The processes are started before the threads of the engine
+    ring = FrameRing.create(RING_PATH, len(sensors))
+    consumers.append(ring_consumer.start(ring_consumer.stream, RING_PATH, ring_consumer.STREAMER, (UDP_IP, UDP_PORT),
+                                         {"node": NODE, "frame_format": FRAME_FORMAT, "trace": TRACE, "delta": DELTA},
+                                         BATCH_DELAY))
+    if RECORD_PREFIX is not None:
+        consumers.append(ring_consumer.start(ring_consumer.record, RING_PATH, ring_consumer.RECORDER, RECORD_PREFIX))
+engine = acquisition.AcquisitionEngine(sensors, read_bus)
+scheduler = RateScheduler(SEQUENTIAL_PERIOD)
 try:
     while True:
-        string = ""
-        for sensor in sensors:
-            try:
-                distance = sensor.get_distance()
-                string += str(distance) + " "
-            except IOError:
-                string += "X "
-        sock.sendto(string, (UDP_IP, UDP_PORT))
-        print(string)
-        sleep(1)
+        if MODE == "sequential":
+            scheduler.wait()
+        timestamp, distances = engine.read_frame()
+        if ring is not None:
+            # Printing every frame would slow the acquisition down, use ring_consumer.py monitor
+            ring.write(distances, timestamp)
+        else:
+            sender.send(encoder.encode(distances, timestamp))
+            print(distances)
 except KeyboardInterrupt:
     pass
+sender.close()
+engine.stop()
+VL6180X.stop_continuous(sensors)
 
 print()
 print("Logging done")
+if ring is not None:
+    print(ring.report())
+    ring.close()
+    for consumer in consumers:
+        consumer.join()
+else:
+    print(encoder.report())
+if MODE == "sequential":
+    print(scheduler.report())
@@ -0,0 +1,95 @@
+#!/usr/bin/python
+
+"""
+ This file runs the VL6180X sensors on TCA9548A multiplexers in event mode (see proximity.py): the sensors only raise
+ their interrupt line when something comes nearer than ENTER mm or goes further than LEAVE mm, and only then they are
+ read. Every enter and leave event is printed, and a frame with the distance of the sensors that are near (the others
+ are invalid) is sent to the pc, so the reading scripts work as before but only get a frame when something changes.
+
+ The GPIO1 pin of every sensor has to be wired to a GPIO pin of the raspberry pi, see INTERRUPT_LINES.
+ Run with "sim" to try it without a raspberry pi: the sensors, multiplexer and interrupt lines are simulated, with
+ targets that come and go. Run with "rescan" to ignore the cache of the found sensors.
+ """
+from __future__ import print_function
+
+import os
+import socket
+import sys
+
+import VL6180X
+import proximity
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import discovery
+import edge_source
+import skin_frame
+
+UDP_IP = "169.254.210.175"
+UDP_PORT = 5005
+NODE = 0  # The node id of this raspberry pi, give every raspberry pi of one skin its own id (see pc/skin_aggregator.py)
+BUSES = [1]  # The I2C buses with sensors
+TOPOLOGY_CACHE = "skin_topology.json"  # The file the found sensors are kept in
+# The GPIO pins (BCM numbering) the GPIO1 pins of the sensors are wired to, with the indexes of the sensors on every
+# pin in the order they are found. None means all sensors. Several sensors can share a pin.
+INTERRUPT_LINES = {17: None}
+ENTER = 50  # mm, a sensor sends an enter event when something comes nearer than this
+LEAVE = 70  # mm, and a leave event when it goes further than this again
+INTERMEASUREMENT_PERIOD = 20  # ms, the sensors measure on their own this often, the longest a change waits
+VL6180X.I2C_BACKEND = "rdwr"  # Combined I2C_RDWR transactions and burst reads. Use "smbus" if the I2C adapter can't do this.
+SIMULATE = "sim" in sys.argv
+rescan = "rescan" in sys.argv
+
+edges_lines = INTERRUPT_LINES
+if SIMULATE:
+    import sim_bus
+
+    # Eight sensors on two interrupt lines, a target comes by every few seconds
+    simulated = sim_bus.make_skin(BUSES, 1, 8, profile=lambda bus, mux, channel: sim_bus.steps(
+        [None] * (channel + 2) + [40, 30, 45] + [None] * (9 - channel), interval=0.25))
+    for bus, i2c in simulated.items():
+        VL6180X.set_i2c_bus(bus, i2c)
+    simulated_sensors = sim_bus.sensors_of(simulated)
+    edges_lines = {17: range(0, 4), 27: range(4, 8)}
+    edges = edge_source.SimEdgeSource(dict((pin, [simulated_sensors[index] for index in indexes])
+                                           for pin, indexes in edges_lines.items()))
+    TOPOLOGY_CACHE = None
+else:
+    edges = edge_source.GpioEdgeSource(sorted(INTERRUPT_LINES))
+
+sensors = []
+for found in discovery.discover(BUSES, (discovery.VL6180X,), TOPOLOGY_CACHE, VL6180X.get_i2c_bus, rescan):
+    tc_enabled = found["mux"] is not None
+    sensor = VL6180X.return_sensor_if_connected(found["mux"], found["channel"], found["address"], tc_enabled,
+                                                bus=found["bus"])
+    if sensor is not None:
+        sensor.default_settings()
+        sensors.append(sensor)
+print("Found %d sensors" % len(sensors))
+
+encoder = skin_frame.FrameEncoder(node=NODE)
+sock = socket.socket(socket.AF_INET,  # Internet
+                     socket.SOCK_DGRAM)  # UDP
+monitor = proximity.ProximityMonitor(sensors, edges_lines, edges, ENTER, LEAVE, INTERMEASUREMENT_PERIOD)
+monitor.start()
+
+print()
+print("Waiting for events...")
+print()
+try:
+    while True:
+        events = monitor.wait(1.0)
+        for event in events:
+            distance = event.distance if event.kind == proximity.ENTER else "-"
+            print("%-5s sensor %2d  %s mm  (%.2f ms after the edge)" % (
+                event.kind, event.sensor, distance, event.latency * 1000))
+        if events:
+            sock.sendto(encoder.encode(monitor.distances), (UDP_IP, UDP_PORT))
+except KeyboardInterrupt:
+    pass
+monitor.stop()
+edges.close()
+
+print()
+print(monitor.report())
+if SIMULATE:
+    print("I2C transactions: %d" % sum(i2c.transactions for i2c in simulated.values()))
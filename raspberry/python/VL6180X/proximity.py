@@ -0,0 +1,154 @@
+"""
+This file contains the ProximityMonitor, the event mode of the VL6180X sensors: instead of reading every sensor all the
+time, the sensors compare their range with thresholds themselves and raise their interrupt line when something comes
+near or goes away. Only the sensors of a line that fired are read, so a skin that isn't touched causes no I2C traffic
+and almost no CPU use, and a change is seen within one measurement period of the sensor.
+
+Every sensor is in one of two states, with a threshold each:
+ - far: the sensor raises its interrupt when the range drops below enter mm. The monitor then emits an enter event.
+ - near: the sensor raises its interrupt when the range rises above leave mm, or there is no target any more.
+   The monitor then emits a leave event.
+leave is larger than enter, so a hand at the edge of the range doesn't give a stream of events (hysteresis).
+An interrupt that doesn't match the state (a sample that was measured while the state was changed) is ignored.
+
+The sensors need read_interrupt, set_range_thresholds, set_range_interrupt, start_continuous and stop_continuous
+(see VL6180X.py). The interrupt lines come from an edge source (see edge_source.py).
+
+Usage:
+    monitor = ProximityMonitor(sensors, {17: None}, GpioEdgeSource([17]))
+    monitor.start()
+    while True:
+        for event in monitor.wait():
+            print(event)
+"""
+import time
+from collections import namedtuple
+
+import VL6180X
+
+ENTER = "enter"
+LEAVE = "leave"
+
+# kind: ENTER or LEAVE, sensor: the index of the sensor, distance: the range in mm (None when the target is gone),
+# timestamp: the time the event was read, latency: the time from the edge of the interrupt line to the event in seconds
+ProximityEvent = namedtuple("ProximityEvent", ["kind", "sensor", "distance", "timestamp", "latency"])
+
+
+class ProximityMonitor(object):
+    """Emits enter and leave events of sensors that compare their range with thresholds themselves."""
+
+    def __init__(self, sensors, lines, edges, enter=50, leave=70, period_ms=20, max_rounds=8):
+        """
+        :param sensors: The sensors
+        :param lines: A dict pin -> list of the indexes of the sensors that are wired to that pin, None for all sensors
+        :param edges: The edge source of the pins, see edge_source.py
+        :param enter: The range in mm below which something is near
+        :param leave: The range in mm above which something that was near is gone, larger than enter
+        :param period_ms: The intermeasurement period of the sensors in ms, the longest a change waits to be seen
+        :param max_rounds: The maximum number of times a line is read again when it stays active
+        """
+        if not 0 < enter < leave <= 255:
+            raise ValueError("The thresholds need 0 < enter < leave <= 255 mm")
+        self.sensors = sensors
+        self.lines = dict((pin, list(range(len(sensors))) if indexes is None else list(indexes))
+                          for pin, indexes in lines.items())
+        self.edges = edges
+        self.enter = enter
+        self.leave = leave
+        self.period_ms = period_ms
+        self.max_rounds = max_rounds
+        self.near = [False] * len(sensors)
+        self.distances = [None] * len(sensors)  # The range of the sensors that are near
+        # Counters
+        self.line_edges = 0
+        self.reads = 0  # Sensors that were read
+        self.spurious = 0  # Sensors that were read but had no interrupt, because another sensor on the line had one
+        self.stale = 0  # Interrupts that didn't match the state
+        self.errors = 0
+        self.events = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+
+    def start(self):
+        """Programs the thresholds, puts every sensor in the far state and starts continuous ranging."""
+        for sensor in self.sensors:
+            try:
+                sensor.set_range_thresholds(self.enter, self.leave)
+                sensor.set_range_interrupt(VL6180X.RANGE_INTERRUPT_LEVEL_LOW)
+                sensor.read_interrupt()  # Clears an interrupt of before
+            except IOError:
+                self.errors += 1
+        VL6180X.start_continuous(self.sensors, self.period_ms)
+
+    def stop(self):
+        """Stops ranging and sets the interrupt back to every new sample, like default_settings."""
+        VL6180X.stop_continuous(self.sensors)
+        for sensor in self.sensors:
+            try:
+                sensor.set_range_interrupt(VL6180X.RANGE_INTERRUPT_NEW_SAMPLE)
+            except IOError:
+                self.errors += 1
+
+    def wait(self, timeout=1.0):
+        """
+        Waits for interrupt lines and reads the sensors on the lines that fired.
+        :param timeout: The maximum time to wait in seconds
+        :return: A list of ProximityEvent, empty when nothing happened in time
+        """
+        events = []
+        for pin, edge_time in self.edges.wait(timeout):
+            self.line_edges += 1
+            for _ in range(self.max_rounds):
+                self._read_line(pin, edge_time, events)
+                # While the line stays active another sensor on it raised its interrupt, that gives no new edge
+                if not self.edges.asserted(pin):
+                    break
+        return events
+
+    def _read_line(self, pin, edge_time, events):
+        for index in self.lines[pin]:
+            sensor = self.sensors[index]
+            try:
+                code, distance = sensor.read_interrupt()
+            except IOError:
+                self.errors += 1
+                continue
+            self.reads += 1
+            if code == VL6180X.RANGE_INTERRUPT_DISABLED:
+                self.spurious += 1
+            elif not self.near[index] and code == VL6180X.RANGE_INTERRUPT_LEVEL_LOW and distance is not None:
+                self._change(index, True, distance, edge_time, events)
+            elif self.near[index] and code == VL6180X.RANGE_INTERRUPT_LEVEL_HIGH:
+                self._change(index, False, distance, edge_time, events)
+            else:
+                self.stale += 1
+
+    def _change(self, index, near, distance, edge_time, events):
+        try:
+            self.sensors[index].set_range_interrupt(
+                VL6180X.RANGE_INTERRUPT_LEVEL_HIGH if near else VL6180X.RANGE_INTERRUPT_LEVEL_LOW)
+        except IOError:
+            # The state stays the same, the sensor raises the same interrupt again
+            self.errors += 1
+            return
+        self.near[index] = near
+        self.distances[index] = distance if near else None
+        now = time.time()
+        latency = now - edge_time
+        self.events += 1
+        self.latency_sum += latency
+        self.latency_max = max(self.latency_max, latency)
+        events.append(ProximityEvent(ENTER if near else LEAVE, index, distance, now, latency))
+
+    def stats(self):
+        return {"edges": self.line_edges, "reads": self.reads, "spurious": self.spurious, "stale": self.stale,
+                "errors": self.errors, "events": self.events,
+                "latency_mean": self.latency_sum / self.events if self.events else 0.0,
+                "latency_max": self.latency_max}
+
+    def report(self):
+        stats = self.stats()
+        return ("Events: %(events)d from %(edges)d edges, %(reads)d sensor reads (%(spurious)d without interrupt, "
+                "%(stale)d stale), %(errors)d errors\n" % stats +
+                "Latency from edge to event: mean %.2f ms, max %.2f ms" % (
+                    stats["latency_mean"] * 1000, stats["latency_max"] * 1000))
@@ -0,0 +1,138 @@
+"""
+This file contains the AcquisitionEngine, that reads sensors on several I2C buses at the same time.
+Every bus gets its own worker thread. For every frame all workers read their sensors in parallel, and the results
+are merged into one frame with a timestamp. The time per frame is then the time of the slowest bus, instead of the
+sum of all buses, so the throughput grows with the number of buses.
+
+The sensors only need a bus attribute (VL53L0X and VL6180X have one, see their bus argument).
+By default every sensor is read with get_distance, pass read_bus to read the sensors of a bus in another way,
+for example VL6180X.read_ready for pipelined VL6180X sensors.
+
+A failed measurement (IOError) gives None. Any other exception in a worker is a bug, read_frame raises it again.
+The ST library of the VL53L0X isn't reentrant, VL53L0X.py holds a lock around every call into it. get_distance waits for
+the measurement inside the library, so plain VL53L0X buses are read one after the other. With the ReadyScheduler
+(ready_scheduler.py) the waiting happens outside the library and the buses still overlap. VL6180X buses run fully in
+parallel.
+"""
+import threading
+import time
+import traceback
+
+
+def read_each(sensors):
+    """
+    Reads the sensors of one bus one after the other with get_distance.
+    :return: The distance per sensor, None if reading it failed
+    """
+    distances = []
+    for sensor in sensors:
+        try:
+            distances.append(sensor.get_distance())
+        except IOError:
+            distances.append(None)
+    return distances
+
+
+class BusWorker(threading.Thread):
+    """Reads the sensors of one bus whenever the engine starts a frame."""
+
+    def __init__(self, engine, bus, indexes, sensors):
+        threading.Thread.__init__(self, name="i2c-%s" % bus)
+        self.daemon = True
+        self.engine = engine
+        self.bus = bus
+        self.indexes = indexes
+        self.sensors = sensors
+        self.generation = 0
+        self.read_time = 0.0  # The time the last read of this bus took, in seconds
+
+    def run(self):
+        engine = self.engine
+        while True:
+            with engine.condition:
+                while engine.generation == self.generation and engine.running:
+                    engine.condition.wait()
+                if not engine.running:
+                    return
+                self.generation = engine.generation
+            start = time.time()
+            try:
+                distances = engine.read_bus(self.sensors)
+            except IOError:
+                distances = [None] * len(self.sensors)
+            except Exception as error:
+                traceback.print_exc()
+                distances = [None] * len(self.sensors)
+                with engine.condition:
+                    engine.error = error
+            self.read_time = time.time() - start
+            with engine.condition:
+                for index, distance in zip(self.indexes, distances):
+                    engine.distances[index] = distance
+                engine.pending -= 1
+                if engine.pending == 0:
+                    engine.condition.notify_all()
+
+
+class AcquisitionEngine(object):
+    """Reads sensors on several buses in parallel, one worker thread per bus."""
+
+    def __init__(self, sensors, read_bus=read_each):
+        """
+        :param sensors: The sensors, in the order they appear in the frame. Each one has a bus attribute.
+        :param read_bus: Function that reads a list of sensors of one bus and returns their distances
+        """
+        self.sensors = sensors
+        self.read_bus = read_bus
+        self.condition = threading.Condition()
+        self.generation = 0
+        self.pending = 0
+        self.running = False
+        self.error = None  # An exception of a worker that read_frame raises
+        self.distances = [None] * len(sensors)
+        buses = {}
+        for index, sensor in enumerate(sensors):
+            buses.setdefault(sensor.bus, []).append(index)
+        self.workers = [BusWorker(self, bus, indexes, [sensors[index] for index in indexes])
+                        for bus, indexes in sorted(buses.items())]
+
+    def start(self):
+        self.running = True
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        for worker in self.workers:
+            # The workers only run after the first read_frame, a thread that was never started can't be joined
+            if worker.is_alive():
+                worker.join()
+
+    def read_frame(self):
+        """
+        Reads all sensors, every bus in parallel.
+        :return: (timestamp, distances). timestamp is the time all sensors were read, distances has one value per sensor.
+        :raise Exception: The exception of a worker whose read_bus failed with something else than an IOError
+        """
+        if not self.running:
+            self.start()
+        with self.condition:
+            self.distances = [None] * len(self.sensors)
+            self.pending = len(self.workers)
+            self.generation += 1
+            self.condition.notify_all()
+            while self.pending > 0:
+                # With a timeout, so Ctrl-C still works in python 2
+                self.condition.wait(1.0)
+            if self.error is not None:
+                error, self.error = self.error, None
+                raise error
+            return time.time(), self.distances
+
+    def bus_times(self):
+        """
+        :return: A dict with the time the last read of every bus took, in seconds
+        """
+        return dict((worker.bus, worker.read_time) for worker in self.workers)
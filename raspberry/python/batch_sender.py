@@ -0,0 +1,144 @@
+"""
+This file contains the BatchSender, that sends several binary frames in one UDP datagram.
+
+Sending a datagram costs a system call and an interrupt on the raspberry pi and on the pc, whatever its size. At high
+frame rates that is most of the work. The BatchSender collects consecutive frames and sends them together when the
+datagram would become larger than max_bytes, or when the oldest frame has waited max_delay seconds, whichever comes
+first. So a frame is never more than max_delay late, and at high rates many frames share one datagram.
+
+A batch is just the frames after each other: every binary frame knows its own size (skin_frame.frame_size), so the pc
+unpacks them with skin_frame.decode_all. A datagram with one frame is the same as before, so batching can be switched
+on and off without changing the pc. ASCII frames have no size, they are always sent alone.
+
+With max_delay 0 every frame is sent right away, like sock.sendto.
+
+A batch that can't be sent (socket.error, e.g. ENETUNREACH while the WiFi is down) is dropped and counted in stats, the
+sender keeps going so the next batches are sent in time again once the network is back.
+"""
+import socket
+import threading
+import time
+
+import skin_frame
+
+MAX_BYTES = 1400  # Fits in one ethernet packet, so a lost packet loses only one batch
+
+# time.monotonic doesn't exist in python 2
+monotonic = getattr(time, "monotonic", time.time)
+
+
+class BatchSender(object):
+    """Collects frames and sends them in batches, a background thread sends a batch when its deadline passes."""
+
+    def __init__(self, sock, address, encoder=None, max_bytes=MAX_BYTES, max_delay=0.01):
+        """
+        :param sock: A UDP socket
+        :param address: (ip, port) to send to
+        :param encoder: The skin_frame.FrameEncoder of the frames, its stamp_send is called when a batch is sent
+        :param max_bytes: The maximum size of a datagram
+        :param max_delay: The maximum time in seconds a frame waits, 0 to send every frame right away
+        """
+        self.sock = sock
+        self.address = address
+        self.encoder = encoder
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.condition = threading.Condition()
+        self.frames = []
+        self.size = 0
+        self.deadline = None
+        self.running = True
+        # Counters
+        self.datagrams = 0
+        self.sent_frames = 0
+        self.sent_bytes = 0
+        self.full = 0  # Batches that were sent because the next frame didn't fit
+        self.expired = 0  # Batches that were sent because of the deadline
+        self.send_errors = 0  # Batches that were dropped because sendto failed
+        self.dropped_frames = 0
+        self.thread = None
+        if max_delay > 0:
+            self.thread = threading.Thread(target=self._run, name="batch-sender")
+            self.thread.daemon = True
+            self.thread.start()
+
+    def send(self, frame):
+        """
+        Adds a frame to the batch.
+        :param frame: A frame of skin_frame.FrameEncoder.encode
+        """
+        if self.max_delay <= 0 or frame[:2] != skin_frame.MAGIC:
+            with self.condition:
+                self._flush()
+                self.frames.append(frame)
+                self.size = len(frame)
+                self._flush()
+            return
+        with self.condition:
+            if self.frames and self.size + len(frame) > self.max_bytes:
+                self.full += 1
+                self._flush()
+            if not self.frames:
+                self.deadline = monotonic() + self.max_delay
+                self.condition.notify()
+            self.frames.append(frame)
+            self.size += len(frame)
+            if self.size + len(frame) > self.max_bytes:
+                # The next frame of this size won't fit, don't wait for it
+                self.full += 1
+                self._flush()
+
+    def flush(self):
+        """Sends the frames that are waiting."""
+        with self.condition:
+            self._flush()
+
+    def close(self):
+        """Sends the frames that are waiting and stops the thread."""
+        with self.condition:
+            self.running = False
+            self._flush()
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _run(self):
+        with self.condition:
+            while self.running:
+                if not self.frames:
+                    self.condition.wait()
+                    continue
+                remaining = self.deadline - monotonic()
+                if remaining > 0:
+                    self.condition.wait(remaining)
+                    continue
+                self.expired += 1
+                self._flush()
+
+    def _flush(self):
+        # Called with the lock held
+        if not self.frames:
+            return
+        if self.encoder is not None:
+            for frame in self.frames:
+                self.encoder.stamp_send(frame)
+        data = self.frames[0] if len(self.frames) == 1 else bytearray().join(self.frames)
+        try:
+            self.sock.sendto(data, self.address)
+        except socket.error:
+            # Dropping the batch is all UDP would do too, the thread has to stay alive for the next deadlines
+            self.send_errors += 1
+            self.dropped_frames += len(self.frames)
+        else:
+            self.datagrams += 1
+            self.sent_frames += len(self.frames)
+            self.sent_bytes += len(data)
+        self.frames = []
+        self.size = 0
+        self.deadline = None
+
+    def stats(self):
+        return {"datagrams": self.datagrams, "frames": self.sent_frames, "bytes": self.sent_bytes,
+                "frames_per_datagram": self.sent_frames / float(self.datagrams) if self.datagrams else 0.0,
+                "full": self.full, "expired": self.expired, "send_errors": self.send_errors,
+                "dropped_frames": self.dropped_frames}
@@ -0,0 +1,196 @@
+"""
+This file finds the VL53L0X and VL6180X sensors that are connected, directly or behind TCA9548A multiplexers.
+A channel is probed by reading the model id register of the sensor, which is one I2C transaction, instead of
+initialising the sensor. All eight channels of every multiplexer on 0x70 - 0x77 are scanned. Every bus is scanned by
+its own thread, the channels of one bus are scanned one after the other because they share the bus.
+
+The topology that is found can be saved to a cache file. On the next start the multiplexer addresses are checked, and
+every place a sensor can be (directly on the bus and every channel of the cached multiplexers) is probed with one model
+id read: the cached sensors must answer with the same type and the empty places must stay empty, so a sensor that was
+plugged in since is found as well. When something changed, a full scan is done and the cache is written again.
+
+Every sensor in the topology is a dict:
+    {"bus": 1, "mux": 0x70, "channel": 3, "address": 0x29, "type": "VL53L0X"}
+mux and channel are None for a sensor that is connected directly.
+"""
+import json
+import os
+import threading
+
+import TCA9548A
+
+MUX_ADDRESSES = range(0x70, 0x78)
+SENSOR_ADDRESS = 0x29
+
+VL53L0X = "VL53L0X"
+VL6180X = "VL6180X"
+VL53L0X_MODEL_ID_REGISTER = 0xC0  # 8 bit register address
+VL53L0X_MODEL_ID = 0xEE
+VL6180X_MODEL_ID_REGISTER = 0x0000  # 16 bit register address
+VL6180X_MODEL_ID = 0xB4
+
+
+def open_smbus(bus):
+    import smbus
+    return smbus.SMBus(bus)
+
+
+def probe(i2c, address=SENSOR_ADDRESS, sensor_types=(VL53L0X, VL6180X)):
+    """
+    Reads the model id register to find out which sensor answers on an address.
+    The VL53L0X is probed first, because that probe only reads.
+    :return: The sensor type, None if there is no (known) sensor
+    """
+    if VL53L0X in sensor_types:
+        try:
+            if i2c.read_byte_data(address, VL53L0X_MODEL_ID_REGISTER) == VL53L0X_MODEL_ID:
+                return VL53L0X
+        except IOError:
+            return None
+    if VL6180X in sensor_types:
+        try:
+            i2c.write_i2c_block_data(address, (VL6180X_MODEL_ID_REGISTER >> 8) & 0xFF,
+                                     [VL6180X_MODEL_ID_REGISTER & 0xFF])
+            if i2c.read_byte(address) == VL6180X_MODEL_ID:
+                return VL6180X
+        except IOError:
+            return None
+    return None
+
+
+def find_multiplexers(i2c):
+    """
+    :return: The addresses of the TCA9548A multiplexers that answer on the bus
+    """
+    found = []
+    for address in MUX_ADDRESSES:
+        try:
+            i2c.read_byte(address)
+            found.append(address)
+        except IOError:
+            pass
+    return found
+
+
+def scan_bus(bus, i2c, sensor_types=(VL53L0X, VL6180X), address=SENSOR_ADDRESS):
+    """
+    Scans one bus: the sensor that is connected directly, and every channel of every multiplexer.
+    :return: A dict with the multiplexer addresses ("muxes") and the sensors that were found ("sensors")
+    """
+    multiplexer = TCA9548A.get_multiplexer(i2c)
+    muxes = find_multiplexers(i2c)
+    sensors = []
+    for mux in muxes:
+        multiplexer.deselect(mux)
+    sensor_type = probe(i2c, address, sensor_types)
+    if sensor_type is not None:
+        sensors.append({"bus": bus, "mux": None, "channel": None, "address": address, "type": sensor_type})
+    for mux in muxes:
+        for channel in range(8):
+            try:
+                multiplexer.select(mux, channel)
+            except IOError:
+                continue
+            sensor_type = probe(i2c, address, sensor_types)
+            if sensor_type is not None:
+                sensors.append({"bus": bus, "mux": mux, "channel": channel, "address": address, "type": sensor_type})
+        multiplexer.deselect(mux)
+    return {"muxes": muxes, "sensors": sensors}
+
+
+def validate_bus(bus, i2c, cached, sensor_types=(VL53L0X, VL6180X), address=SENSOR_ADDRESS):
+    """
+    Checks a cached scan of a bus: the same multiplexers must answer, every cached sensor must still answer with the
+    right model id, and no sensor may answer where none was found (a sensor that was plugged in since).
+    :return: True if the cache is still valid
+    """
+    if find_multiplexers(i2c) != cached["muxes"]:
+        return False
+    multiplexer = TCA9548A.get_multiplexer(i2c)
+    found = dict(((sensor["mux"], sensor["channel"]), sensor) for sensor in cached["sensors"])
+    places = [(None, None)] + [(mux, channel) for mux in cached["muxes"] for channel in range(8)]
+    try:
+        for mux, channel in places:
+            if mux is None:
+                for cached_mux in cached["muxes"]:
+                    multiplexer.deselect(cached_mux)
+            else:
+                multiplexer.select(mux, channel)
+            sensor = found.get((mux, channel))
+            if sensor is None:
+                if probe(i2c, address, sensor_types) is not None:
+                    return False
+            elif probe(i2c, sensor["address"], (sensor["type"],)) != sensor["type"]:
+                return False
+        for mux in cached["muxes"]:
+            multiplexer.deselect(mux)
+    except IOError:
+        return False
+    return True
+
+
+def _run_per_bus(function, buses, open_bus):
+    """Runs function(bus, i2c) for every bus in its own thread, returns a dict bus -> result."""
+    results = {}
+
+    def run(bus):
+        try:
+            results[bus] = function(bus, open_bus(bus))
+        except (IOError, OSError):
+            results[bus] = None
+
+    threads = [threading.Thread(target=run, args=(bus,)) for bus in buses]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def load_cache(cache_file):
+    try:
+        with open(cache_file) as cache:
+            return dict((int(bus), scan) for bus, scan in json.load(cache).items())
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def save_cache(cache_file, scans):
+    with open(cache_file, "w") as cache:
+        json.dump(dict((str(bus), scan) for bus, scan in scans.items()), cache, indent=2, sort_keys=True)
+
+
+def discover(buses=(1,), sensor_types=(VL53L0X, VL6180X), cache_file=None, open_bus=open_smbus, rescan=False):
+    """
+    Finds the connected sensors on the buses.
+    :param buses: The I2C bus numbers to scan
+    :param sensor_types: The sensor types to look for
+    :param cache_file: The file to keep the topology in, None for no cache
+    :param open_bus: Function that returns the bus object of a bus number. Pass the get_i2c_bus function of the
+                     sensor module, so the multiplexer state is shared with the sensors.
+    :param rescan: Ignore the cache and do a full scan
+    :return: The list of sensors, sorted by bus, multiplexer and channel
+    """
+    buses = list(buses)
+    scans = None
+    if cache_file is not None and not rescan and os.path.exists(cache_file):
+        cached = load_cache(cache_file)
+        if cached is not None and sorted(cached) == sorted(buses):
+            valid = _run_per_bus(lambda bus, i2c: validate_bus(bus, i2c, cached[bus], sensor_types),
+                                 buses, open_bus)
+            if all(valid.values()):
+                scans = cached
+    if scans is None:
+        scans = _run_per_bus(lambda bus, i2c: scan_bus(bus, i2c, sensor_types), buses, open_bus)
+        scans = dict((bus, scan) for bus, scan in scans.items() if scan is not None)
+        if cache_file is not None:
+            save_cache(cache_file, scans)
+    sensors = [sensor for bus in sorted(scans) for sensor in scans[bus]["sensors"]
+               if sensor["type"] in sensor_types]
+    return sorted(sensors, key=sort_key)
+
+
+def sort_key(sensor):
+    return (sensor["bus"],
+            -1 if sensor["mux"] is None else sensor["mux"],
+            -1 if sensor["channel"] is None else sensor["channel"])
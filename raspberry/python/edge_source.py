@@ -0,0 +1,124 @@
+"""
+This file contains the edge sources, that tell which interrupt lines of the sensors became active.
+
+The interrupt output (GPIO1) of a sensor is wired to a GPIO pin of the raspberry pi. The outputs are open drain and
+active low, so several sensors can share one pin: the line is active while any of them has an interrupt. An edge
+source waits for the lines without using the I2C bus, the event mode (see proximity.py) then only reads the sensors
+of a line that fired.
+
+ - GpioEdgeSource uses RPi.GPIO: the kernel detects the falling edges, a thread of RPi.GPIO puts them in a queue.
+ - SimEdgeSource watches simulated sensors (sim_bus.SimVL6180X), so the event mode can be tested without hardware.
+
+Both have the same functions: wait(timeout) returns the lines that fired as (pin, time) tuples, asserted(pin) tells
+whether a line is still active (an edge is missed when a second sensor raises its interrupt while the line is
+already low), close() releases the pins.
+"""
+import threading
+import time
+
+try:
+    import queue
+except ImportError:  # python 2
+    import Queue as queue
+
+try:
+    import RPi.GPIO as GPIO
+except (ImportError, RuntimeError):  # Not on a raspberry pi, only the SimEdgeSource can be used
+    GPIO = None
+
+
+class _QueueEdgeSource(object):
+    """The queue of the lines that fired, shared by both edge sources."""
+
+    def __init__(self, pins):
+        self.pins = list(pins)
+        self.queue = queue.Queue()
+        self.edges = 0
+
+    def _edge(self, pin):
+        self.queue.put((pin, time.time()))
+
+    def wait(self, timeout=1.0):
+        """
+        Waits until a line fires.
+        :param timeout: The maximum time to wait in seconds
+        :return: A list of (pin, time of the edge), every line at most once, empty when nothing fired in time
+        """
+        try:
+            edges = [self.queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                edges.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        self.edges += len(edges)
+        # A line that fired twice only needs to be handled once, with its first time
+        first = {}
+        for pin, edge_time in edges:
+            first.setdefault(pin, edge_time)
+        return sorted(first.items(), key=lambda edge: edge[1])
+
+
+class GpioEdgeSource(_QueueEdgeSource):
+    """Waits for the falling edges of GPIO pins with RPi.GPIO."""
+
+    def __init__(self, pins, bouncetime=None):
+        """
+        :param pins: The GPIO pins (BCM numbering) the interrupt lines are wired to
+        :param bouncetime: The time in ms in which a second edge is ignored, None to keep every edge
+        """
+        if GPIO is None:
+            raise RuntimeError("RPi.GPIO is not available, use a SimEdgeSource without a raspberry pi")
+        _QueueEdgeSource.__init__(self, pins)
+        GPIO.setmode(GPIO.BCM)
+        for pin in self.pins:
+            # The sensor outputs are open drain, the pull up keeps the line high while no sensor is active
+            GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+            if bouncetime is None:
+                GPIO.add_event_detect(pin, GPIO.FALLING, callback=self._edge)
+            else:
+                GPIO.add_event_detect(pin, GPIO.FALLING, callback=self._edge, bouncetime=bouncetime)
+
+    def asserted(self, pin):
+        return GPIO.input(pin) == GPIO.LOW
+
+    def close(self):
+        for pin in self.pins:
+            GPIO.remove_event_detect(pin)
+        GPIO.cleanup(self.pins)
+
+
+class SimEdgeSource(_QueueEdgeSource):
+    """Fires the lines of simulated sensors, a thread looks at their interrupt every poll_interval seconds."""
+
+    def __init__(self, lines, poll_interval=0.0005):
+        """
+        :param lines: A dict pin -> list of the simulated sensors that are wired to it (see sim_bus.sensors_of)
+        :param poll_interval: The time between two looks in seconds, the simulated edge detection latency
+        """
+        _QueueEdgeSource.__init__(self, sorted(lines))
+        self.lines = lines
+        self.levels = dict((pin, False) for pin in self.pins)
+        self.running = True
+        self.poll_interval = poll_interval
+        self.thread = threading.Thread(target=self._run, name="sim-edges")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def asserted(self, pin):
+        return any(sensor.interrupt_asserted() for sensor in self.lines[pin])
+
+    def _run(self):
+        while self.running:
+            for pin in self.pins:
+                level = self.asserted(pin)
+                if level and not self.levels[pin]:
+                    self._edge(pin)
+                self.levels[pin] = level
+            time.sleep(self.poll_interval)
+
+    def close(self):
+        self.running = False
+        self.thread.join()
@@ -0,0 +1,251 @@
+"""
+This file contains the FrameRing, a ring buffer in shared memory between the acquisition and the processes that use
+the frames on the raspberry pi.
+
+The acquisition loop only writes every frame in the ring, the UDP streamer, the recorder and any local analysis run
+as separate processes that read the ring at their own pace (see ring_consumer.py). A slow reader never stalls the
+sensors: the writer doesn't wait for anyone. A reader that falls more than a ring behind loses the oldest frames, they
+are counted as overruns of that reader.
+
+The ring is a file that is mapped in memory by every process (in /dev/shm, so it never touches the SD card):
+
+    offset  size  field
+    0       8     magic, always "SKINRING"
+    8       2     version
+    10      2     number of sensors (n)
+    12      4     number of slots
+    16      4     size of a slot
+    24      8     head, the number of frames that were written
+    32      8     closed, 1 when the writer stopped
+    64      32    per reader (MAX_READERS): name (16 bytes), cursor, overruns
+    320     ...   the slots
+
+A slot holds the index of its frame (8 bytes) followed by a record in the format of skin_recorder.py: timestamp,
+sequence number, n distances and n status bytes.
+
+There is one writer and no lock. The writer fills the slot of frame head and only then increases head, so a reader
+never sees a frame that isn't finished. A reader copies the frames between its cursor and head, and reads head again
+after copying: the frames the writer may have overwritten in the meantime are thrown away and counted as overruns.
+Every reader has its own cursor and overrun counter in the header, so they can be watched from outside
+(python ring_consumer.py stats).
+
+multiprocessing.shared_memory doesn't exist in python 2, so the ring is a plain mmap of a file.
+
+Usage:
+    ring = FrameRing.create(RING_PATH, nb_sensors)  # In the acquisition process
+    ring.write(distances, timestamp)
+    ring.close()
+    ...
+    reader = RingReader(RING_PATH, 0, "streamer")  # In another process
+    for timestamp, seq, distances in reader.read():
+        ...
+"""
+import mmap
+import os
+import struct
+import tempfile
+import time
+
+import skin_frame
+from skin_recorder import record_struct
+
+MAGIC = b"SKINRING"
+VERSION = 1
+HEADER = struct.Struct("<8sHHII")  # magic, version, number of sensors, number of slots, slot size
+COUNTER = struct.Struct("<Q")
+HEAD_OFFSET = 24
+CLOSED_OFFSET = 32
+READER = struct.Struct("<16sQQ")  # name, cursor, overruns
+READERS_OFFSET = 64
+MAX_READERS = 8
+SLOTS_OFFSET = READERS_OFFSET + MAX_READERS * READER.size
+SLOT_INDEX = struct.Struct("<Q")
+SLOTS = 1024  # The number of frames in the ring
+POLL_INTERVAL = 0.001  # s, how often a reader looks for new frames
+RING_PATH = os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "skin_ring")
+
+
+def slot_size(count):
+    """The size of a slot with count sensors."""
+    return SLOT_INDEX.size + record_struct(count).size
+
+
+def _map(path, size=None):
+    """Maps a ring file, creates it with size bytes when size is given."""
+    if size is None:
+        ring_file = open(path, "r+b")
+    else:
+        ring_file = open(path, "w+b")
+        ring_file.truncate(size)
+    try:
+        return mmap.mmap(ring_file.fileno(), 0)
+    finally:
+        # The mapping stays valid after the file is closed
+        ring_file.close()
+
+
+class FrameRing(object):
+    """The writing side of the ring, used by the acquisition loop."""
+
+    def __init__(self, path, memory, nb_sensors, slots):
+        self.path = path
+        self.memory = memory
+        self.nb_sensors = nb_sensors
+        self.slots = slots
+        self.slot_size = slot_size(nb_sensors)
+        self.record = record_struct(nb_sensors)
+        self.head = 0
+        self.seq = 0
+        self.write_time = 0.0  # The total time spent in write, in seconds
+
+    @classmethod
+    def create(cls, path, nb_sensors, slots=SLOTS):
+        """
+        Creates a new ring, an old ring file with the same path is replaced.
+        :param path: The ring file, give every acquisition process on a raspberry pi its own
+        :param nb_sensors: The number of sensors per frame
+        :param slots: The number of frames in the ring
+        """
+        size = SLOTS_OFFSET + slots * slot_size(nb_sensors)
+        memory = _map(path, size)
+        HEADER.pack_into(memory, 0, MAGIC, VERSION, nb_sensors, slots, slot_size(nb_sensors))
+        return cls(path, memory, nb_sensors, slots)
+
+    def write(self, distances, timestamp=None, seq=None):
+        """
+        Writes one frame, never waits for the readers.
+        :param distances: The distance per sensor, None or <= 0 for a failed measurement
+        :param timestamp: The time of the measurement, defaults to now
+        :param seq: The sequence number, defaults to one more than the last one
+        """
+        start = skin_frame.clock()
+        if timestamp is None:
+            timestamp = time.time()
+        if seq is None:
+            seq = self.seq
+        self.seq = (seq + 1) & 0xFFFFFFFF
+        status = [1 if skin_frame.is_valid(distance) else 0 for distance in distances]
+        offset = SLOTS_OFFSET + (self.head % self.slots) * self.slot_size
+        SLOT_INDEX.pack_into(self.memory, offset, self.head)
+        self.record.pack_into(self.memory, offset + SLOT_INDEX.size, timestamp, seq,
+                              *(skin_frame.clamp_distances(distances) + status))
+        # Only now the readers can see the frame
+        self.head += 1
+        COUNTER.pack_into(self.memory, HEAD_OFFSET, self.head)
+        self.write_time += skin_frame.clock() - start
+
+    def close(self, remove=True):
+        """
+        Tells the readers that no frames follow, they stop after reading the last ones.
+        :param remove: Remove the ring file, the readers that have it open keep working
+        """
+        COUNTER.pack_into(self.memory, CLOSED_OFFSET, 1)
+        self.memory.close()
+        if remove:
+            os.remove(self.path)
+
+    def report(self):
+        return "Ring: %d frames, %.1f us per write" % (
+            self.head, 1e6 * self.write_time / self.head if self.head else 0.0)
+
+
+class RingReader(object):
+    """One reader of a ring, with its own cursor and overrun counter."""
+
+    def __init__(self, path, reader=0, name="", from_start=False):
+        """
+        :param path: The ring file of the acquisition process
+        :param reader: The number of this reader, 0 .. MAX_READERS - 1, every reader of a ring needs its own
+        :param name: A name that is shown in the stats
+        :param from_start: Start at the oldest frame that is still in the ring instead of the newest
+        """
+        if not 0 <= reader < MAX_READERS:
+            raise ValueError("The reader number has to be between 0 and %d" % (MAX_READERS - 1))
+        self.memory = _map(path)
+        magic, version, self.nb_sensors, self.slots, self.slot_size = HEADER.unpack_from(self.memory, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a frame ring" % path)
+        self.record = record_struct(self.nb_sensors)
+        self.offset = READERS_OFFSET + reader * READER.size
+        head = self._head()
+        self.cursor = max(head - self.slots, 0) if from_start else head
+        self.overruns = 0
+        READER.pack_into(self.memory, self.offset, name.encode("ascii")[:16], self.cursor, 0)
+
+    def _head(self):
+        return COUNTER.unpack_from(self.memory, HEAD_OFFSET)[0]
+
+    def closed(self):
+        return COUNTER.unpack_from(self.memory, CLOSED_OFFSET)[0] != 0
+
+    def read(self, max_frames=256, timeout=0.1):
+        """
+        Reads the frames that were written since the last read, waits up to timeout seconds for the first one.
+        :param max_frames: The maximum number of frames that are returned
+        :return: A list of (timestamp, seq, distances), distances has None for a failed measurement. An empty list when
+        nothing was written in time, None when the writer stopped and every frame was read.
+        """
+        deadline = time.time() + timeout
+        head = self._head()
+        while head == self.cursor:
+            if self.closed():
+                # The last frames may have been written right before closing
+                head = self._head()
+                if head == self.cursor:
+                    return None
+                break
+            if time.time() >= deadline:
+                return []
+            time.sleep(POLL_INTERVAL)
+            head = self._head()
+        if head - self.cursor > self.slots:
+            self._overrun(head - self.slots - self.cursor)
+        first = self.cursor
+        last = min(head, first + max_frames)
+        frames = []
+        count = self.nb_sensors
+        for index in range(first, last):
+            offset = SLOTS_OFFSET + (index % self.slots) * self.slot_size
+            values = self.record.unpack_from(self.memory, offset + SLOT_INDEX.size)
+            status = values[2 + count:]
+            distances = [distance if valid else None for distance, valid in zip(values[2:2 + count], status)]
+            frames.append((values[0], values[1], distances))
+        # The writer may have overwritten the oldest frames while they were copied
+        overwritten = self._head() - self.slots + 1 - first
+        if overwritten > 0:
+            frames = frames[overwritten:]
+            self._overrun(min(overwritten, last - first))
+        self.cursor = last
+        COUNTER.pack_into(self.memory, self.offset + 16, self.cursor)
+        return frames
+
+    def _overrun(self, missed):
+        self.overruns += missed
+        self.cursor += missed
+        COUNTER.pack_into(self.memory, self.offset + 24, self.overruns)
+
+    def close(self):
+        self.memory.close()
+
+
+def ring_stats(path):
+    """
+    :return: A dict with the head of the ring and the name, cursor, lag and overruns of every reader that was opened
+    """
+    memory = _map(path)
+    try:
+        magic, _, nb_sensors, slots, _ = HEADER.unpack_from(memory, 0)
+        if magic != MAGIC:
+            raise ValueError("%s is not a frame ring" % path)
+        head = COUNTER.unpack_from(memory, HEAD_OFFSET)[0]
+        readers = []
+        for reader in range(MAX_READERS):
+            name, cursor, overruns = READER.unpack_from(memory, READERS_OFFSET + reader * READER.size)
+            name = name.rstrip(b"\0").decode("ascii")
+            if name or cursor:
+                readers.append({"reader": reader, "name": name, "cursor": cursor, "lag": head - cursor,
+                                "overruns": overruns})
+        return {"sensors": nb_sensors, "slots": slots, "head": head,
+                "closed": COUNTER.unpack_from(memory, CLOSED_OFFSET)[0] != 0, "readers": readers}
+    finally:
+        memory.close()
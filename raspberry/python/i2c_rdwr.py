@@ -0,0 +1,187 @@
+"""
+This file contains an I2C bus that talks to /dev/i2c-N with the I2C_RDWR ioctl instead of smbus.
+With I2C_RDWR a register read (write the register address, then read) is one combined transaction with a repeated start,
+so it costs one system call instead of two or more. It can also read any number of bytes in one go (burst read),
+and send many writes in one system call (batched writes).
+
+I2CRdwrBus has the same read/write functions as smbus.SMBus that are used in this repository, so it can replace it.
+"""
+import ctypes
+import ctypes.util
+import os
+
+I2C_RDWR = 0x0707  # ioctl number, see linux/i2c-dev.h
+I2C_M_RD = 0x0001  # Message flag: read data from the slave
+I2C_RDWR_IOCTL_MAX_MSGS = 42  # The kernel refuses more messages in one ioctl
+
+
+class i2c_msg(ctypes.Structure):
+    _fields_ = [("addr", ctypes.c_uint16),
+                ("flags", ctypes.c_uint16),
+                ("len", ctypes.c_uint16),
+                ("buf", ctypes.POINTER(ctypes.c_uint8))]
+
+
+class i2c_rdwr_ioctl_data(ctypes.Structure):
+    _fields_ = [("msgs", ctypes.POINTER(i2c_msg)),
+                ("nmsgs", ctypes.c_uint32)]
+
+
+_libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+
+
+def to_buffer(data):
+    """
+    Converts a list of byte values to a ctypes buffer that can be used in a message.
+    """
+    return (ctypes.c_uint8 * len(data)).from_buffer_copy(bytearray(data))
+
+
+class I2CRdwrBus(object):
+    """An I2C bus that uses combined I2C_RDWR transactions."""
+
+    def __init__(self, bus=1):
+        self.bus = bus
+        self.fd = os.open("/dev/i2c-%d" % bus, os.O_RDWR)
+        # Transaction counters
+        self.ioctls = 0
+        self.messages = 0
+        # Preallocated messages for the 8 bit register functions, so a register access allocates nothing
+        self._register = (ctypes.c_uint8 * 1)()
+        self._write_buffer = (ctypes.c_uint8 * 257)()
+        self._msgs = (i2c_msg * 2)()
+        self._msgs[0].len = 1
+        self._msgs[0].buf = ctypes.cast(self._register, ctypes.POINTER(ctypes.c_uint8))
+        self._msgs[1].flags = I2C_M_RD
+        self._read_data = i2c_rdwr_ioctl_data(self._msgs, 2)
+        self._write_msg = i2c_msg(0, 0, 0, ctypes.cast(self._write_buffer, ctypes.POINTER(ctypes.c_uint8)))
+        self._write_data = i2c_rdwr_ioctl_data(ctypes.pointer(self._write_msg), 1)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def transfer(self, messages):
+        """
+        Sends messages in one I2C_RDWR ioctl. Between the messages a repeated start is used instead of a stop.
+        :param messages: A list of (address, flags, buffer, length) tuples. buffer is a ctypes array or pointer.
+        """
+        msgs = (i2c_msg * len(messages))()
+        for index, (address, flags, buf, length) in enumerate(messages):
+            msgs[index].addr = address
+            msgs[index].flags = flags
+            msgs[index].len = length
+            msgs[index].buf = ctypes.cast(buf, ctypes.POINTER(ctypes.c_uint8))
+        self._ioctl(i2c_rdwr_ioctl_data(msgs, len(messages)))
+
+    def _ioctl(self, data):
+        self.ioctls += 1
+        self.messages += data.nmsgs
+        if _libc.ioctl(self.fd, I2C_RDWR, ctypes.byref(data)) < 0:
+            errno = ctypes.get_errno()
+            raise IOError(errno, os.strerror(errno))
+
+    def read_register_into(self, address, register, buf, length):
+        """
+        Reads length bytes from an 8 bit register straight into buf, in one transaction with preallocated messages.
+        This is the fast path for the i2c_read callback of the VL53L0X library: the data is never copied in python.
+        :param buf: A ctypes array or pointer with room for length bytes
+        """
+        self._register[0] = register
+        self._msgs[0].addr = address
+        self._msgs[1].addr = address
+        self._msgs[1].len = length
+        self._msgs[1].buf = ctypes.cast(buf, ctypes.POINTER(ctypes.c_uint8))
+        self._ioctl(self._read_data)
+
+    def write_register_from(self, address, register, buf, length):
+        """
+        Writes length bytes from buf to an 8 bit register, in one message with a preallocated buffer.
+        This is the fast path for the i2c_write callback of the VL53L0X library.
+        :param buf: A ctypes array or pointer with length bytes
+        """
+        self._write_buffer[0] = register
+        ctypes.memmove(ctypes.byref(self._write_buffer, 1), buf, length)
+        self._write_msg.addr = address
+        self._write_msg.len = length + 1
+        self._ioctl(self._write_data)
+
+    def read_into(self, address, write_data, buf, length):
+        """
+        Writes write_data (the register address) and reads length bytes into buf, in one transaction.
+        :param buf: A ctypes array or pointer with room for length bytes
+        """
+        out = to_buffer(write_data)
+        self.transfer([(address, 0, out, len(write_data)),
+                       (address, I2C_M_RD, buf, length)])
+
+    def write_read(self, address, write_data, length):
+        """
+        Writes write_data (the register address) and reads length bytes back, in one transaction.
+        :return: The read bytes as a bytearray
+        """
+        buf = (ctypes.c_uint8 * length)()
+        self.read_into(address, write_data, buf, length)
+        return bytearray(buf)
+
+    def write(self, address, data):
+        """
+        Writes data to a device in one message.
+        """
+        self.transfer([(address, 0, to_buffer(data), len(data))])
+
+    def write_batch(self, address, writes):
+        """
+        Sends many separate writes to a device with as few system calls as possible.
+        :param writes: A list of byte lists, each one is a separate message
+        """
+        buffers = [to_buffer(data) for data in writes]
+        for start in range(0, len(buffers), I2C_RDWR_IOCTL_MAX_MSGS):
+            self.transfer([(address, 0, buf, len(buf))
+                           for buf in buffers[start:start + I2C_RDWR_IOCTL_MAX_MSGS]])
+
+    def read_registers16(self, address, register, length):
+        """
+        Burst read of a device with 16 bit register addresses, like the VL6180X.
+        :return: The read bytes as a bytearray
+        """
+        return self.write_read(address, [(register >> 8) & 0xFF, register & 0xFF], length)
+
+    def write_registers16(self, address, table):
+        """
+        Writes a table of registers of a device with 16 bit register addresses, like the VL6180X.
+        Registers with consecutive addresses are merged into one message, the messages are sent with write_batch.
+        :param table: A list of (register, value) tuples with 8 bit values, written in this order
+        """
+        writes = []
+        next_register = None
+        for register, value in table:
+            if register == next_register:
+                writes[-1].append(value & 0xFF)
+            else:
+                writes.append([(register >> 8) & 0xFF, register & 0xFF, value & 0xFF])
+            next_register = register + 1
+        self.write_batch(address, writes)
+
+    # The smbus.SMBus functions that are used in this repository
+
+    def read_byte(self, address):
+        buf = (ctypes.c_uint8 * 1)()
+        self.transfer([(address, I2C_M_RD, buf, 1)])
+        return buf[0]
+
+    def write_byte(self, address, value):
+        self.write(address, [value])
+
+    def read_byte_data(self, address, register):
+        return self.write_read(address, [register], 1)[0]
+
+    def write_byte_data(self, address, register, value):
+        self.write(address, [register, value])
+
+    def read_i2c_block_data(self, address, register, length=32):
+        return list(self.write_read(address, [register], length))
+
+    def write_i2c_block_data(self, address, register, data):
+        self.write(address, [register] + list(data))
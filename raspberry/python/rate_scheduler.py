@@ -0,0 +1,129 @@
+"""
+This file contains the RateScheduler, that runs a loop at a fixed rate.
+Instead of sleeping a fixed time after the work (so the real period is work time + sleep time), it sleeps until
+absolute deadlines on the monotonic clock. The period therefore doesn't drift and doesn't grow when sensors are added.
+
+When the work takes longer than the period (an overrun), the policy decides what happens:
+ - SKIP: the missed ticks are skipped, the loop continues on the next deadline in the future.
+ - CATCH_UP: the missed ticks are run right after each other until the loop is back on schedule.
+
+Usage:
+    scheduler = RateScheduler(timing / 1000000.00)
+    while True:
+        scheduler.wait()
+        ... read the sensors ...
+    print(scheduler.report(timing))
+"""
+import math
+import time
+from collections import deque
+
+# time.monotonic doesn't exist in python 2
+monotonic = getattr(time, "monotonic", time.time)
+
+SKIP = "skip"
+CATCH_UP = "catch_up"
+
+
+class RateScheduler(object):
+    """Ticks against absolute deadlines and keeps jitter and overrun statistics."""
+
+    def __init__(self, period, policy=SKIP, history=1000):
+        """
+        :param period: The period in seconds
+        :param policy: SKIP or CATCH_UP, what to do after an overrun
+        :param history: The number of most recent jitter values that are kept, for the recent p95 of the jitter
+        """
+        if policy not in (SKIP, CATCH_UP):
+            raise ValueError("Unknown overrun policy: %s" % policy)
+        self.period = period
+        self.policy = policy
+        self.next_deadline = None
+        self.start_time = None
+        # Statistics
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.jitter_sum = 0.0
+        self.jitter_square_sum = 0.0
+        self.jitter_max = 0.0
+        self.recent_jitter = deque(maxlen=history)
+
+    def start(self):
+        """Starts the schedule now. Called by the first wait if it isn't called before."""
+        self.start_time = monotonic()
+        self.next_deadline = self.start_time
+
+    def wait(self):
+        """
+        Sleeps until the next deadline. The first call returns immediately.
+        :return: The deadline of this tick, on the monotonic clock
+        """
+        if self.next_deadline is None:
+            self.start()
+        now = monotonic()
+        late = now - self.next_deadline
+        if late > 0 and self.ticks > 0:
+            # The work since the last tick took longer than the period
+            self.overruns += 1
+            if self.policy == SKIP and late >= self.period:
+                missed = int(late // self.period)
+                self.skipped += missed
+                self.next_deadline += missed * self.period
+        if self.next_deadline > now:
+            time.sleep(self.next_deadline - now)
+            now = monotonic()
+        self._record(now - self.next_deadline)
+        deadline = self.next_deadline
+        self.next_deadline += self.period
+        return deadline
+
+    def _record(self, jitter):
+        self.ticks += 1
+        self.jitter_sum += jitter
+        self.jitter_square_sum += jitter * jitter
+        self.jitter_max = max(self.jitter_max, jitter)
+        self.recent_jitter.append(jitter)
+
+    def stats(self):
+        """
+        :return: A dict with the statistics. Times are in seconds, rates in Hz.
+        """
+        elapsed = monotonic() - self.start_time if self.start_time is not None else 0.0
+        ticks = max(self.ticks, 1)
+        mean = self.jitter_sum / ticks
+        variance = max(self.jitter_square_sum / ticks - mean * mean, 0.0)
+        recent = sorted(self.recent_jitter)
+        return {
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "elapsed": elapsed,
+            "target_rate": 1.0 / self.period,
+            "achieved_rate": self.ticks / elapsed if elapsed > 0 else 0.0,
+            "jitter_mean": mean,
+            "jitter_std": math.sqrt(variance),
+            "jitter_max": self.jitter_max,
+            "jitter_p95": recent[int(0.95 * (len(recent) - 1))] if recent else 0.0,  # Of the last history ticks
+        }
+
+    def report(self, timing_budget=None):
+        """
+        A readable summary of the statistics.
+        :param timing_budget: The timing budget of the sensors in microseconds (from get_timing), to compare with the period
+        :return: The summary as a string
+        """
+        stats = self.stats()
+        lines = [
+            "Target rate: %.1f Hz, achieved: %.1f Hz (%d ticks in %.1f s)" % (
+                stats["target_rate"], stats["achieved_rate"], stats["ticks"], stats["elapsed"]),
+            "Jitter: mean %.3f ms, std %.3f ms, max %.3f ms, recent p95 %.3f ms" % (
+                stats["jitter_mean"] * 1000, stats["jitter_std"] * 1000, stats["jitter_max"] * 1000,
+                stats["jitter_p95"] * 1000),
+            "Overruns: %d, skipped ticks: %d (policy %s)" % (stats["overruns"], stats["skipped"], self.policy),
+        ]
+        if timing_budget:
+            budget_rate = 1000000.0 / timing_budget
+            lines.append("Timing budget: %.1f ms (%.1f Hz), achieved rate is %.0f%% of it" % (
+                timing_budget / 1000.0, budget_rate, 100.0 * stats["achieved_rate"] / budget_rate))
+        return "\n".join(lines)
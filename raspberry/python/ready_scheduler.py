@@ -0,0 +1,181 @@
+"""
+This file contains the ReadyScheduler, that reads every VL53L0X as soon as its measurement is ready.
+
+Sleeping the timing budget before every read wastes time: the sleep starts after the previous read instead of at the
+start of the measurement, and with several sensors one budget is used for all of them, even when they range in other
+modes. The ReadyScheduler knows the timing budget of every sensor. It leaves a sensor alone until its next
+measurement is almost due (early, a fraction of the budget, before), then asks it every poll_interval seconds whether
+the measurement is ready (VL53L0X.data_ready) and reads it right away. The bus is free for the other sensors in the
+meantime, so every sensor measures at its own hardware rate.
+
+read_bus is the read_bus of the AcquisitionEngine (see acquisition.py): it returns when every sensor of the bus has a
+new measurement. A sensor that becomes ready again before that is read again, the frame gets its newest measurement.
+A sensor that isn't ready within timeout budgets gives None.
+
+The time between two measurements is a bit shorter than get_timing says, the scheduler learns it from the moments the
+measurements became ready. The age of a sample is the time from the moment the measurement was ready to the moment
+it was read. The moment it was ready is the last poll that said it wasn't, or, when the first poll already found it
+ready, the previous ready moment plus the period. stats and report give the age and the achieved rate of every sensor.
+"""
+import time
+from collections import deque
+
+# time.monotonic doesn't exist in python 2
+monotonic = getattr(time, "monotonic", time.time)
+
+DEFAULT_BUDGET = 33000  # us, used for a sensor whose timing budget can't be read (get_timing returned 0)
+PERIOD_GAIN = 0.2  # How fast the measured period of a sensor follows a new measurement
+
+
+class _SensorState(object):
+    def __init__(self, budget):
+        self.budget = budget  # s
+        self.period = budget  # The measured time between two measurements, get_timing adds a margin to the budget
+        self.due = 0.0  # The time of the next poll
+        self.checked = None  # The time of the last poll that found no measurement
+        self.ready = None  # The estimated time the last measurement was ready
+        self.seen = None  # The last ready time that was found by polling, not estimated
+        self.samples = 0
+        self.polls = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.age_sum = 0.0
+
+
+class ReadyScheduler(object):
+    """Polls the sensors when their measurement is due and reads them as soon as it is ready."""
+
+    def __init__(self, sensors, budgets=None, early=0.1, poll_interval=0.0005, timeout=2.0, history=1000):
+        """
+        :param sensors: The sensors, ranging continuously. They need data_ready, get_distance and get_timing.
+        :param budgets: The timing budget of every sensor in microseconds, None to ask every sensor with get_timing
+        :param early: How long before a measurement is due the polling starts, as a fraction of the budget
+        :param poll_interval: The time in seconds between two polls of a sensor that isn't ready yet
+        :param timeout: The number of budgets after which a sensor that isn't ready is given up for a frame
+        :param history: The number of most recent sample ages that are kept
+        """
+        if budgets is None:
+            budgets = [sensor.get_timing() for sensor in sensors]
+        self.sensors = list(sensors)
+        self.states = dict((sensor, _SensorState((budget or DEFAULT_BUDGET) / 1000000.0))
+                           for sensor, budget in zip(sensors, budgets))
+        self.early = early
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.ages = deque(maxlen=history)
+        self.age_max = 0.0
+        self.start_time = None
+
+    def read_bus(self, sensors):
+        """
+        Reads every sensor once it has a new measurement.
+        :param sensors: The sensors of one bus
+        :return: The newest distance of every sensor, None if it wasn't ready in time or reading it failed
+        """
+        now = monotonic()
+        if self.start_time is None:
+            self.start_time = now
+        states = [self.states[sensor] for sensor in sensors]
+        distances = [None] * len(sensors)
+        pending = set(range(len(sensors)))
+        deadline = now + self.timeout * max(state.budget for state in states) if states else now
+        while pending:
+            for index, sensor in enumerate(sensors):
+                state = states[index]
+                if state.due > now:
+                    continue
+                try:
+                    distance = self._poll(sensor, state, now)
+                except IOError:
+                    state.errors += 1
+                    state.due = now + state.budget
+                    pending.discard(index)
+                    continue
+                if distance is not None:
+                    distances[index] = distance
+                    pending.discard(index)
+                now = monotonic()
+            if not pending:
+                break
+            if now > deadline:
+                for index in pending:
+                    states[index].timeouts += 1
+                break
+            next_due = min(state.due for state in states)
+            if next_due > now:
+                time.sleep(min(next_due, deadline) - now)
+            now = monotonic()
+        return distances
+
+    def _poll(self, sensor, state, now):
+        """
+        Polls a sensor and reads it when it is ready.
+        :return: The distance, None when it wasn't ready
+        """
+        state.polls += 1
+        if not sensor.data_ready():
+            state.checked = monotonic()
+            state.due = state.checked + self.poll_interval
+            return None
+        distance = sensor.get_distance()
+        read_time = monotonic()
+        if state.checked is not None:
+            ready = state.checked
+            if state.seen is not None:
+                # Learn the real period from two ready times that were found by polling
+                periods = int(round((ready - state.seen) / state.period))
+                if periods >= 1:
+                    state.period += PERIOD_GAIN * ((ready - state.seen) / periods - state.period)
+            state.seen = ready
+        elif state.ready is not None:
+            ready = min(now, state.ready + state.period)
+        else:
+            ready = now
+        age = read_time - ready
+        state.ready = ready
+        state.checked = None
+        state.due = ready + state.period * (1.0 - self.early)
+        state.samples += 1
+        state.age_sum += age
+        self.ages.append(age)
+        self.age_max = max(self.age_max, age)
+        return distance
+
+    def stats(self):
+        """
+        :return: A dict with the sample ages in seconds and a list with the statistics of every sensor, rates in Hz
+        """
+        elapsed = monotonic() - self.start_time if self.start_time is not None else 0.0
+        ages = sorted(self.ages)
+        sensors = []
+        for sensor in self.sensors:
+            state = self.states[sensor]
+            sensors.append({"budget": state.budget, "period": state.period, "samples": state.samples,
+                            "polls": state.polls, "timeouts": state.timeouts, "errors": state.errors,
+                            "rate": state.samples / elapsed if elapsed > 0 else 0.0,
+                            "age_mean": state.age_sum / state.samples if state.samples else 0.0})
+        return {
+            "elapsed": elapsed,
+            "samples": sum(sensor["samples"] for sensor in sensors),
+            "age_mean": sum(ages) / len(ages) if ages else 0.0,
+            "age_p95": ages[int(0.95 * (len(ages) - 1))] if ages else 0.0,
+            "age_max": self.age_max,
+            "sensors": sensors,
+        }
+
+    def report(self):
+        """
+        A readable summary, with the rate of every sensor compared to the rate of its timing budget.
+        """
+        stats = self.stats()
+        lines = ["Samples: %d in %.1f s, age: mean %.2f ms, p95 %.2f ms, max %.2f ms" % (
+            stats["samples"], stats["elapsed"], stats["age_mean"] * 1000, stats["age_p95"] * 1000,
+            stats["age_max"] * 1000)]
+        for index, sensor in enumerate(stats["sensors"]):
+            budget_rate = 1.0 / sensor["budget"] if sensor["budget"] > 0 else 0.0
+            lines.append("  sensor %d: %.1f Hz, %.0f%% of the budget rate %.1f Hz, %.1f polls per sample, "
+                         "age %.2f ms, %d timeouts, %d errors" % (
+                             index, sensor["rate"], 100.0 * sensor["rate"] / budget_rate if budget_rate else 0.0,
+                             budget_rate, sensor["polls"] / float(sensor["samples"]) if sensor["samples"] else 0.0,
+                             sensor["age_mean"] * 1000, sensor["timeouts"], sensor["errors"]))
+        return "\n".join(lines)
@@ -0,0 +1,150 @@
+#!/usr/bin/python
+"""
+This file contains the processes that use the frames of a FrameRing (see frame_ring.py): the UDP streamer, the recorder
+and a monitor that prints the rate, as an example of local analysis. The stream scripts start them with RING = True,
+they can also be started by hand while the acquisition runs:
+
+    python ring_consumer.py stream 169.254.210.175 5005
+    python ring_consumer.py record Output
+    python ring_consumer.py monitor
+    python ring_consumer.py stats
+
+Every consumer needs its own reader number (--reader), stats shows the cursor, lag and overruns of every reader.
+A consumer stops when the acquisition closes the ring.
+"""
+import argparse
+import multiprocessing
+import socket
+import time
+
+import skin_frame
+from batch_sender import BatchSender
+from frame_ring import RING_PATH, RingReader, ring_stats
+from skin_recorder import Recorder
+
+STREAMER = 0  # The reader numbers the stream scripts use
+RECORDER = 1
+MONITOR = 2
+
+
+def stream(path, reader, address, encoder_options=None, batch_delay=0):
+    """
+    Sends the frames of the ring to the pc. The sequence numbers of the acquisition are kept, so the pc counts frames
+    that were lost by an overrun as lost.
+    :param address: (ip, port) of the pc
+    :param encoder_options: The keyword arguments of the skin_frame.FrameEncoder, e.g. {"node": 1}
+    :param batch_delay: The max_delay of the BatchSender
+    """
+    ring = RingReader(path, reader, "streamer")
+    encoder = skin_frame.FrameEncoder(**(encoder_options or {}))
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender = BatchSender(sock, address, encoder, max_delay=batch_delay)
+    try:
+        frames = ring.read()
+        while frames is not None:
+            for timestamp, seq, distances in frames:
+                sender.send(encoder.encode(distances, timestamp, seq))
+            frames = ring.read()
+    except KeyboardInterrupt:
+        pass
+    sender.close()
+    print("Streamer: %d overruns" % ring.overruns)
+    print(encoder.report())
+    ring.close()
+
+
+def record(path, reader, prefix):
+    """
+    Records the frames of the ring in files, see skin_recorder.py. The sequence numbers of the acquisition are kept, so
+    frames that were lost by an overrun show as gaps.
+    :param prefix: The start of the file names
+    """
+    ring = RingReader(path, reader, "recorder")
+    recorder = Recorder(prefix, ring.nb_sensors)
+    try:
+        frames = ring.read()
+        while frames is not None:
+            for timestamp, seq, distances in frames:
+                recorder.record(distances, timestamp, seq)
+            frames = ring.read()
+    except KeyboardInterrupt:
+        pass
+    recorder.close()
+    print("Recorder: %d records in %s, %d overruns" % (recorder.records, ", ".join(recorder.files), ring.overruns))
+    ring.close()
+
+
+def monitor(path, reader, interval=1.0):
+    """
+    Prints the frame rate and the number of valid measurements every interval seconds.
+    """
+    ring = RingReader(path, reader, "monitor")
+    count = valid = 0
+    start = time.time()
+    try:
+        frames = ring.read()
+        while frames is not None:
+            count += len(frames)
+            for _, _, distances in frames:
+                valid += sum(1 for distance in distances if distance is not None)
+            now = time.time()
+            if now - start >= interval:
+                print("%.1f frames/s, %.1f valid measurements per frame, %d overruns" % (
+                    count / (now - start), valid / float(count) if count else 0.0, ring.overruns))
+                count = valid = 0
+                start = now
+            frames = ring.read()
+    except KeyboardInterrupt:
+        pass
+    ring.close()
+
+
+def start(target, *args):
+    """
+    Runs a consumer in its own process.
+    :return: The multiprocessing.Process
+    """
+    process = multiprocessing.Process(target=target, args=args, name=target.__name__)
+    process.daemon = True
+    process.start()
+    return process
+
+
+def print_stats(path):
+    stats = ring_stats(path)
+    print("%d sensors, %d slots, %d frames written%s" % (
+        stats["sensors"], stats["slots"], stats["head"], ", closed" if stats["closed"] else ""))
+    for reader in stats["readers"]:
+        print("  reader %(reader)d %(name)-10s cursor %(cursor)d, lag %(lag)d, overruns %(overruns)d" % reader)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Uses the frames of a ring of the acquisition")
+    parser.add_argument("--ring", default=RING_PATH, help="The ring file (default %(default)s)")
+    parser.add_argument("--reader", type=int, help="The reader number, every consumer needs its own")
+    subparsers = parser.add_subparsers(dest="command")
+    stream_parser = subparsers.add_parser("stream", help="Send the frames to the pc")
+    stream_parser.add_argument("ip")
+    stream_parser.add_argument("port", type=int)
+    stream_parser.add_argument("--node", type=int, default=0)
+    stream_parser.add_argument("--batch-delay", type=float, default=0)
+    record_parser = subparsers.add_parser("record", help="Record the frames in files")
+    record_parser.add_argument("prefix")
+    subparsers.add_parser("monitor", help="Print the frame rate")
+    subparsers.add_parser("stats", help="Print the cursor, lag and overruns of every reader")
+    args = parser.parse_args()
+    if args.command == "stream":
+        stream(args.ring, STREAMER if args.reader is None else args.reader, (args.ip, args.port),
+               {"node": args.node}, args.batch_delay)
+    elif args.command == "record":
+        record(args.ring, RECORDER if args.reader is None else args.reader, args.prefix)
+    elif args.command == "monitor":
+        monitor(args.ring, MONITOR if args.reader is None else args.reader)
+    elif args.command == "stats":
+        print_stats(args.ring)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/python
+"""
+This script measures the acquisition throughput on simulated buses (see sim_bus.py), so it runs on any computer.
+VL6180X sensors behind TCA9548A multiplexers are found with discovery.py, started in continuous mode and read with
+the AcquisitionEngine, exactly like VL6180X_TCA9548A_auto_stream.py does on the raspberry.
+Usage: python sim_acquisition_benchmark.py [frames]
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "VL6180X"))
+import VL6180X
+
+import acquisition
+import discovery
+import sim_bus
+
+FRAMES = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+INTERMEASUREMENT_PERIOD = 20  # ms
+LATENCY = 0.0001  # s, the fixed time of every transaction
+BYTE_TIME = sim_bus.BYTE_TIME_400KHZ
+# (number of buses, multiplexers per bus, sensors per multiplexer)
+SETUPS = [(1, 1, 8), (1, 2, 8), (2, 1, 8), (4, 1, 8), (4, 2, 8)]
+
+
+def run(nb_buses, muxes, sensors_per_mux, first_bus):
+    """
+    Builds a simulated skin, reads FRAMES frames and returns the frame rate and the transactions per frame.
+    Every setup uses new bus numbers, so it gets its own bus objects and multiplexer state.
+    """
+    bus_numbers = list(range(first_bus, first_bus + nb_buses))
+    buses = sim_bus.make_skin(bus_numbers, muxes, sensors_per_mux, latency=LATENCY, byte_time=BYTE_TIME)
+    for bus, i2c in buses.items():
+        VL6180X.set_i2c_bus(bus, i2c)
+    sensors = []
+    for found in discovery.discover(bus_numbers, (discovery.VL6180X,), open_bus=VL6180X.get_i2c_bus):
+        sensor = VL6180X.return_sensor_if_connected(found["mux"], found["channel"], found["address"], True,
+                                                    bus=found["bus"])
+        sensor.default_settings()
+        sensors.append(sensor)
+    VL6180X.start_continuous(sensors, INTERMEASUREMENT_PERIOD)
+    engine = acquisition.AcquisitionEngine(sensors, read_bus=VL6180X.read_ready)
+    engine.read_frame()  # The first frame waits for the first measurement
+    transactions = sum(i2c.transactions for i2c in buses.values())
+    start = time.time()
+    for _ in range(FRAMES):
+        engine.read_frame()
+    elapsed = time.time() - start
+    transactions = sum(i2c.transactions for i2c in buses.values()) - transactions
+    engine.stop()
+    VL6180X.stop_continuous(sensors)
+    return len(sensors), FRAMES / elapsed, transactions / float(FRAMES)
+
+
+def main():
+    print("Intermeasurement period %d ms, %.0f us per transaction + %.1f us per byte" % (
+        INTERMEASUREMENT_PERIOD, LATENCY * 1e6, BYTE_TIME * 1e6))
+    print("%6s %8s %8s %12s %18s" % ("buses", "muxes", "sensors", "frames/s", "transactions/frame"))
+    first_bus = 1
+    for nb_buses, muxes, sensors_per_mux in SETUPS:
+        nb_sensors, rate, transactions = run(nb_buses, muxes, sensors_per_mux, first_bus)
+        first_bus += nb_buses
+        print("%6d %8d %8d %12.1f %18.1f" % (nb_buses, muxes * nb_buses, nb_sensors, rate, transactions))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,661 @@
+"""
+This file contains a simulated I2C bus, so the acquisition code can be run and benchmarked without a raspberry pi.
+
+ - SimBus has the smbus.SMBus functions that are used in this repository, SimRdwrBus also has the combined
+   transactions of i2c_rdwr.I2CRdwrBus.
+ - SimTCA9548A is a multiplexer: the control byte selects which channels (and the devices on them) are connected.
+ - SimVL6180X models the registers that VL6180X.py uses: the model id, fresh out of reset, SYSRANGE_START (single shot
+   and continuous), the intermeasurement period, the interrupt status, RESULT_RANGE_VAL, the interrupt clear and the
+   address change. The range interrupt follows SYSTEM_INTERRUPT_CONFIG_GPIO and the range thresholds, and
+   interrupt_asserted tells whether its GPIO1 line is active, for edge_source.SimEdgeSource.
+ - SimVL53L0X models the registers of the VL53L0X that the ranging library uses for a measurement.
+ - SimVL53L0XLibrary is a stand-in for the VL53L0X python library (startRanging, stopRanging, getDistance, getDev,
+   VL53L0X_GetMeasurementTimingBudgetMicroSeconds, VL53L0X_GetMeasurementDataReady). Like the real library it talks
+   to the sensor through the i2c callbacks of VL53L0X.py, so the cost of the callbacks is part of every measurement.
+
+Every transaction takes latency + byte_time * bytes seconds, during which the bus is busy. The sensors measure in
+simulated time on the monotonic clock, their distances come from a profile: a function of the time in seconds since
+the sensor was created that returns the distance in mm, or None when there is no target.
+
+Usage:
+    buses = sim_bus.make_skin(buses=(1, 3), muxes=1, sensors_per_mux=8, latency=0.0001)
+    for bus, i2c in buses.items():
+        VL6180X.set_i2c_bus(bus, i2c)
+    ... discovery.discover(buses, open_bus=VL6180X.get_i2c_bus) and the acquisition as on the raspberry ...
+"""
+import ctypes
+import errno
+import math
+import random
+import threading
+import time
+
+# time.monotonic doesn't exist in python 2
+monotonic = getattr(time, "monotonic", time.time)
+
+# The time one byte takes at 100 kHz and at 400 kHz: 8 data bits and the acknowledge bit
+BYTE_TIME_100KHZ = 9 / 100000.0
+BYTE_TIME_400KHZ = 9 / 400000.0
+
+
+# Distance profiles
+
+def constant(distance):
+    """A target that doesn't move."""
+    return lambda t: distance
+
+
+def sine(mean=60, amplitude=40, period=2.0, phase=0.0):
+    """A target that moves back and forth."""
+    return lambda t: int(round(mean + amplitude * math.sin(2 * math.pi * (t / period + phase))))
+
+
+def steps(distances, interval=1.0):
+    """
+    A target that jumps to the next distance every interval seconds, and starts again after the last one.
+    :param distances: The distances in mm, None for no target
+    """
+    distances = list(distances)
+    return lambda t: distances[int(t / interval) % len(distances)]
+
+
+def samples(distances, rate):
+    """
+    Plays back recorded distances, for example from a log file, and starts again after the last one.
+    :param rate: The number of distances per second
+    """
+    distances = list(distances)
+    return lambda t: distances[int(t * rate) % len(distances)]
+
+
+def noisy(profile, std=1.0, seed=None):
+    """Adds gaussian noise to a profile."""
+    rng = random.Random(seed)
+
+    def noisy_profile(t):
+        distance = profile(t)
+        if distance is None:
+            return None
+        return max(0, int(round(distance + rng.gauss(0, std))))
+    return noisy_profile
+
+
+# Devices
+
+class SimDevice(object):
+    """
+    An I2C device with a register pointer. The first register_width bytes of a write set the pointer, the other
+    bytes are written to consecutive registers. A read reads consecutive registers from the pointer.
+    """
+
+    def __init__(self, address, register_width=1):
+        self.address = address
+        self.register_width = register_width
+        self.registers = {}
+        self.pointer = 0
+        self.start = monotonic()
+
+    def write(self, data):
+        data = list(data)
+        if len(data) < self.register_width:
+            return
+        pointer = 0
+        for byte in data[:self.register_width]:
+            pointer = (pointer << 8) | byte
+        self.pointer = pointer
+        for value in data[self.register_width:]:
+            self.write_register(self.pointer, value & 0xFF)
+            self.pointer += 1
+
+    def read(self, length):
+        values = []
+        for _ in range(length):
+            values.append(self.read_register(self.pointer) & 0xFF)
+            self.pointer += 1
+        return values
+
+    def read_register(self, register):
+        return self.registers.get(register, 0)
+
+    def write_register(self, register, value):
+        self.registers[register] = value
+
+    def distance_at(self, profile, t):
+        """The distance of a profile at a monotonic time."""
+        return profile(t - self.start)
+
+
+class SimTCA9548A(SimDevice):
+    """A TCA9548A multiplexer. The devices on a channel are on the bus when the bit of that channel is set."""
+
+    def __init__(self, address=0x70):
+        SimDevice.__init__(self, address, register_width=0)
+        self.control = 0
+        self.channels = [[] for _ in range(8)]
+
+    def attach(self, channel, device):
+        self.channels[channel].append(device)
+        return device
+
+    def write(self, data):
+        data = list(data)
+        if data:
+            self.control = data[-1]
+
+    def read(self, length):
+        return [self.control] * length
+
+    def connected(self):
+        """The devices on the selected channels."""
+        found = []
+        for channel in range(8):
+            if self.control & (1 << channel):
+                found.extend(self.channels[channel])
+        return found
+
+
+class SimVL6180X(SimDevice):
+    """The registers of a VL6180X that VL6180X.py uses, with 16 bit register addresses."""
+
+    IDENTIFICATION_MODEL_ID = 0x0000
+    SYSTEM_INTERRUPT_CONFIG_GPIO = 0x0014
+    SYSTEM_INTERRUPT_CLEAR = 0x0015
+    SYSTEM_FRESH_OUT_OF_RESET = 0x0016
+    SYSRANGE_START = 0x0018
+    SYSRANGE_THRESH_HIGH = 0x0019
+    SYSRANGE_THRESH_LOW = 0x001A
+    SYSRANGE_INTERMEASUREMENT_PERIOD = 0x001B
+    RESULT_RANGE_STATUS = 0x004D
+    RESULT_INTERRUPT_STATUS_GPIO = 0x004F
+    RESULT_RANGE_VAL = 0x0062
+    I2C_SLAVE_DEVICE_ADDRESS = 0x0212
+
+    LEVEL_LOW = 0x01
+    LEVEL_HIGH = 0x02
+    OUT_OF_WINDOW = 0x03
+    NEW_SAMPLE_READY = 0x04
+    MAX_CONVERGENCE_ERROR = 7  # The range error code when there is no target
+
+    def __init__(self, address=0x29, profile=None, range_time=0.008):
+        """
+        :param profile: The distance profile, see constant, sine, steps and samples
+        :param range_time: The time one measurement takes, in seconds
+        """
+        SimDevice.__init__(self, address, register_width=2)
+        self.profile = profile or constant(100)
+        self.range_time = range_time
+        # The interrupt config starts as default_settings writes it: an interrupt for every new sample
+        self.registers.update({0x0000: 0xB4, 0x0001: 0x01, 0x0002: 0x03, 0x0003: 0x01, 0x0004: 0x02,
+                               self.SYSTEM_FRESH_OUT_OF_RESET: 0x01, self.SYSRANGE_INTERMEASUREMENT_PERIOD: 0xFF,
+                               self.SYSTEM_INTERRUPT_CONFIG_GPIO: 0x24, self.SYSRANGE_THRESH_HIGH: 0xFF,
+                               self.SYSRANGE_THRESH_LOW: 0x00})
+        # interrupt_asserted is called from the thread of an edge source, the bus from the reading threads
+        self.lock = threading.RLock()
+        self.continuous = False
+        self.single_done = None  # The time the single shot measurement is done, None if none is running
+        self.continuous_start = None
+        self.samples_done = 0  # The number of continuous measurements that were finished
+        self.interrupt_status = 0
+        self.range_value = 0
+        self.range_status = 0x01
+        self.measurements = 0
+
+    def period(self):
+        return (self.registers[self.SYSRANGE_INTERMEASUREMENT_PERIOD] + 1) * 0.010
+
+    def update(self):
+        """Finishes the measurements that are done by now."""
+        now = monotonic()
+        if self.single_done is not None and now >= self.single_done:
+            self.finish(self.single_done)
+            self.single_done = None
+        if self.continuous:
+            period = self.period()
+            done = int((now - self.continuous_start - self.range_time) // period) + 1
+            if done > self.samples_done:
+                self.samples_done = done
+                self.finish(self.continuous_start + self.range_time + (done - 1) * period)
+
+    def finish(self, t):
+        distance = self.distance_at(self.profile, t)
+        if distance is None:
+            self.range_value = 255
+            self.range_status = (self.MAX_CONVERGENCE_ERROR << 4) | 0x01
+        else:
+            self.range_value = max(0, min(int(distance), 255))
+            self.range_status = 0x01
+        event = self.range_event(distance is not None)
+        if event:
+            self.interrupt_status = (self.interrupt_status & ~0x07) | event
+        self.measurements += 1
+
+    def range_event(self, valid):
+        """
+        :return: The interrupt code the last measurement raises with the interrupt config, 0 for none.
+        A measurement without a target counts as above the high threshold.
+        """
+        mode = self.registers[self.SYSTEM_INTERRUPT_CONFIG_GPIO] & 0x07
+        low = valid and self.range_value < self.registers[self.SYSRANGE_THRESH_LOW]
+        high = not valid or self.range_value > self.registers[self.SYSRANGE_THRESH_HIGH]
+        if mode == self.NEW_SAMPLE_READY:
+            return self.NEW_SAMPLE_READY
+        if mode == self.LEVEL_LOW and low:
+            return self.LEVEL_LOW
+        if mode == self.LEVEL_HIGH and high:
+            return self.LEVEL_HIGH
+        if mode == self.OUT_OF_WINDOW and (low or high):
+            return self.OUT_OF_WINDOW
+        return 0
+
+    def interrupt_asserted(self):
+        """Whether the GPIO1 interrupt line of the sensor is active, without a bus transaction."""
+        with self.lock:
+            self.update()
+            return (self.interrupt_status & 0x07) != 0
+
+    def read_register(self, register):
+        with self.lock:
+            return self._read_register(register)
+
+    def write_register(self, register, value):
+        with self.lock:
+            self._write_register(register, value)
+
+    def _read_register(self, register):
+        if register == self.RESULT_INTERRUPT_STATUS_GPIO:
+            self.update()
+            return self.interrupt_status
+        if register == self.RESULT_RANGE_VAL:
+            self.update()
+            return self.range_value
+        if register == self.RESULT_RANGE_STATUS:
+            self.update()
+            return self.range_status
+        if register == self.I2C_SLAVE_DEVICE_ADDRESS:
+            return self.address
+        return SimDevice.read_register(self, register)
+
+    def _write_register(self, register, value):
+        if register == self.SYSRANGE_START:
+            self.update()
+            if value & 0x01:
+                if self.continuous:
+                    # Writing the start bit in continuous mode stops it
+                    self.continuous = False
+                elif value & 0x02:
+                    self.continuous = True
+                    self.continuous_start = monotonic()
+                    self.samples_done = 0
+                else:
+                    self.single_done = monotonic() + self.range_time
+        elif register == self.SYSTEM_INTERRUPT_CLEAR:
+            self.update()
+            if value & 0x01:
+                self.interrupt_status &= ~0x07
+        elif register == self.I2C_SLAVE_DEVICE_ADDRESS:
+            self.address = value & 0x7F
+        else:
+            SimDevice.write_register(self, register, value)
+
+
+class SimVL53L0X(SimDevice):
+    """
+    The registers of a VL53L0X that are used for a measurement, with 8 bit register addresses.
+    The real sensor keeps its timing budget in a set of timeout registers in macro periods, the simulation keeps it in
+    FINAL_RANGE_CONFIG_TIMEOUT_MACROP_HI/LO in units of 100 us.
+    """
+
+    SYSRANGE_START = 0x00
+    SYSTEM_INTERRUPT_CLEAR = 0x0B
+    RESULT_INTERRUPT_STATUS = 0x13
+    RESULT_RANGE_STATUS = 0x14
+    FINAL_RANGE_CONFIG_TIMEOUT_MACROP_HI = 0x71
+    FINAL_RANGE_CONFIG_TIMEOUT_MACROP_LO = 0x72
+    I2C_SLAVE_DEVICE_ADDRESS = 0x8A
+    IDENTIFICATION_MODEL_ID = 0xC0
+
+    NEW_SAMPLE_READY = 0x04
+    RANGE_VALID = 11  # Device range status of a valid measurement
+    PHASE_FAIL = 4  # Device range status when there is no target
+    OUT_OF_RANGE = 8190
+
+    def __init__(self, address=0x29, profile=None, timing_budget=33000):
+        """
+        :param profile: The distance profile, see constant, sine, steps and samples
+        :param timing_budget: The time one measurement takes, in microseconds
+        """
+        SimDevice.__init__(self, address, register_width=1)
+        self.profile = profile or constant(100)
+        self.registers.update({0xC0: 0xEE, 0xC1: 0xAA, 0xC2: 0x10})
+        self.set_timing_budget(timing_budget)
+        self.mode = 0
+        self.single_done = None
+        self.continuous_start = None
+        self.samples_done = 0
+        self.interrupt_status = 0
+        self.result = [0] * 12
+        self.measurements = 0
+
+    def set_timing_budget(self, timing_budget):
+        units = max(1, min(timing_budget // 100, 0xFFFF))
+        self.registers[self.FINAL_RANGE_CONFIG_TIMEOUT_MACROP_HI] = units >> 8
+        self.registers[self.FINAL_RANGE_CONFIG_TIMEOUT_MACROP_LO] = units & 0xFF
+
+    def timing_budget(self):
+        """The timing budget in seconds."""
+        return ((self.registers[self.FINAL_RANGE_CONFIG_TIMEOUT_MACROP_HI] << 8) |
+                self.registers[self.FINAL_RANGE_CONFIG_TIMEOUT_MACROP_LO]) * 0.0001
+
+    def update(self):
+        now = monotonic()
+        if self.single_done is not None and now >= self.single_done:
+            self.finish(self.single_done)
+            self.single_done = None
+        if self.continuous_start is not None:
+            budget = self.timing_budget()
+            done = int((now - self.continuous_start) // budget)
+            if done > self.samples_done:
+                self.samples_done = done
+                self.finish(self.continuous_start + done * budget)
+
+    def finish(self, t):
+        distance = self.distance_at(self.profile, t)
+        if distance is None:
+            status, distance = self.PHASE_FAIL, self.OUT_OF_RANGE
+        else:
+            status, distance = self.RANGE_VALID, max(0, min(int(distance), self.OUT_OF_RANGE))
+        self.result = [status << 3] + [0] * 9 + [distance >> 8, distance & 0xFF]
+        self.interrupt_status = self.NEW_SAMPLE_READY
+        self.measurements += 1
+
+    def read_register(self, register):
+        if register == self.RESULT_INTERRUPT_STATUS:
+            self.update()
+            return self.interrupt_status
+        if self.RESULT_RANGE_STATUS <= register < self.RESULT_RANGE_STATUS + 12:
+            self.update()
+            return self.result[register - self.RESULT_RANGE_STATUS]
+        if register == self.I2C_SLAVE_DEVICE_ADDRESS:
+            return self.address
+        return SimDevice.read_register(self, register)
+
+    def write_register(self, register, value):
+        if register == self.SYSRANGE_START:
+            self.update()
+            self.mode = value
+            if value == 0x00:  # Stop
+                self.single_done = None
+                self.continuous_start = None
+            elif value & 0x06:  # Back-to-back or timed continuous ranging
+                self.continuous_start = monotonic()
+                self.samples_done = 0
+            elif value & 0x01:  # Single shot
+                self.single_done = monotonic() + self.timing_budget()
+        elif register == self.SYSTEM_INTERRUPT_CLEAR:
+            self.update()
+            if value & 0x01:
+                self.interrupt_status = 0
+        elif register == self.I2C_SLAVE_DEVICE_ADDRESS:
+            self.address = value & 0x7F
+        else:
+            SimDevice.write_register(self, register, value)
+
+
+# Buses
+
+class SimBus(object):
+    """A simulated I2C bus with the smbus.SMBus functions that are used in this repository."""
+
+    def __init__(self, latency=0.0, byte_time=0.0):
+        """
+        :param latency: The fixed time of every transaction in seconds (start, address, stop and the driver)
+        :param byte_time: The time per byte in seconds, see BYTE_TIME_100KHZ and BYTE_TIME_400KHZ
+        """
+        self.latency = latency
+        self.byte_time = byte_time
+        self.devices = []  # The devices that are connected to the bus directly, multiplexers too
+        self.lock = threading.Lock()
+        # Counters
+        self.transactions = 0
+        self.bytes = 0
+        self.busy_time = 0.0
+
+    def attach(self, device):
+        self.devices.append(device)
+        return device
+
+    def find(self, address):
+        """
+        :return: The device that answers on an address
+        :raise IOError: When no device, or more than one, answers
+        """
+        found = []
+        for device in self.devices:
+            if device.address == address:
+                found.append(device)
+            if isinstance(device, SimTCA9548A) and device.control:
+                found.extend(connected for connected in device.connected() if connected.address == address)
+        if len(found) != 1:
+            raise IOError(errno.EREMOTEIO, "Remote I/O error (simulated bus, %d devices on 0x%02x)" % (
+                len(found), address))
+        return found[0]
+
+    def transaction(self, address, writes=(), read_length=0):
+        """
+        One transaction: the writes (lists of bytes) and then a read, without a stop in between.
+        :return: The read bytes
+        """
+        with self.lock:
+            self.transactions += 1
+            size = sum(len(write) + 1 for write in writes) + (read_length + 1 if read_length else 0)
+            self.bytes += size
+            duration = self.latency + self.byte_time * size
+            if duration > 0:
+                time.sleep(duration)
+                self.busy_time += duration
+            device = self.find(address)
+            for write in writes:
+                device.write(write)
+            if read_length:
+                return device.read(read_length)
+            return []
+
+    def stats(self):
+        return {"transactions": self.transactions, "bytes": self.bytes, "busy_time": self.busy_time}
+
+    def read_byte(self, address):
+        return self.transaction(address, read_length=1)[0]
+
+    def write_byte(self, address, value):
+        self.transaction(address, [[value]])
+
+    def read_byte_data(self, address, register):
+        return self.transaction(address, [[register]], 1)[0]
+
+    def write_byte_data(self, address, register, value):
+        self.transaction(address, [[register, value]])
+
+    def read_i2c_block_data(self, address, register, length=32):
+        return self.transaction(address, [[register]], length)
+
+    def write_i2c_block_data(self, address, register, data):
+        self.transaction(address, [[register] + list(data)])
+
+
+class SimRdwrBus(SimBus):
+    """A simulated bus that also has the combined transactions of i2c_rdwr.I2CRdwrBus."""
+
+    def read_register_into(self, address, register, buf, length):
+        data = self.transaction(address, [[register]], length)
+        ctypes.memmove(buf, (ctypes.c_uint8 * length)(*data), length)
+
+    def write_register_from(self, address, register, buf, length):
+        self.transaction(address, [[register] + list(bytearray(ctypes.string_at(buf, length)))])
+
+    def write_read(self, address, write_data, length):
+        return bytearray(self.transaction(address, [list(write_data)], length))
+
+    def write(self, address, data):
+        self.transaction(address, [list(data)])
+
+    def write_batch(self, address, writes):
+        self.transaction(address, [list(write) for write in writes])
+
+    def read_registers16(self, address, register, length):
+        return self.write_read(address, [(register >> 8) & 0xFF, register & 0xFF], length)
+
+    def write_registers16(self, address, table):
+        writes = []
+        next_register = None
+        for register, value in table:
+            if register == next_register:
+                writes[-1].append(value & 0xFF)
+            else:
+                writes.append([(register >> 8) & 0xFF, register & 0xFF, value & 0xFF])
+            next_register = register + 1
+        self.write_batch(address, writes)
+
+
+# The VL53L0X library
+
+class SimVL53L0XLibrary(object):
+    """
+    A stand-in for the VL53L0X python library (vl53l0x_python.so), for VL53L0X.load_library.
+    It uses the i2c callbacks it gets with VL53L0X_set_i2c for all communication, like the real library, but only
+    does the transactions of a measurement: select the multiplexer channel, start ranging, poll the interrupt status,
+    read the result and clear the interrupt.
+    """
+
+    # The timing budget of every mode in microseconds, the same as the real library
+    TIMING_BUDGETS = {0: 33000, 1: 66000, 2: 200000, 3: 33000, 4: 20000}
+    POLL_DELAY = 0.001  # The time between two polls of the interrupt status, in seconds
+
+    def __init__(self):
+        self.read = None
+        self.write = None
+        self.objects = {}  # Object number -> [address, TCA9548A channel, TCA9548A address, timing budget]
+        self.buffer = (ctypes.c_ubyte * 256)()
+        self.pointer = ctypes.cast(self.buffer, ctypes.POINTER(ctypes.c_ubyte))
+
+    def VL53L0X_set_i2c(self, read, write):
+        self.read = read
+        self.write = write
+
+    def _write(self, address, register, values):
+        for index, value in enumerate(values):
+            self.buffer[index] = value
+        return self.write(address, register, self.pointer, len(values))
+
+    def _read(self, address, register, length):
+        if self.read(address, register, self.pointer, length) != 0:
+            return None
+        return self.buffer[:length]
+
+    def _select(self, object_number):
+        address, channel, mux_address, _ = self.objects[object_number]
+        if channel <= 7:
+            self._write(mux_address, 1 << channel, [])
+        return address
+
+    def startRanging(self, object_number, mode, address, tca_device, tca_address):
+        budget = self.TIMING_BUDGETS.get(mode, 33000)
+        self.objects[object_number] = [address, tca_device, tca_address, budget]
+        address = self._select(object_number)
+        units = budget // 100
+        self._write(address, SimVL53L0X.FINAL_RANGE_CONFIG_TIMEOUT_MACROP_HI, [units >> 8, units & 0xFF])
+        return self._write(address, SimVL53L0X.SYSRANGE_START, [0x02])
+
+    def stopRanging(self, object_number):
+        address = self._select(object_number)
+        return self._write(address, SimVL53L0X.SYSRANGE_START, [0x00])
+
+    def getDistance(self, object_number):
+        """Waits for the next measurement and returns its distance in mm, -1 after an I2C error."""
+        address = self._select(object_number)
+        while True:
+            status = self._read(address, SimVL53L0X.RESULT_INTERRUPT_STATUS, 1)
+            if status is None:
+                return -1
+            if status[0] & 0x07:
+                break
+            time.sleep(self.POLL_DELAY)
+        result = self._read(address, SimVL53L0X.RESULT_RANGE_STATUS, 12)
+        self._write(address, SimVL53L0X.SYSTEM_INTERRUPT_CLEAR, [0x01])
+        if result is None:
+            return -1
+        return (result[10] << 8) | result[11]
+
+    def getDev(self, object_number):
+        return object_number
+
+    def VL53L0X_GetMeasurementTimingBudgetMicroSeconds(self, dev, budget_p):
+        if dev not in self.objects:
+            return -1
+        budget_p.contents.value = self.objects[dev][3]
+        return 0
+
+    def VL53L0X_GetMeasurementDataReady(self, dev, ready_p):
+        """Like the ST API this doesn't select the multiplexer channel, the caller has to."""
+        if dev not in self.objects:
+            return -1
+        status = self._read(self.objects[dev][0], SimVL53L0X.RESULT_INTERRUPT_STATUS, 1)
+        if status is None:
+            return -20  # VL53L0X_ERROR_CONTROL_INTERFACE
+        ready_p.contents.value = 1 if status[0] & 0x07 else 0
+        return 0
+
+    def VL53L0X_SetDeviceAddress(self, dev, address):
+        address = getattr(address, "value", address)
+        old_address = self._select(dev)
+        status = self._write(old_address, SimVL53L0X.I2C_SLAVE_DEVICE_ADDRESS, [(address // 2) & 0x7F])
+        if status == 0:
+            self.objects[dev][0] = (address // 2) & 0x7F
+        return status
+
+
+def sensors_of(buses):
+    """
+    :param buses: The dict of make_skin
+    :return: The simulated sensors, sorted by bus, multiplexer and channel like discovery.discover sorts them
+    """
+    found = []
+    for bus in sorted(buses):
+        # Sensors without a multiplexer come first
+        devices = sorted(buses[bus].devices, key=lambda device: (isinstance(device, SimTCA9548A), device.address))
+        for device in devices:
+            if isinstance(device, SimTCA9548A):
+                for channel in device.channels:
+                    found.extend(channel)
+            else:
+                found.append(device)
+    return found
+
+
+def make_skin(buses=(1,), muxes=1, sensors_per_mux=8, sensor_type="VL6180X", profile=None, latency=0.0,
+              byte_time=0.0, combined=True, **sensor_options):
+    """
+    Builds simulated buses with multiplexers and sensors.
+    :param buses: The bus numbers
+    :param muxes: The number of multiplexers per bus, on 0x70, 0x71, ...
+    :param sensors_per_mux: The number of sensors per multiplexer, on channel 0, 1, ... (at most 8)
+    :param sensor_type: "VL6180X" or "VL53L0X"
+    :param profile: Function (bus, mux, channel) -> distance profile. None gives every sensor its own sine.
+    :param combined: SimRdwrBus if True, SimBus (smbus only) if False
+    :param sensor_options: Passed to the sensor, e.g. range_time or timing_budget
+    :return: A dict bus number -> bus object
+    """
+    sensor_class = SimVL53L0X if sensor_type == "VL53L0X" else SimVL6180X
+    bus_class = SimRdwrBus if combined else SimBus
+    result = {}
+    for bus in buses:
+        i2c = bus_class(latency, byte_time)
+        for mux_index in range(muxes):
+            mux = i2c.attach(SimTCA9548A(0x70 + mux_index))
+            for channel in range(sensors_per_mux):
+                if profile is None:
+                    sensor_profile = sine(phase=(mux_index * 8 + channel) / 16.0)
+                else:
+                    sensor_profile = profile(bus, 0x70 + mux_index, channel)
+                mux.attach(channel, sensor_class(profile=sensor_profile, **sensor_options))
+        result[bus] = i2c
+    return result
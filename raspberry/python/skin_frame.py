@@ -0,0 +1,453 @@
+"""
+This file defines the UDP frame format that is used between the raspberry pi and the pc.
+
+A binary frame looks like this (all values little endian):
+
+    offset  size  field
+    0       2     magic, always "SK"
+    2       1     version of the frame format
+    3       1     flags
+    4       2     node id of the sending raspberry pi
+    6       2     number of sensors (n)
+    8       4     sequence number, increases by one for every frame
+    12      8     timestamp of the raspberry pi (seconds since epoch)
+    20      b     status bits, one bit per sensor (1 = valid measurement), padded to an even number of bytes
+    20 + b  2n    distances as unsigned 16 bit values in mm. Invalid measurements are sent as 0.
+
+The timestamp is the time the measurements of the frame were finished. When the FLAG_TRACE flag is set, two more
+timestamps of the raspberry pi follow the distances, for latency tracing (see pc/latency_trace.py):
+
+    offset       size  field
+    20 + b + 2n  8     the time the frame was assembled (encoded)
+    28 + b + 2n  8     the time the frame was sent, written by FrameEncoder.stamp_send right before sendto
+
+A datagram can hold several binary frames after each other (see batch_sender.py), decode_all returns all of them.
+
+Delta encoding (FrameEncoder with delta=True) sends a full frame, the keyframe, every keyframe_interval frames. The frames
+in between have the FLAG_DELTA flag and only hold the sensors that changed since the keyframe:
+
+    offset       size  field
+    0            20    the header, the number of sensors is the number of sensors of the keyframe
+    20           4     sequence number of the keyframe the deltas are relative to
+    24           2     number of changed sensors (m)
+    26           b     changed bits, one bit per sensor (1 = the sensor changed), padded like the status bits
+    26 + b       2m    the changes of the changed sensors as signed 16 bit values, in sensor order
+
+A measurement is valid when its distance isn't 0, like in the full frames. Because every delta frame only needs its
+keyframe, a lost delta frame doesn't affect the next ones. When a change doesn't fit in 16 bits, or a delta frame would
+not be smaller than a full frame, a keyframe is sent. With a threshold, changes up to threshold mm are not sent, so
+the distances on the pc are at most threshold mm off. A FrameDecoder keeps the keyframes and rebuilds the full frames.
+
+The old ASCII format (distances separated by a space, X for an invalid measurement) is still available
+as a compatibility mode. The decoder detects which format is received by looking at the magic.
+
+The encoder only uses the standard library, so it runs on the raspberry pi without extra packages.
+The decoder needs numpy and returns views on the received data, so no value is parsed in python.
+"""
+import struct
+import time
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:  # The raspberry pi only needs the encoder
+    np = None
+
+MAGIC = b"SK"
+VERSION = 1
+HEADER = struct.Struct("<2sBBHHId")
+TRACE = struct.Struct("<dd")
+DELTA = struct.Struct("<IH")
+FLAG_TRACE = 0x01  # The frame has the trace timestamps
+FLAG_DELTA = 0x02  # The frame only has the changes since a keyframe
+KEYFRAME_INTERVAL = 50  # The number of frames from one keyframe to the next
+MAX_DATAGRAM = 65507  # Largest UDP payload, use this as buffer length for recv
+
+FORMAT_BINARY = "binary"
+FORMAT_ASCII = "ascii"
+
+# time.perf_counter doesn't exist in python 2
+clock = getattr(time, "perf_counter", time.time)
+
+# trace is None, or the (assembled, sent) times of the raspberry pi when the frame has the FLAG_TRACE flag
+Frame = namedtuple("Frame", ["seq", "timestamp", "node", "flags", "valid", "distances", "trace"])
+
+
+def status_size(count):
+    """
+    The number of bytes used for the status bits of a frame.
+    :param count: The number of sensors in the frame
+    :return: The size in bytes, always even so the distances stay 16 bit aligned
+    """
+    return ((count + 15) // 16) * 2
+
+
+def frame_size(count, flags=0, changed=0):
+    """
+    The size of a binary frame.
+    :param count: The number of sensors in the frame
+    :param flags: The flags of the frame
+    :param changed: The number of changed sensors of a delta frame
+    :return: The size in bytes
+    """
+    if flags & FLAG_DELTA:
+        size = HEADER.size + DELTA.size + status_size(count) + 2 * changed
+    else:
+        size = HEADER.size + status_size(count) + 2 * count
+    if flags & FLAG_TRACE:
+        size += TRACE.size
+    return size
+
+
+def is_valid(distance):
+    """
+    Whether a distance is a valid measurement. The VL53L0X returns 0 or less on an error,
+    the stream scripts use None when reading a sensor failed.
+    """
+    return distance is not None and distance > 0
+
+
+class FrameEncoder(object):
+    """
+    Encodes the distances of one acquisition round into a frame.
+    Keeps the sequence number, so use one encoder per stream.
+    With trace enabled the frames carry the trace timestamps. Call stamp_send right before the frame is sent.
+    With delta enabled only the changes since the last keyframe are sent, see the top of this file.
+    """
+
+    def __init__(self, node=0, frame_format=FORMAT_BINARY, trace=False, delta=False,
+                 keyframe_interval=KEYFRAME_INTERVAL, threshold=0):
+        self.node = node
+        self.frame_format = frame_format
+        self.trace = trace and frame_format == FORMAT_BINARY
+        self.flags = FLAG_TRACE if self.trace else 0
+        self.delta = delta and frame_format == FORMAT_BINARY
+        self.keyframe_interval = keyframe_interval
+        self.threshold = threshold
+        self.keyframe = None  # (seq, values) of the last keyframe
+        self.since_keyframe = 0
+        self.seq = 0
+        self._structs = {}
+        # Counters
+        self.frames = 0
+        self.keyframes = 0
+        self.bytes = 0
+        self.full_bytes = 0  # The bytes full frames would have taken
+        self.encode_time = 0.0
+
+    def encode(self, distances, timestamp=None, seq=None):
+        """
+        Encodes a list of distances.
+        :param distances: The distance per sensor in mm. None or a value <= 0 marks an invalid measurement.
+        :param timestamp: The time of the measurement. Defaults to now.
+        :param seq: The sequence number, for frames that already have one (e.g. from a FrameRing). Defaults to one more
+        than the last one.
+        :return: The frame as bytes, ready for sock.sendto. A bytearray when trace is enabled.
+        """
+        start = clock()
+        if seq is not None:
+            self.seq = seq & 0xFFFFFFFF
+        if self.frame_format == FORMAT_ASCII:
+            self.seq = (self.seq + 1) & 0xFFFFFFFF
+            frame = encode_ascii(distances)
+            self._count(frame, len(frame), start)
+            return frame
+        if timestamp is None:
+            timestamp = time.time()
+        values = clamp_distances(distances)
+        frame = self._encode_delta(values, timestamp) if self.delta else None
+        if frame is None:
+            frame = self._encode_full(distances, values, timestamp)
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        self._count(frame, frame_size(len(values), self.flags), start)
+        return frame
+
+    def _encode_full(self, distances, values, timestamp):
+        values = status_bytes(distances) + values
+        if self.trace:
+            # The send time is filled in by stamp_send
+            frame = bytearray(self._struct(len(distances)).pack(
+                MAGIC, VERSION, self.flags, self.node, len(distances), self.seq, timestamp,
+                *(values + [time.time(), 0.0])))
+        else:
+            frame = self._struct(len(distances)).pack(
+                MAGIC, VERSION, self.flags, self.node, len(distances), self.seq, timestamp, *values)
+        if self.delta:
+            self.keyframe = (self.seq, values[status_size(len(distances)):])
+            self.since_keyframe = 0
+            self.keyframes += 1
+        return frame
+
+    def _encode_delta(self, values, timestamp):
+        """
+        :return: The delta frame, or None when a keyframe has to be sent
+        """
+        if self.keyframe is None or self.since_keyframe + 1 >= self.keyframe_interval:
+            return None
+        key_seq, reference = self.keyframe
+        count = len(values)
+        if len(reference) != count:
+            return None
+        changed = [0] * status_size(count)
+        changes = []
+        threshold = self.threshold
+        for index in range(count):
+            change = values[index] - reference[index]
+            # A measurement that becomes valid or invalid is always sent
+            if change > threshold or change < -threshold or (values[index] == 0) != (reference[index] == 0):
+                if not -0x8000 <= change <= 0x7FFF:
+                    return None
+                changed[index >> 3] |= 0x80 >> (index & 7)
+                changes.append(change)
+        if DELTA.size + 2 * len(changes) >= 2 * count:
+            return None  # A keyframe isn't larger
+        flags = self.flags | FLAG_DELTA
+        packer = self._delta_struct(count, len(changes))
+        if self.trace:
+            frame = bytearray(packer.pack(MAGIC, VERSION, flags, self.node, count, self.seq, timestamp, key_seq,
+                                          len(changes), *(changed + changes + [time.time(), 0.0])))
+        else:
+            frame = packer.pack(MAGIC, VERSION, flags, self.node, count, self.seq, timestamp, key_seq, len(changes),
+                                *(changed + changes))
+        self.since_keyframe += 1
+        return frame
+
+    def _count(self, frame, full_size, start):
+        self.frames += 1
+        self.bytes += len(frame)
+        self.full_bytes += full_size
+        self.encode_time += clock() - start
+
+    def stats(self):
+        return {"frames": self.frames, "keyframes": self.keyframes, "bytes": self.bytes, "full_bytes": self.full_bytes,
+                "ratio": self.full_bytes / float(self.bytes) if self.bytes else 0.0,
+                "encode_us": self.encode_time / self.frames * 1e6 if self.frames else 0.0}
+
+    def report(self):
+        stats = self.stats()
+        return "Encoded %d frames (%d keyframes): %d bytes instead of %d (%.1fx smaller), %.1f us per frame" % (
+            stats["frames"], stats["keyframes"], stats["bytes"], stats["full_bytes"], stats["ratio"],
+            stats["encode_us"])
+
+    def stamp_send(self, frame):
+        """
+        Writes the send time into a frame of this encoder. Does nothing when trace isn't enabled.
+        :param frame: A frame returned by encode
+        :return: The frame
+        """
+        if self.trace:
+            struct.pack_into("<d", frame, len(frame) - 8, time.time())
+        return frame
+
+    def _struct(self, count):
+        # One precompiled struct per sensor count, so packing a frame is a single call
+        packer = self._structs.get(count)
+        if packer is None:
+            packer = struct.Struct("<2sBBHHId%dB%dH%s" % (status_size(count), count, "dd" if self.trace else ""))
+            self._structs[count] = packer
+        return packer
+
+    def _delta_struct(self, count, changes):
+        packer = self._structs.get((count, changes))
+        if packer is None:
+            packer = struct.Struct("<2sBBHHIdIH%dB%dh%s" % (status_size(count), changes, "dd" if self.trace else ""))
+            self._structs[(count, changes)] = packer
+        return packer
+
+
+def status_bytes(distances):
+    """
+    Packs the status bits of the distances, most significant bit first.
+    :return: A list of status_size(len(distances)) byte values
+    """
+    status = [0] * status_size(len(distances))
+    for index, distance in enumerate(distances):
+        if is_valid(distance):
+            status[index >> 3] |= 0x80 >> (index & 7)
+    return status
+
+
+def clamp_distances(distances):
+    """
+    Converts the distances to the values that are sent. Invalid measurements become 0.
+    """
+    return [min(int(distance), 0xFFFF) if is_valid(distance) else 0 for distance in distances]
+
+
+def encode_ascii(distances):
+    """
+    Encodes the distances in the old format: every value followed by a space, X for an invalid measurement.
+    """
+    string = ""
+    for distance in distances:
+        if is_valid(distance):
+            string += str(int(distance)) + " "
+        else:
+            string += "X "
+    return string.encode("ascii")
+
+
+def decode(data):
+    """
+    Decodes a received frame, binary or ASCII.
+    :param data: The received datagram
+    :return: A Frame. valid and distances are numpy arrays. For ASCII frames seq and timestamp are None.
+    """
+    if data[:2] == MAGIC:
+        return decode_binary(data)
+    return decode_ascii(data)
+
+
+def decode_all(data):
+    """
+    Decodes all frames of a datagram: one ASCII frame, or one or more binary frames after each other.
+    :param data: The received datagram
+    :return: A list of Frames
+    :raise ValueError: When the datagram isn't made of complete frames
+    """
+    if data[:2] != MAGIC:
+        return [decode_ascii(data)]
+    frames = []
+    offset = 0
+    while offset < len(data):
+        frame = decode_binary(data, offset)
+        frames.append(frame)
+        offset += frame_size(len(frame.distances), frame.flags)
+    return frames
+
+
+class FrameDecoder(object):
+    """
+    Decodes datagrams like decode_all, also the delta frames. Keeps the last keyframe of every node of every sender,
+    so two raspberry pis that send the same node id don't use each other's keyframes.
+    A delta frame of which the keyframe was lost can't be decoded, it is left out and counted as missing_keyframe.
+    """
+
+    def __init__(self):
+        self.keyframes = {}  # (sender address, node) -> (seq, distances)
+        # Counters
+        self.frames = 0
+        self.delta_frames = 0
+        self.missing_keyframe = 0
+        self.bytes = 0
+        self.full_bytes = 0  # The bytes full frames would have taken
+        self.decode_time = 0.0
+
+    def decode_all(self, data, address=None):
+        """
+        :param address: The address the datagram came from, the keyframes of every address are kept apart
+        :return: A list of Frames
+        :raise ValueError: When the datagram isn't made of complete frames
+        """
+        start = clock()
+        if data[:2] != MAGIC:
+            frames = [decode_ascii(data)]
+            self.full_bytes += len(data)
+        else:
+            frames = []
+            offset = 0
+            while offset < len(data):
+                if len(data) < offset + HEADER.size:
+                    raise ValueError("Frame is truncated")
+                _, _, flags, _, count, _, _ = HEADER.unpack_from(data, offset)
+                if flags & FLAG_DELTA:
+                    frame, size = self._decode_delta(data, offset, address)
+                else:
+                    frame = decode_binary(data, offset)
+                    size = frame_size(count, flags)
+                    self.keyframes[(address, frame.node)] = (frame.seq, frame.distances)
+                self.full_bytes += frame_size(count, flags & FLAG_TRACE)
+                if frame is not None:
+                    frames.append(frame)
+                offset += size
+        self.frames += len(frames)
+        self.bytes += len(data)
+        self.decode_time += clock() - start
+        return frames
+
+    def _decode_delta(self, data, offset, address):
+        """
+        :return: (the rebuilt Frame or None, the size of the delta frame)
+        """
+        magic, version, flags, node, count, seq, timestamp = HEADER.unpack_from(data, offset)
+        if version != VERSION:
+            raise ValueError("Unsupported frame version %d" % version)
+        if len(data) < offset + HEADER.size + DELTA.size:
+            raise ValueError("Frame is truncated")
+        key_seq, changes = DELTA.unpack_from(data, offset + HEADER.size)
+        size = frame_size(count, flags, changes)
+        if len(data) < offset + size:
+            raise ValueError("Frame is truncated")
+        changed_offset = offset + HEADER.size + DELTA.size
+        changed = np.unpackbits(np.frombuffer(data, dtype=np.uint8, count=status_size(count),
+                                              offset=changed_offset))[:count].astype(bool)
+        if np.count_nonzero(changed) != changes:
+            raise ValueError("Delta frame is corrupt")
+        change_offset = changed_offset + status_size(count)
+        keyframe = self.keyframes.get((address, node))
+        if keyframe is None or keyframe[0] != key_seq or len(keyframe[1]) != count:
+            self.missing_keyframe += 1
+            return None, size
+        self.delta_frames += 1
+        distances = keyframe[1].copy()
+        distances[changed] = (distances[changed] + np.frombuffer(data, dtype="<i2", count=changes,
+                                                                 offset=change_offset)).astype(np.uint16)
+        trace = None
+        if flags & FLAG_TRACE:
+            trace = TRACE.unpack_from(data, change_offset + 2 * changes)
+        return Frame(seq, timestamp, node, flags, distances > 0, distances, trace), size
+
+    def stats(self):
+        return {"decoded": self.frames, "delta_frames": self.delta_frames, "missing_keyframe": self.missing_keyframe,
+                "compression": self.full_bytes / float(self.bytes) if self.bytes else 0.0,
+                "decode_us": self.decode_time / self.frames * 1e6 if self.frames else 0.0}
+
+    def report(self):
+        stats = self.stats()
+        return "Decoded %d frames (%d delta frames, %d without keyframe): %.1fx smaller than full frames, " \
+               "%.1f us per frame" % (stats["decoded"], stats["delta_frames"], stats["missing_keyframe"],
+                                      stats["compression"], stats["decode_us"])
+
+
+def decode_binary(data, offset=0):
+    """
+    Decodes a binary frame without copying the distances.
+    :param data: The received datagram
+    :param offset: Where the frame starts in data
+    :return: A Frame. distances is a read-only view on data.
+    :raise ValueError: When data isn't a (complete) binary frame
+    """
+    if len(data) < offset + HEADER.size:
+        raise ValueError("Frame is truncated")
+    magic, version, flags, node, count, seq, timestamp = HEADER.unpack_from(data, offset)
+    if magic != MAGIC:
+        raise ValueError("Not a skin frame")
+    if version != VERSION:
+        raise ValueError("Unsupported frame version %d" % version)
+    if flags & FLAG_DELTA:
+        raise ValueError("Delta frames need a FrameDecoder")
+    status_offset = offset + HEADER.size
+    distance_offset = status_offset + status_size(count)
+    if len(data) < offset + frame_size(count, flags):
+        raise ValueError("Frame is truncated")
+    status = np.frombuffer(data, dtype=np.uint8, count=status_size(count), offset=status_offset)
+    valid = np.unpackbits(status)[:count].astype(bool)
+    distances = np.frombuffer(data, dtype="<u2", count=count, offset=distance_offset)
+    trace = None
+    if flags & FLAG_TRACE:
+        trace = TRACE.unpack_from(data, distance_offset + 2 * count)
+    return Frame(seq, timestamp, node, flags, valid, distances, trace)
+
+
+def decode_ascii(data):
+    """
+    Decodes a frame in the old ASCII format.
+    :param data: The received datagram
+    :return: A Frame without sequence number and timestamp
+    """
+    if not isinstance(data, str):
+        data = data.decode("ascii")
+    values = data.split()
+    valid = np.array([value.isdigit() for value in values], dtype=bool)
+    distances = np.array([int(value) if value.isdigit() else 0 for value in values], dtype=np.uint16)
+    return Frame(None, None, 0, 0, valid, distances, None)
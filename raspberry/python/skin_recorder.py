@@ -0,0 +1,285 @@
+"""
+This file contains the Recorder, that saves the measurements in binary files, and the functions to load them.
+
+A recording file starts with a header of HEADER_SIZE bytes, followed by fixed-width records (little endian):
+
+    field       type            meaning
+    timestamp   float64         the time of the measurement (seconds since epoch)
+    seq         uint32          the sequence number, increases by one for every record
+    distance    uint16 * n      the distance per sensor in mm, 0 for a failed measurement
+    status      uint8 * n       1 for a valid measurement, 0 for a failed one
+
+Because every record has the same size, the file can be loaded with numpy.memmap without parsing (load_recording),
+also when it is hours long. Failed measurements are kept with status 0, so nothing is dropped silently.
+
+Next to every recording a small index file (.idx) is written: the number of the first record of every
+INDEX_INTERVAL seconds. Recording.seek finds the record of a time with one lookup in the index and a short scan.
+
+The Recorder packs a record in the calling thread and gives it to a writer thread, that writes them in large blocks.
+So the measurement loop never waits for the SD card. The files are rotated after max_bytes or max_seconds.
+The recorder only needs the standard library, loading needs numpy.
+
+Usage:
+    recorder = Recorder("Output", nb_sensors)
+    recorder.record(distances)  # In the measurement loop
+    recorder.close()
+    ...
+    recording = Recording("Output_20180101-120000_000.skrec")
+    recording.records["distance"]  # Array with shape (records, sensors)
+"""
+import glob
+import os
+import struct
+import threading
+import time
+
+import skin_frame
+
+try:
+    import numpy as np
+except ImportError:  # Recording only needs the standard library
+    np = None
+
+MAGIC = b"SKINREC\0"
+VERSION = 1
+HEADER = struct.Struct("<8sHHIId")  # magic, version, header size, number of sensors, record size, created
+HEADER_SIZE = 64
+EXTENSION = ".skrec"
+
+INDEX_MAGIC = b"SKINIDX\0"
+INDEX_HEADER = struct.Struct("<8sdd")  # magic, time of the first record, interval
+INDEX_ENTRY = struct.Struct("<Q")
+INDEX_INTERVAL = 1.0  # s
+
+
+def record_struct(count):
+    """The struct of one record with count sensors."""
+    return struct.Struct("<dI%dH%dB" % (count, count))
+
+
+def record_dtype(count):
+    """The numpy dtype of one record with count sensors."""
+    return np.dtype([("timestamp", "<f8"), ("seq", "<u4"), ("distance", "<u2", (count,)),
+                     ("status", "u1", (count,))])
+
+
+class Recorder(object):
+    """Records measurements in rotating binary files, written by a background thread."""
+
+    def __init__(self, prefix, nb_sensors, max_bytes=256 << 20, max_seconds=3600, block_size=1 << 16,
+                 flush_interval=1.0):
+        """
+        :param prefix: The start of the file names, the start time and a part number are added
+        :param nb_sensors: The number of sensors per record
+        :param max_bytes: The size after which a new file is started, None for no limit
+        :param max_seconds: The time after which a new file is started, None for no limit
+        :param block_size: The writer thread writes when this many bytes are waiting
+        :param flush_interval: The writer thread also writes what is waiting after this time in seconds
+        """
+        self.prefix = prefix
+        self.nb_sensors = nb_sensors
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.block_size = block_size
+        self.flush_interval = flush_interval
+        self.struct = record_struct(nb_sensors)
+        self.seq = 0
+        self.records = 0  # The number of records that were written
+        self.files = []  # The files that were started
+        self.condition = threading.Condition()
+        self.pending = []  # (timestamp, packed record)
+        self.pending_bytes = 0
+        self.running = True
+        # The state of the current file, only used by the writer thread
+        self.file = None
+        self.index_file = None
+        self.file_records = 0
+        self.file_start = None
+        self.index_next = None
+        self.part = 0
+        self.name_time = time.strftime("%Y%m%d-%H%M%S")
+        self.writer = threading.Thread(target=self._run, name="skin-recorder")
+        self.writer.daemon = True
+        self.writer.start()
+
+    def record(self, distances, timestamp=None, seq=None):
+        """
+        Adds one record. Failed measurements (None or <= 0) are recorded with status 0.
+        :param distances: The distance per sensor
+        :param timestamp: The time of the measurement, defaults to now
+        :param seq: The sequence number, defaults to one more than the last one
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        if seq is None:
+            seq = self.seq
+        self.seq = (seq + 1) & 0xFFFFFFFF
+        status = [1 if skin_frame.is_valid(distance) else 0 for distance in distances]
+        data = self.struct.pack(timestamp, seq, *(skin_frame.clamp_distances(distances) + status))
+        with self.condition:
+            self.pending.append((timestamp, data))
+            self.pending_bytes += len(data)
+            if self.pending_bytes >= self.block_size:
+                self.condition.notify()
+
+    def close(self):
+        """Writes everything that is waiting and closes the files."""
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.writer.join()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                if self.running and self.pending_bytes < self.block_size:
+                    self.condition.wait(self.flush_interval)
+                pending = self.pending
+                self.pending = []
+                self.pending_bytes = 0
+                running = self.running
+            if pending:
+                self._write(pending)
+            if not running:
+                self._close_file()
+                return
+
+    def _write(self, pending):
+        start = 0
+        while start < len(pending):
+            if self.file is None or self._rotate_due(pending[start][0]):
+                self._open_file(pending[start][0])
+            # Everything until the next rotation goes in one write
+            end = start
+            size = self.file_records * self.struct.size
+            while end < len(pending):
+                if end > start and self._rotate_due(pending[end][0], size):
+                    break
+                self._index(pending[end][0])
+                size += self.struct.size
+                end += 1
+                self.file_records += 1
+            self.file.write(b"".join(data for _, data in pending[start:end]))
+            self.file.flush()
+            self.index_file.flush()
+            self.records += end - start
+            start = end
+
+    def _rotate_due(self, timestamp, size=None):
+        if size is None:
+            size = self.file_records * self.struct.size
+        if self.max_bytes is not None and self.file_records > 0 and HEADER_SIZE + size >= self.max_bytes:
+            return True
+        return self.max_seconds is not None and timestamp - self.file_start >= self.max_seconds
+
+    def _index(self, timestamp):
+        """Adds index entries for every interval up to timestamp, they point at the current record."""
+        while timestamp >= self.index_next:
+            self.index_file.write(INDEX_ENTRY.pack(self.file_records))
+            self.index_next += INDEX_INTERVAL
+
+    def _open_file(self, timestamp):
+        self._close_file()
+        path = "%s_%s_%03d%s" % (self.prefix, self.name_time, self.part, EXTENSION)
+        self.part += 1
+        self.file = open(path, "wb", self.block_size)
+        self.file.write(HEADER.pack(MAGIC, VERSION, HEADER_SIZE, self.nb_sensors, self.struct.size, timestamp)
+                        .ljust(HEADER_SIZE, b"\0"))
+        self.index_file = open(path + ".idx", "wb")
+        self.index_file.write(INDEX_HEADER.pack(INDEX_MAGIC, timestamp, INDEX_INTERVAL))
+        self.file_records = 0
+        self.file_start = timestamp
+        self.index_next = timestamp
+        self.files.append(path)
+
+    def _close_file(self):
+        if self.file is not None:
+            self.file.close()
+            self.index_file.close()
+            self.file = None
+            self.index_file = None
+
+
+def read_header(path):
+    """
+    :return: A dict with the version, number of sensors, record size and creation time of a recording
+    """
+    with open(path, "rb") as recording:
+        data = recording.read(HEADER_SIZE)
+    if len(data) < HEADER.size:
+        raise ValueError("%s is not a recording" % path)
+    magic, version, header_size, nb_sensors, record_size, created = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("%s is not a recording" % path)
+    if version != VERSION:
+        raise ValueError("Unsupported recording version %d" % version)
+    return {"version": version, "header_size": header_size, "nb_sensors": nb_sensors, "record_size": record_size,
+            "created": created}
+
+
+def load_recording(path):
+    """
+    Maps the records of a recording into memory, nothing is read until it is used.
+    A record that is only partly written (the recorder is still running) is left out.
+    :return: A numpy memmap with the record_dtype of the recording
+    """
+    header = read_header(path)
+    dtype = record_dtype(header["nb_sensors"])
+    count = (os.path.getsize(path) - header["header_size"]) // dtype.itemsize
+    if count <= 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=header["header_size"], shape=(count,))
+
+
+def find_recordings(prefix):
+    """
+    :return: The files of a recording with this prefix, in the order they were written
+    """
+    return sorted(glob.glob(prefix + "_*" + EXTENSION))
+
+
+class Recording(object):
+    """One recording file with its index."""
+
+    def __init__(self, path):
+        self.path = path
+        self.header = read_header(path)
+        self.records = load_recording(path)
+        self.index = None
+        self.index_start = None
+        self.index_interval = None
+        if os.path.exists(path + ".idx"):
+            with open(path + ".idx", "rb") as index_file:
+                data = index_file.read()
+            magic, self.index_start, self.index_interval = INDEX_HEADER.unpack_from(data)
+            if magic == INDEX_MAGIC:
+                self.index = np.frombuffer(data, dtype="<u8", offset=INDEX_HEADER.size)
+
+    def __len__(self):
+        return len(self.records)
+
+    def seek(self, timestamp):
+        """
+        :return: The number of the first record at or after timestamp (len(self) if there is none)
+        """
+        start, end = 0, len(self.records)
+        if self.index is not None and len(self.index) > 0:
+            bucket = int((timestamp - self.index_start) // self.index_interval)
+            if bucket >= len(self.index):
+                start = int(self.index[-1])
+            elif bucket >= 0:
+                start = int(self.index[bucket])
+                if bucket + 1 < len(self.index):
+                    end = int(self.index[bucket + 1])
+            else:
+                end = 0
+        # The index points at the first record of the interval, search the records of that interval only
+        start = min(start, len(self.records))
+        end = min(max(end, start), len(self.records))
+        return start + int(np.searchsorted(self.records["timestamp"][start:end], timestamp))
+
+    def between(self, start, end):
+        """
+        :return: The records from start up to end (times in seconds since epoch), a view on the file
+        """
+        return self.records[self.seek(start):self.seek(end)]